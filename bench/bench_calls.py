@@ -0,0 +1,62 @@
+"""Latency of the small read calls, where the ownership check weighs the most.
+
+python -m bench.bench_calls
+"""
+
+from psycopg import Cursor
+
+from bench.common import bench_owner, timed, wide_tree
+from closure.closure import (
+    clsr_select_children,
+    clsr_select_children_page,
+    clsr_select_children_json,
+    clsr_select_children_wpath,
+    clsr_select_descendants,
+    clsr_select_descendants_page,
+    clsr_select_subtree_json,
+    iter_descendants,
+)
+from closure.db import bootstrap
+
+
+def run(cur: Cursor, repeat: int):
+
+    owner = bench_owner(cur)
+    # node 1 has 20 children, node 21 has 20 leaves below it
+    ids = wide_tree(cur, owner, 10_000, fanout=20)
+    cur.execute("ANALYZE inode; ANALYZE link;")
+    parent, small, leaf = ids[1], ids[21], ids[-1]
+
+    calls = {
+        "children": lambda: clsr_select_children(cur, owner, parent),
+        "children leaf": lambda: clsr_select_children(cur, owner, leaf),
+        "child page": lambda: clsr_select_children_page(cur, owner, parent, limit=5),
+        "children path": lambda: clsr_select_children_wpath(cur, owner, parent),
+        "children json": lambda: clsr_select_children_json(cur, owner, parent),
+        "descendants": lambda: clsr_select_descendants(cur, owner, small),
+        "descendant page": lambda: clsr_select_descendants_page(
+            cur, owner, small, limit=5
+        ),
+        "subtree json": lambda: clsr_select_subtree_json(cur, owner, small),
+        "iter descendants": lambda: list(iter_descendants(cur, owner, small)),
+        "child byname": lambda: cur.execute(
+            "SELECT * FROM select_child_byname(%s, %s, %s)", (parent, owner, "NODE25")
+        ).fetchall(),
+    }
+    for name, fn in calls.items():
+        print(f"{name:>18} {timed(fn, repeat):>10.3f}")
+
+
+def main():
+
+    with bootstrap() as conn:
+        cur = conn.cursor()
+
+        print("times in ms (best of N)")
+        run(cur, repeat=200)
+
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Node counts read from the kept counters against COUNT(*) over the tree.
+
+python -m bench.bench_counts
+"""
+
+from itertools import count
+
+from psycopg import Cursor
+
+from bench.common import bench_owner, make_node, timed, wide_tree
+from closure.closure import clsr_insert, clsr_len, clsr_select_counts
+from closure.db import bootstrap
+
+COUNT_OWNER = "SELECT count(*) FROM inode WHERE owner = %s AND trashed IS NULL"
+
+COUNT_SUBTREE = """
+    SELECT count(*) FROM link t JOIN inode n ON (n.owner = t.owner AND n.id = t.child)
+        WHERE t.owner = %s AND t.parent = %s AND t.depth > 0 AND n.trashed IS NULL
+"""
+
+
+def run(cur: Cursor, size: int, repeat: int):
+
+    owner = bench_owner(cur)
+    ids = wide_tree(cur, owner, size, fanout=20)
+    cur.execute("ANALYZE inode; ANALYZE link;")
+    root, leaf = ids[0], ids[-1]
+    names = count()
+
+    times = [
+        timed(lambda: clsr_len(cur, owner), repeat),
+        timed(lambda: cur.execute(COUNT_OWNER, (owner,)).fetchone(), repeat),
+        timed(lambda: clsr_select_counts(cur, owner, root), repeat),
+        timed(lambda: cur.execute(COUNT_SUBTREE, (owner, root)).fetchone(), repeat),
+        # the write side: every ancestor of the new leaf gets its counter moved
+        timed(lambda: clsr_insert(cur, owner, leaf, make_node(next(names))), repeat),
+    ]
+    print(f"{size:>7}", *(f"{t:>12.3f}" for t in times))
+
+
+def main():
+
+    with bootstrap() as conn:
+        cur = conn.cursor()
+
+        print("times in ms (best of N)")
+        print(
+            f"{'nodes':>7} {'len':>12} {'count(*)':>12} {'subtree':>12}"
+            f" {'count(*)':>12} {'insert':>12}"
+        )
+        for size, repeat in ((1_000, 50), (10_000, 20), (100_000, 5)):
+            run(cur, size, repeat)
+
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
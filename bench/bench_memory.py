@@ -0,0 +1,62 @@
+"""The same calls on Postgres and on the in-memory tree of closure/memory.py.
+
+python -m bench.bench_memory
+"""
+
+from types import ModuleType
+from typing import Any
+
+from bench.common import bench_owner, make_node, timed
+from closure import closure, memory
+from closure.db import bootstrap
+
+
+def run(api: ModuleType, cur: Any, owner: Any, size: int, repeat: int) -> list[float]:
+
+    # node i hangs from node (i - 1) // 20, as wide_tree builds it
+    inodes = [make_node(i) for i in range(size)]
+    parents = [None] + [(i - 1) // 20 for i in range(1, size)]
+    ids: list[Any] = []
+    times = [
+        timed(
+            lambda: ids.extend(api.clsr_insert_many(cur, owner, None, inodes, parents)),
+            1,
+        )
+    ]
+    if api is closure:
+        cur.execute("ANALYZE inode; ANALYZE link;")
+    parent, leaf = ids[1], ids[-1]
+
+    times += [
+        timed(lambda: api.clsr_select_children(cur, owner, parent), repeat),
+        timed(lambda: api.clsr_select_descendants(cur, owner, parent), repeat),
+        timed(lambda: api.clsr_get_path(cur, owner, leaf), repeat),
+        timed(lambda: api.clsr_select_counts(cur, owner, ids[0]), repeat),
+    ]
+    return times
+
+
+def main():
+
+    with bootstrap() as conn:
+        cur = conn.cursor()
+
+        print("times in ms (best of N), insert_many run once")
+        print(
+            f"{'nodes':>7} {'backend':>9} {'insert':>10} {'children':>10}"
+            f" {'subtree':>10} {'path':>10} {'counts':>10}"
+        )
+        for size, repeat in ((1_000, 50), (10_000, 20), (100_000, 5)):
+            tree = memory.MemoryTree()
+            for name, api, c, owner in (
+                ("postgres", closure, cur, bench_owner(cur)),
+                ("memory", memory, tree, tree.add_owner()),
+            ):
+                times = run(api, c, owner, size, repeat)
+                print(f"{size:>7} {name:>9}", *(f"{t:>10.3f}" for t in times))
+
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Moving a whole subtree between two parents with clsr_move.
+
+python -m bench.bench_move
+"""
+
+from time import perf_counter
+
+from psycopg import Cursor
+
+from bench.common import bench_owner, make_node, wide_tree
+from closure.closure import clsr_insert, clsr_move
+from closure.db import bootstrap
+
+
+def run(cur: Cursor, size: int, fanout: int, repeat: int):
+
+    owner = bench_owner(cur)
+    (left,) = clsr_insert(cur, owner, None, make_node(0, "LEFT"))
+    (right,) = clsr_insert(cur, owner, None, make_node(0, "RIGHT"))
+    ids = wide_tree(cur, owner, size, fanout)
+    cur.execute("ANALYZE inode; ANALYZE link;")
+
+    best = float("inf")
+    for i in range(repeat):
+        start = perf_counter()
+        clsr_move(cur, owner, ids[0], left if i % 2 == 0 else right)
+        best = min(best, perf_counter() - start)
+
+    # a move deep inside the subtree, touching only a few rows
+    start = perf_counter()
+    clsr_move(cur, owner, ids[-1], ids[1])
+    leaf = perf_counter() - start
+
+    print(f"{size:>7} {best * 1000:>12.1f} {size / best:>12.0f} {leaf * 1000:>12.3f}")
+
+
+def main():
+
+    with bootstrap() as conn:
+        cur = conn.cursor()
+
+        print("times in ms (best of N)")
+        print(f"{'nodes':>7} {'move':>12} {'nodes/s':>12} {'leaf move':>12}")
+        for size, repeat in ((1_000, 10), (10_000, 5), (100_000, 3)):
+            run(cur, size, fanout=20, repeat=repeat)
+
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
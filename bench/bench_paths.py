@@ -0,0 +1,80 @@
+"""Stored inode.path against rebuilding paths from link rows on read.
+
+python -m bench.bench_paths
+"""
+
+from psycopg import Cursor
+
+from bench.common import bench_owner, comb_tree, timed
+from closure.closure import clsr_get_path, clsr_select_descendants_wpath
+from closure.db import bootstrap
+
+# the read path used before inode.path existed
+REBUILD_PATH = """
+    SELECT string_agg(n.name, '.' ORDER BY t.depth DESC) AS path FROM inode n
+    JOIN link t ON t.parent = n.id
+    WHERE t.child = %s
+"""
+
+REBUILD_DESCENDANTS_PATH = """
+    WITH child_ids AS (
+        SELECT t.child FROM inode n
+        JOIN link t ON n.id = t.child
+        WHERE t.parent = %(id)s AND t.depth > 0 AND n.owner = %(owner)s
+    ), child_ids_names AS (
+        SELECT n.name, t.child FROM inode n
+        JOIN link t ON t.parent = n.id
+        WHERE t.child IN (SELECT child FROM child_ids)
+        ORDER BY t.child, t.depth DESC
+    ), paths AS (
+        SELECT c.child, string_agg(c.name, '.') AS path FROM child_ids_names c
+        GROUP BY c.child
+    )
+    SELECT l.parent, n.id, n.name, p.path, n.template, n.node_type FROM paths p
+    JOIN inode n ON p.child = n.id
+    JOIN link l ON p.child = l.child
+    WHERE l.depth = 1
+"""
+
+
+def run(cur: Cursor, depth: int, fanout: int):
+
+    owner = bench_owner(cur)
+    ids = comb_tree(cur, owner, depth, fanout)
+    root, leaf = ids[0], ids[-1]
+    cur.execute("ANALYZE inode; ANALYZE link;")
+
+    def rebuild_path():
+        cur.execute(REBUILD_PATH, (leaf,))
+        cur.fetchone()
+
+    def rebuild_descendants():
+        cur.execute(REBUILD_DESCENDANTS_PATH, {"id": root, "owner": owner})
+        cur.fetchall()
+
+    print(
+        f"{depth:>6} {len(ids):>7}"
+        f" {timed(rebuild_path):>12.3f} {timed(lambda: clsr_get_path(cur, owner, leaf)):>12.3f}"
+        f" {timed(rebuild_descendants, 5):>12.3f}"
+        f" {timed(lambda: clsr_select_descendants_wpath(cur, owner, root), 5):>12.3f}"
+    )
+
+
+def main():
+
+    with bootstrap() as conn:
+        cur = conn.cursor()
+
+        print("times in ms (best of N)")
+        print(
+            f"{'depth':>6} {'nodes':>7} {'path rebuilt':>12} {'path stored':>12}"
+            f" {'desc rebuilt':>12} {'desc stored':>12}"
+        )
+        for depth in (10, 50, 200):
+            run(cur, depth, fanout=20)
+
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
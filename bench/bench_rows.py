@@ -0,0 +1,72 @@
+"""Decoding a 100k-node subtree: composite records and pydantic against typed rows.
+
+python -m bench.bench_rows
+"""
+
+from time import perf_counter
+from uuid import UUID
+
+from psycopg import Cursor
+
+from bench.common import bench_owner, wide_tree
+from closure.closure import (
+    Inode,
+    clsr_select_descendants,
+    iter_descendants,
+    to_inode,
+)
+from closure.db import bootstrap
+
+
+def composite_pydantic(cur: Cursor, owner: UUID, id: UUID) -> int:
+    "the read path before typed rows: one record per row, one model per record"
+    cur.execute("SELECT select_descendants(%s, %s);", (id, owner))
+    nodes = [
+        Inode(id=r[1], name=r[2], template=r[3], node_type=r[4])
+        for (r,) in cur.fetchall()
+    ]
+    return len(nodes)
+
+
+def typed(cur: Cursor, owner: UUID, id: UUID) -> int:
+    return len(clsr_select_descendants(cur, owner, id))
+
+
+def typed_pydantic(cur: Cursor, owner: UUID, id: UUID) -> int:
+    return len([to_inode(row) for row in clsr_select_descendants(cur, owner, id)])
+
+
+def streamed(cur: Cursor, owner: UUID, id: UUID) -> int:
+    return sum(1 for _ in iter_descendants(cur, owner, id, batch_size=5000))
+
+
+def run(cur: Cursor, size: int, repeat: int):
+
+    owner = bench_owner(cur)
+    ids = wide_tree(cur, owner, size, fanout=20)
+    cur.execute("ANALYZE inode; ANALYZE link;")
+
+    for fn in (composite_pydantic, typed, typed_pydantic, streamed):
+        best = float("inf")
+        for _ in range(repeat):
+            start = perf_counter()
+            rows = fn(cur, owner, ids[0])
+            best = min(best, perf_counter() - start)
+        print(f"{size:>7} {fn.__name__:>20} {best * 1000:>10.1f} {rows / best:>12.0f}")
+
+
+def main():
+
+    with bootstrap() as conn:
+        cur = conn.cursor()
+
+        print("times in ms (best of N)")
+        print(f"{'nodes':>7} {'decoding':>20} {'ms':>10} {'rows/s':>12}")
+        for size, repeat in ((10_000, 5), (100_000, 3)):
+            run(cur, size, repeat)
+
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Latency of one tenant while the number of tenants grows.
+
+Runs on the schema loaded, closure_tables.sql or closure_tables_partitioned.sql,
+see load_schema of closure/db.py.
+
+python -m bench.bench_tenants
+"""
+
+from uuid import UUID
+
+from psycopg import Cursor
+
+from bench.common import bench_owner, timed, wide_tree
+from closure.closure import (
+    clsr_get_path,
+    clsr_move,
+    clsr_select_byid,
+    clsr_select_children,
+    clsr_select_descendants,
+)
+from closure.db import bootstrap
+
+
+def add_tenant(cur: Cursor, size: int) -> tuple[UUID, list[UUID]]:
+    owner = bench_owner(cur)
+    return owner, wide_tree(cur, owner, size, fanout=20)
+
+
+def run(cur: Cursor, tenants: int, owner: UUID, ids: list[UUID], repeat: int):
+
+    cur.execute("ANALYZE inode; ANALYZE link;")
+
+    leaf, other = ids[-1], ids[-2]
+    times = [
+        timed(lambda: clsr_select_byid(cur, owner, leaf), repeat),
+        timed(lambda: clsr_get_path(cur, owner, leaf), repeat),
+        timed(lambda: clsr_select_children(cur, owner, ids[1]), repeat),
+        timed(lambda: clsr_select_descendants(cur, owner, ids[0]), repeat),
+        timed(lambda: clsr_move(cur, owner, leaf, other), repeat),
+    ]
+    print(f"{tenants:>8}", *(f"{t:>12.3f}" for t in times))
+
+
+def main():
+
+    with bootstrap() as conn:
+        cur = conn.cursor()
+
+        cur.execute("SELECT relkind FROM pg_class WHERE relname = 'inode'")
+        (kind,) = cur.fetchone()  # type: ignore
+        print("partitioned by owner" if kind == "p" else "single inode and link")
+
+        size = 2_000
+        # the tenant measured, the others are only there to grow the tables
+        owner, ids = add_tenant(cur, size)
+        tenants = 1
+
+        print(f"times in ms (best of N), {size} nodes per tenant")
+        print(
+            f"{'tenants':>8} {'byid':>12} {'get_path':>12} {'children':>12}"
+            f" {'descendants':>12} {'leaf move':>12}"
+        )
+        for target in (1, 10, 100, 500):
+            while tenants < target:
+                add_tenant(cur, size)
+                tenants += 1
+            run(cur, tenants, owner, ids, repeat=50)
+
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
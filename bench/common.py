@@ -0,0 +1,46 @@
+from collections.abc import Callable
+from time import perf_counter
+from typing import Any
+from uuid import UUID
+
+from psycopg import Cursor
+
+from closure.closure import Inode, clsr_insert_many
+
+
+def bench_owner(cur: Cursor) -> UUID:
+    cur.execute(
+        "INSERT INTO users (name) VALUES ('bench-' || gen_random_uuid()) RETURNING id;"
+    )
+    return cur.fetchone()[0]  # type: ignore
+
+
+def make_node(i: int, name: str = "NODE") -> Inode:
+    return Inode(id=None, name=f"{name}{i}", template=None, node_type="node")
+
+
+def comb_tree(cur: Cursor, owner: UUID, depth: int, fanout: int) -> list[UUID]:
+    "A spine of depth nodes, each one with fanout leaves. Spine ids come first."
+    inodes = [make_node(i, "SPINE") for i in range(depth)]
+    parents: list[int | None] = [None] + list(range(depth - 1))
+    for i in range(depth):
+        inodes += [make_node(j, "LEAF") for j in range(fanout)]
+        parents += [i] * fanout
+    return clsr_insert_many(cur, owner, None, inodes, parents)
+
+
+def wide_tree(cur: Cursor, owner: UUID, size: int, fanout: int) -> list[UUID]:
+    "A tree of size nodes where node i hangs from node (i - 1) // fanout."
+    inodes = [make_node(i) for i in range(size)]
+    parents: list[int | None] = [None] + [(i - 1) // fanout for i in range(1, size)]
+    return clsr_insert_many(cur, owner, None, inodes, parents)
+
+
+def timed(fn: Callable[[], Any], repeat: int = 20) -> float:
+    "Best wall time of fn in milliseconds"
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        best = min(best, perf_counter() - start)
+    return best * 1000
@@ -0,0 +1,387 @@
+from collections.abc import AsyncGenerator, Sequence
+from contextlib import nullcontext
+from typing import Any, Literal
+from uuid import UUID, uuid4
+
+from psycopg import AsyncConnection, AsyncCursor
+from psycopg.rows import args_row
+
+from closure import queries
+from closure.closure import (
+    DescendantPathRow,
+    DescendantRow,
+    IdNotFoundError,
+    Inode,
+    InodeRow,
+    InodeTree,
+    NodeCounts,
+    NodeType,
+    Page,
+    PathRow,
+    Row,
+    child_page,
+    decode_after,
+    descendant_page,
+    flatten_trees,
+    ids_found,
+    insert_many_params,
+    iter_descendants_query,
+    map_errors,
+    paths_found,
+    pattern_to_regex,
+    rows_as,
+)
+
+# the clsr_* functions of closure.py on an AsyncCursor, same SQL and results
+
+
+async def stream(
+    cur: AsyncCursor,
+    query: str,
+    params: Sequence[Any] | dict[str, Any],
+    batch_size: int,
+    row_type: type[Row] | None = None,
+) -> AsyncGenerator[Any, None]:
+    "Yields rows from a server side cursor, fetching batch_size rows at a time"
+    conn = cur.connection
+    # a server side cursor lives inside a transaction block
+    async with conn.transaction() if conn.autocommit else nullcontext():
+        async with conn.cursor(name=f"clsr_{uuid4().hex}") as named:
+            if row_type is not None:
+                named.row_factory = args_row(row_type)
+            named.itersize = batch_size
+            await named.execute(query, params)
+            async for row in named:
+                yield row
+
+
+async def clsr_len(cur: AsyncCursor, owner: UUID) -> Any:
+    await cur.execute(queries.LEN, (owner,))
+    return await cur.fetchone()
+
+
+async def clsr_count_types(cur: AsyncCursor, owner: UUID) -> dict[NodeType, int]:
+    await cur.execute(queries.COUNT_TYPES, (owner,))
+    return dict(await cur.fetchall())
+
+
+async def clsr_select_counts(cur: AsyncCursor, owner: UUID, id: UUID) -> NodeCounts:
+    with rows_as(cur, NodeCounts) as typed:
+        await typed.execute(queries.SELECT_COUNTS, (id, owner))
+        row = await typed.fetchone()
+    if row is None:
+        raise IdNotFoundError(f"Id {id} not found for owner {owner}")
+    return row
+
+
+async def clsr_recount(cur: AsyncCursor, owner: UUID) -> int:
+    await cur.execute(queries.RECOUNT, (owner,))
+    (wrong,) = await cur.fetchone()  # type: ignore
+    return wrong
+
+
+async def clsr_insert(
+    cur: AsyncCursor, owner: UUID, parent: UUID | None, inode: Inode
+) -> Any:
+    with map_errors():
+        await cur.execute(
+            queries.INSERT,
+            (inode.name, owner, inode.node_type, inode.template, parent),
+        )
+    return await cur.fetchone()
+
+
+async def clsr_insert_many(
+    cur: AsyncCursor,
+    owner: UUID,
+    parent: UUID | None,
+    inodes: Sequence[Inode],
+    parents: Sequence[int | None],
+) -> list[UUID]:
+    "parents[i] is the index of a previous entry in inodes, or None to attach to parent"
+    with map_errors():
+        await cur.execute(
+            queries.INSERT_MANY, insert_many_params(owner, parent, inodes, parents)
+        )
+    return [row[0] for row in await cur.fetchall()]
+
+
+async def clsr_insert_subtree(
+    cur: AsyncCursor, owner: UUID, parent: UUID | None, trees: Sequence[InodeTree]
+) -> list[UUID]:
+    "trees are (inode, children) pairs; ids are returned in depth-first order"
+    return await clsr_insert_many(cur, owner, parent, *flatten_trees(trees))
+
+
+async def clsr_select_roots(cur: AsyncCursor, owner: UUID) -> list[InodeRow]:
+    with rows_as(cur, InodeRow) as typed:
+        await typed.execute(queries.SELECT_ROOTS, (owner,))
+        return await typed.fetchall()
+
+
+async def clsr_select_root_byid(
+    cur: AsyncCursor, owner: UUID, id: UUID
+) -> InodeRow | None:
+    with rows_as(cur, InodeRow) as typed:
+        await typed.execute(queries.SELECT_ROOT_BYID, (id, owner))
+        return await typed.fetchone()
+
+
+async def clsr_get_path(cur: AsyncCursor, owner: UUID, id: UUID) -> Any:
+    await cur.execute(queries.GET_PATH, (id, owner))
+    return await cur.fetchone()
+
+
+async def clsr_get_paths(
+    cur: AsyncCursor, owner: UUID, ids: Sequence[UUID]
+) -> dict[UUID, str | IdNotFoundError]:
+    "The path of each of ids, in one query"
+    await cur.execute(queries.GET_PATHS, (list(ids), owner))
+    return ids_found(owner, ids, dict(await cur.fetchall()))
+
+
+async def clsr_select_bypath(
+    cur: AsyncCursor, owner: UUID, root: str, names: list[str]
+) -> InodeRow:
+    with rows_as(cur, InodeRow) as typed:
+        await typed.execute(queries.SELECT_BYPATH, (owner, root, names))
+        row = await typed.fetchone()
+    if row is None:
+        raise IdNotFoundError(f"Error on select by path. Root {root}, Names {names}")
+    return row
+
+
+async def clsr_select_bypaths(
+    cur: AsyncCursor, owner: UUID, paths: Sequence[str]
+) -> dict[str, UUID | IdNotFoundError]:
+    "paths are dotted, as returned by clsr_get_path"
+    await cur.execute(queries.SELECT_BYPATHS, (owner, list(paths)))
+    return paths_found(owner, await cur.fetchall())
+
+
+async def clsr_select_bypattern(
+    cur: AsyncCursor, owner: UUID, pattern: str, batch_size: int = 1000
+) -> AsyncGenerator[Any, None]:
+    "Matches are streamed in path order, see pattern_to_regex for the syntax"
+    prefix, regex, min_depth, max_depth = pattern_to_regex(pattern)
+    async for row in stream(
+        cur,
+        queries.SELECT_BYPATTERN,
+        (owner, prefix, regex, min_depth, max_depth),
+        batch_size,
+        PathRow,
+    ):
+        yield row
+
+
+async def clsr_select_byid(cur: AsyncCursor, owner: UUID, id: UUID) -> InodeRow:
+    with rows_as(cur, InodeRow) as typed:
+        await typed.execute(queries.SELECT_BYID, (id, owner))
+        row = await typed.fetchone()
+    if row is None:
+        raise IdNotFoundError(f"Id {id} not found for owner {owner}")
+    return row
+
+
+async def clsr_select_byids(
+    cur: AsyncCursor, owner: UUID, ids: Sequence[UUID]
+) -> dict[UUID, InodeRow | IdNotFoundError]:
+    "The row of each of ids, in one query"
+    with rows_as(cur, InodeRow) as typed:
+        await typed.execute(queries.SELECT_BYIDS, (list(ids), owner))
+        rows = await typed.fetchall()
+    return ids_found(owner, ids, {row.id: row for row in rows})
+
+
+async def clsr_select_children(
+    cur: AsyncCursor, owner: UUID, id: UUID
+) -> list[InodeRow]:
+    with rows_as(cur, InodeRow) as typed:
+        await typed.execute(queries.SELECT_CHILDREN, (id, owner))
+        return await typed.fetchall()
+
+
+async def clsr_select_children_page(
+    cur: AsyncCursor,
+    owner: UUID,
+    id: UUID,
+    after: str | None = None,
+    limit: int | None = None,
+) -> Page:
+    "A Page of the children in path order, after the token of the previous one"
+    path, after_id = decode_after(after, 2)
+    await cur.execute(queries.SELECT_CHILD_PAGE, (id, owner, path, after_id, limit))
+    return child_page(await cur.fetchall(), limit)
+
+
+async def clsr_select_descendants(
+    cur: AsyncCursor, owner: UUID, id: UUID
+) -> list[DescendantRow]:
+    with rows_as(cur, DescendantRow) as typed:
+        await typed.execute(queries.SELECT_DESCENDANTS, (id, owner))
+        return await typed.fetchall()
+
+
+async def clsr_select_descendants_page(
+    cur: AsyncCursor,
+    owner: UUID,
+    id: UUID,
+    after: str | None = None,
+    limit: int | None = None,
+) -> Page:
+    "A Page of the descendants in (depth, path) order, see clsr_select_children_page"
+    depth, path, after_id = decode_after(after, 3)
+    await cur.execute(
+        queries.SELECT_DESCENDANTS_PAGE, (id, owner, depth, path, after_id, limit)
+    )
+    return descendant_page(await cur.fetchall(), limit)
+
+
+async def clsr_select_children_wpath(
+    cur: AsyncCursor, owner: UUID, id: UUID
+) -> list[PathRow]:
+    with rows_as(cur, PathRow) as typed:
+        await typed.execute(queries.SELECT_CHILDREN_WPATH, (id, owner))
+        return await typed.fetchall()
+
+
+async def clsr_select_descendants_wpath(
+    cur: AsyncCursor, owner: UUID, id: UUID
+) -> list[DescendantPathRow]:
+    with rows_as(cur, DescendantPathRow) as typed:
+        await typed.execute(queries.SELECT_DESCENDANTS_WPATH, (id, owner))
+        return await typed.fetchall()
+
+
+async def clsr_select_children_json(cur: AsyncCursor, owner: UUID, id: UUID) -> Any:
+    await cur.execute(queries.SELECT_CHILDREN_JSON, (id, owner))
+    return await cur.fetchone()
+
+
+async def clsr_select_descendants_json(cur: AsyncCursor, owner: UUID, id: UUID) -> Any:
+    await cur.execute(queries.SELECT_DESCENDANTS_JSON, (id, owner))
+    return await cur.fetchone()
+
+
+async def clsr_select_subtree_json(
+    cur: AsyncCursor,
+    owner: UUID,
+    id: UUID,
+    max_depth: int | None = None,
+    with_items: bool = False,
+) -> Any:
+    "id with nested children lists down to max_depth levels below it"
+    if max_depth is not None and max_depth < 0:
+        raise ValueError(f"max_depth {max_depth} is negative")
+    await cur.execute(queries.SELECT_SUBTREE_JSON, (id, owner, max_depth, with_items))
+    return await cur.fetchone()
+
+
+async def iter_descendants(
+    cur: AsyncCursor,
+    owner: UUID,
+    id: UUID,
+    order: Literal["depth", "path"] = "depth",
+    batch_size: int = 1000,
+    with_path: bool = False,
+) -> AsyncGenerator[Any, None]:
+    "Streams (parent, id, name, [path,] template, node_type) rows of the subtree"
+    found = False
+    async for row in stream(
+        cur,
+        iter_descendants_query(order, with_path),
+        {"id": id, "owner": owner},
+        batch_size,
+        DescendantPathRow if with_path else DescendantRow,
+    ):
+        found = True
+        yield row
+    # a leaf, or an id missing or not of owner
+    if not found:
+        await cur.execute(queries.IS_OWNER, (id, owner))
+
+
+async def iter_descendants_wpath(
+    cur: AsyncCursor,
+    owner: UUID,
+    id: UUID,
+    order: Literal["depth", "path"] = "depth",
+    batch_size: int = 1000,
+) -> AsyncGenerator[Any, None]:
+    async for row in iter_descendants(
+        cur, owner, id, order, batch_size, with_path=True
+    ):
+        yield row
+
+
+async def clsr_rename(cur: AsyncCursor, owner: UUID, id: UUID, name: str) -> Any:
+
+    with map_errors():
+        await cur.execute(queries.RENAME, (id, owner, name))
+    return await cur.fetchone()
+
+
+async def clsr_move(
+    cur: AsyncCursor, owner: UUID, id: UUID, parent: UUID | None
+) -> Any:
+
+    with map_errors():
+        await cur.execute(queries.MOVE, (id, owner, parent))
+    return await cur.fetchone()
+
+
+async def clsr_delete_node(cur: AsyncCursor, owner: UUID, id: UUID) -> Any:
+
+    # children are promoted and may clash with a sibling of the deleted node
+    with map_errors():
+        await cur.execute(queries.DELETE_NODE, (id, owner))
+
+    return await cur.fetchone()
+
+
+async def clsr_delete_descendants(cur: AsyncCursor, owner: UUID, id: UUID) -> Any:
+
+    await cur.execute(queries.DELETE_DESCENDANTS, (id, owner))
+
+    return await cur.fetchone()
+
+
+async def clsr_delete_many(
+    cur: AsyncCursor, owner: UUID, ids: Sequence[UUID]
+) -> dict[UUID, int]:
+    "Delete the subtrees of ids, counting each node once for its closest listed id"
+
+    await cur.execute(queries.DELETE_MANY, (owner, list(ids)))
+
+    return dict(await cur.fetchall())
+
+
+async def clsr_trash_descendants(cur: AsyncCursor, owner: UUID, id: UUID) -> Any:
+    "Hide the subtree of id until clsr_restore or clsr_purge"
+
+    await cur.execute(queries.TRASH_DESCENDANTS, (id, owner))
+
+    return await cur.fetchone()
+
+
+async def clsr_restore(cur: AsyncCursor, owner: UUID, id: UUID) -> Any:
+
+    # the name of the subtree root may have been reused meanwhile
+    with map_errors():
+        await cur.execute(queries.RESTORE, (id, owner))
+
+    return await cur.fetchone()
+
+
+async def clsr_purge(conn: AsyncConnection, chunk: int = 1000) -> int:
+    "Delete trashed rows chunk at a time, committing after each chunk"
+
+    total = 0
+    async with conn.cursor() as cur:
+        while True:
+            await cur.execute(queries.PURGE, (chunk,))
+            (deleted,) = await cur.fetchone()  # type: ignore
+            await conn.commit()
+            total += deleted
+            if deleted < chunk:
+                return total
@@ -0,0 +1,16 @@
+from typing import Any
+from uuid import UUID
+
+from psycopg import AsyncCursor
+
+from closure import queries
+from closure.template import Template
+
+# the tmplt_* functions of template.py on an AsyncCursor
+
+
+async def tmplt_insert_template(
+    cur: AsyncCursor, owner: UUID, template: Template
+) -> Any:
+    await cur.execute(queries.ADD_TEMPLATE, (template.name, template.owner))
+    return await cur.fetchone()
@@ -0,0 +1,205 @@
+import json
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from threading import Lock
+from time import monotonic
+from typing import Any, NamedTuple
+from uuid import UUID
+
+from psycopg import Connection, Cursor
+
+from closure.closure import (
+    InodeRow,
+    clsr_get_path,
+    clsr_select_byid,
+    clsr_select_bypath,
+)
+
+# see notify_inode_changes in closure_common.sql
+CHANNEL = "inode_changes"
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    size: int
+
+
+class TreeCache:
+    """
+    Read-through cache of clsr_select_byid, clsr_get_path and clsr_select_bypath.
+    Entries live at most ttl seconds and the least recently used go past maxsize.
+    Writes are seen once committed and their notification handled, see listen
+    and watch; ttl bounds how stale an entry gets if one is missed.
+    Missing nodes are not cached, nor what was read before an invalidation of its
+    owner that came in while the read ran. Any change of an owner drops its
+    clsr_select_bypath entries, an insert or restore may change what a path finds.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: float = 60.0,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = Lock()
+        # key -> (expires, owner, id the entry depends on, value)
+        self.entries: OrderedDict[Hashable, tuple[float, UUID, UUID, Any]] = (
+            OrderedDict()
+        )
+        # (owner, id) -> keys, and owner -> keys, to invalidate
+        self.by_id: dict[tuple[UUID, UUID], set[Hashable]] = {}
+        self.by_owner: dict[UUID, set[Hashable]] = {}
+        # owner -> invalidations handled, and how many clears, see generation
+        self.generations: dict[UUID, int] = {}
+        self.clears = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self) -> CacheStats:
+        with self.lock:
+            return CacheStats(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self.invalidations,
+                len(self.entries),
+            )
+
+    def get(self, key: Hashable) -> Any:
+        "The cached value, None on a miss"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                self.drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def generation(self, owner: UUID) -> tuple[int, int]:
+        "Taken before a read, passed to put with what was read"
+        with self.lock:
+            return self.clears, self.generations.get(owner, 0)
+
+    def put(
+        self,
+        key: Hashable,
+        owner: UUID,
+        id: UUID,
+        value: Any,
+        generation: tuple[int, int],
+    ) -> None:
+        "Skipped if owner was invalidated since generation, value may be stale"
+        with self.lock:
+            if generation != (self.clears, self.generations.get(owner, 0)):
+                return
+            if key in self.entries:
+                self.drop(key)
+            self.entries[key] = (self.clock() + self.ttl, owner, id, value)
+            self.by_id.setdefault((owner, id), set()).add(key)
+            self.by_owner.setdefault(owner, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self.drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def drop(self, key: Hashable) -> None:
+        "Removes key, with the lock held"
+        _, owner, id, _ = self.entries.pop(key)
+        self.by_id[(owner, id)].discard(key)
+        if not self.by_id[(owner, id)]:
+            del self.by_id[(owner, id)]
+        self.by_owner[owner].discard(key)
+        if not self.by_owner[owner]:
+            del self.by_owner[owner]
+
+    def invalidate(self, owner: UUID, ids: list[UUID] | None = None) -> None:
+        "Drops the entries of ids and the path lookups of owner, or every entry of owner"
+        with self.lock:
+            # a read running now may have missed the change, even with no entry
+            self.generations[owner] = self.generations.get(owner, 0) + 1
+            keys = set(self.by_owner.get(owner, ()))
+            if ids is not None:
+                # a node inserted or restored at a path goes before the one
+                # found there if its node type comes first
+                keys = {
+                    k for k in keys if isinstance(k, tuple) and k[0] == "bypath"
+                }.union(*(self.by_id.get((owner, id), ()) for id in ids))
+            for key in keys:
+                self.drop(key)
+            self.invalidations += len(keys)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.clears += 1
+            self.generations.clear()
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.by_id.clear()
+            self.by_owner.clear()
+
+    def handle(self, payload: str) -> None:
+        "Invalidates what a notification of CHANNEL names"
+        change = json.loads(payload)
+        ids = change.get("ids")
+        self.invalidate(
+            UUID(change["owner"]), None if ids is None else [UUID(id) for id in ids]
+        )
+
+    def listen(self, conn: Connection) -> None:
+        """
+        Subscribes conn, an autocommit connection of its own, to CHANNEL.
+        Notifications sent before are lost, so the cache starts empty
+        """
+        conn.execute(f"LISTEN {CHANNEL}")
+        self.clear()
+
+    def watch(
+        self,
+        conn: Connection,
+        timeout: float | None = None,
+        stop_after: int | None = None,
+    ) -> None:
+        "Handles the notifications of a listening conn, blocks: run it in a thread"
+        for notify in conn.notifies(timeout=timeout, stop_after=stop_after):
+            self.handle(notify.payload)
+
+    def select_byid(self, cur: Cursor, owner: UUID, id: UUID) -> InodeRow:
+        key = ("byid", owner, id)
+        row = self.get(key)
+        if row is None:
+            generation = self.generation(owner)
+            row = clsr_select_byid(cur, owner, id)
+            self.put(key, owner, id, row, generation)
+        return row
+
+    def get_path(self, cur: Cursor, owner: UUID, id: UUID) -> Any:
+        key = ("path", owner, id)
+        path = self.get(key)
+        if path is None:
+            generation = self.generation(owner)
+            path = clsr_get_path(cur, owner, id)
+            if path is not None:
+                self.put(key, owner, id, path, generation)
+        return path
+
+    def select_bypath(
+        self, cur: Cursor, owner: UUID, root: str, names: list[str]
+    ) -> InodeRow:
+        # a rename or move above the node rewrites its path, so its id is
+        # notified as well; see invalidate for the nodes showing up at a path
+        key = ("bypath", owner, root, tuple(names))
+        row = self.get(key)
+        if row is None:
+            generation = self.generation(owner)
+            row = clsr_select_bypath(cur, owner, root, names)
+            if row is not None:
+                self.put(key, owner, row.id, row, generation)
+        return row
@@ -1,10 +1,18 @@
-from collections.abc import Iterable
-from typing import Any, Literal
-from uuid import UUID
-
-from psycopg import Cursor
+import json
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import Callable, Generator, Sequence
+from concurrent.futures import Future
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from typing import Any, Literal, NamedTuple, TypeVar, overload
+from uuid import UUID, uuid4
+
+from psycopg import AsyncCursor, Connection, Cursor, errors
+from psycopg.rows import args_row
 from pydantic import BaseModel
 
+from closure import queries
+
 NodeType = Literal["node", "item", "template"]
 
 
@@ -20,6 +28,41 @@ class DuplicatedNameError(Exception): ...
 class OwnershipError(Exception): ...
 
 
+class InvalidNameError(Exception): ...
+
+
+class HierarchyError(Exception): ...
+
+
+@contextmanager
+def map_errors() -> Generator[None, None, None]:
+    try:
+        yield
+    except errors.UniqueViolation as e:
+        raise DuplicatedNameError(e.diag.message_primary) from e
+    except (errors.CheckViolation, errors.StringDataRightTruncation) as e:
+        raise InvalidNameError(e.diag.message_primary) from e
+    except errors.IntegrityConstraintViolation as e:
+        raise HierarchyError(e.diag.message_primary) from e
+
+
+def map_error(e: Exception) -> Exception:
+    "What a batch call raises for e: missing or foreign ids as IdNotFoundError too"
+    mapped: Exception
+    if isinstance(e, errors.UniqueViolation):
+        mapped = DuplicatedNameError(e.diag.message_primary)
+    elif isinstance(e, (errors.CheckViolation, errors.StringDataRightTruncation)):
+        mapped = InvalidNameError(e.diag.message_primary)
+    elif isinstance(e, errors.IntegrityConstraintViolation):
+        mapped = HierarchyError(e.diag.message_primary)
+    elif isinstance(e, errors.NoDataFound):
+        mapped = IdNotFoundError(e.diag.message_primary)
+    else:
+        return e
+    mapped.__cause__ = e
+    return mapped
+
+
 class Inode(BaseModel):
 
     id: UUID | None
@@ -28,104 +71,719 @@ class Inode(BaseModel):
     node_type: NodeType
 
 
+InodeTree = tuple[Inode, Sequence["InodeTree"]]
+
+
+# rows of the select functions, decoded positionally: cheap to build for large
+# results, to_inode validates one at the API boundary
+class InodeRow(NamedTuple):
+    id: UUID
+    name: str
+    template: UUID | None
+    node_type: NodeType
+
+
+class PathRow(NamedTuple):
+    id: UUID
+    name: str
+    path: str
+    template: UUID | None
+    node_type: NodeType
+
+
+class DescendantRow(NamedTuple):
+    # the parent of id, whatever node the descendants are selected below
+    parent_id: UUID
+    id: UUID
+    name: str
+    template: UUID | None
+    node_type: NodeType
+
+
+class DescendantPathRow(NamedTuple):
+    parent_id: UUID
+    id: UUID
+    name: str
+    path: str
+    template: UUID | None
+    node_type: NodeType
+
+
+Row = InodeRow | PathRow | DescendantRow | DescendantPathRow
+
+
+class NodeCounts(NamedTuple):
+    # live nodes below the node, at any depth
+    descendants: int
+    items: int
+
+
+class Page(NamedTuple):
+    rows: list[Any]
+    # pass as after to get the next page, None on the last one
+    after: str | None
+
+
+def encode_after(*key: Any) -> str:
+    return urlsafe_b64encode(json.dumps(key, default=str).encode()).decode()
+
+
+def decode_after(after: str | None, size: int) -> list[Any]:
+    "The keyset of a page token, a list of Nones for the first page"
+    if after is None:
+        return [None] * size
+    try:
+        key = json.loads(urlsafe_b64decode(after))
+    except ValueError as e:
+        raise ValueError(f"Bad page token {after!r}") from e
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError(f"Bad page token {after!r}")
+    return key
+
+
+def to_inode(row: Row) -> Inode:
+    return Inode(
+        id=row.id, name=row.name, template=row.template, node_type=row.node_type
+    )
+
+
+R = TypeVar("R")
+
+
+@overload
+def rows_as(
+    cur: Cursor[Any], row_type: Callable[..., R]
+) -> AbstractContextManager[Cursor[R]]: ...
+
+
+@overload
+def rows_as(
+    cur: AsyncCursor[Any], row_type: Callable[..., R]
+) -> AbstractContextManager[AsyncCursor[R]]: ...
+
+
+@contextmanager
+def rows_as(cur: Any, row_type: Callable[..., Any]) -> Generator[Any, None, None]:
+    "Yields cur, decoding the rows it fetches into row_type while in the block"
+    row_factory = cur.row_factory
+    cur.row_factory = args_row(row_type)
+    try:
+        yield cur
+    finally:
+        cur.row_factory = row_factory
+
+
+def stream(
+    cur: Cursor,
+    query: str,
+    params: Sequence[Any] | dict[str, Any],
+    batch_size: int,
+    row_type: type[Row] | None = None,
+) -> Generator[Any, None, None]:
+    "Yields rows from a server side cursor, fetching batch_size rows at a time"
+    conn = cur.connection
+    # a server side cursor lives inside a transaction block
+    with conn.transaction() if conn.autocommit else nullcontext():
+        with conn.cursor(name=f"clsr_{uuid4().hex}") as named:
+            if row_type is not None:
+                named.row_factory = args_row(row_type)
+            named.itersize = batch_size
+            named.execute(query, params)
+            yield from named
+
+
+def pattern_to_regex(pattern: str) -> tuple[str, str, int, int | None]:
+    """
+    Translates a dotted pattern where * and ? match inside a segment and a ** segment
+    matches any number of segments. Returns the literal prefix of the pattern, the
+    path regex and the depth bounds of the matches.
+    """
+    segments: list[str] = []
+    for segment in pattern.split("."):
+        if segment != "**" or segments[-1:] != ["**"]:
+            segments.append(segment)
+
+    prefix: list[str] = []
+    for segment in segments:
+        if "*" in segment or "?" in segment:
+            break
+        prefix.append(segment)
+
+    regex = ""
+    for i, segment in enumerate(segments):
+        if segment == "**":
+            regex += r"([^.]+\.)*" if i == 0 else r"(\.[^.]+)*"
+            continue
+        if i > 0 and segments[:i] != ["**"]:
+            regex += r"\."
+        regex += "".join(
+            r"[^.]*" if c == "*" else r"[^.]" if c == "?" else re.escape(c)
+            for c in segment
+        )
+    if segments == ["**"]:
+        regex = r"[^.]+(\.[^.]+)*"
+
+    fixed = len(segments) - segments.count("**")
+    max_depth = None if "**" in segments else fixed - 1
+    return ".".join(prefix), f"^{regex}$", max(fixed - 1, 0), max_depth
+
+
 def clsr_len(cur: Cursor, owner: UUID) -> Any:
-    cur.execute("SELECT clsr_len(%s);", (owner,))
+    cur.execute(queries.LEN, (owner,))
     return cur.fetchone()
 
 
+def clsr_count_types(cur: Cursor, owner: UUID) -> dict[NodeType, int]:
+    "Live nodes of owner per node type, types with none are left out"
+    cur.execute(queries.COUNT_TYPES, (owner,))
+    return dict(cur.fetchall())
+
+
+def clsr_select_counts(cur: Cursor, owner: UUID, id: UUID) -> NodeCounts:
+    "Kept up to date by every write, read without walking the subtree"
+    with rows_as(cur, NodeCounts) as typed:
+        typed.execute(queries.SELECT_COUNTS, (id, owner))
+        row = typed.fetchone()
+    if row is None:
+        raise IdNotFoundError(f"Id {id} not found for owner {owner}")
+    return row
+
+
+def clsr_recount(cur: Cursor, owner: UUID) -> int:
+    "Rebuild the counters of owner, returns how many were wrong"
+    cur.execute(queries.RECOUNT, (owner,))
+    (wrong,) = cur.fetchone()  # type: ignore
+    return wrong
+
+
 def clsr_insert(cur: Cursor, owner: UUID, parent: UUID | None, inode: Inode) -> Any:
-    cur.execute(
-        "SELECT insert_node(%s, %s, %s, %s, %s);",
-        (inode.name, owner, inode.node_type, inode.template, parent),
-    )
+    with map_errors():
+        cur.execute(
+            queries.INSERT,
+            (inode.name, owner, inode.node_type, inode.template, parent),
+        )
     return cur.fetchone()
 
 
-def clsr_select_roots(cur: Cursor, owner: UUID):
-    cur.execute("SELECT select_roots(%s)", (owner,))
-    return cur.fetchall()
+def clsr_insert_many(
+    cur: Cursor,
+    owner: UUID,
+    parent: UUID | None,
+    inodes: Sequence[Inode],
+    parents: Sequence[int | None],
+) -> list[UUID]:
+    "parents[i] is the index of a previous entry in inodes, or None to attach to parent"
+    with map_errors():
+        cur.execute(
+            queries.INSERT_MANY, insert_many_params(owner, parent, inodes, parents)
+        )
+    return [row[0] for row in cur.fetchall()]
+
+
+def insert_many_params(
+    owner: UUID,
+    parent: UUID | None,
+    inodes: Sequence[Inode],
+    parents: Sequence[int | None],
+) -> tuple[Any, ...]:
+    if len(inodes) != len(parents):
+        raise ValueError("Names, node types and parents must have the same length")
+    if any(p is not None and not 0 <= p < i for i, p in enumerate(parents)):
+        raise ValueError("Parent of a batch entry must be a previous entry")
+    # insert_nodes writes plain nodes, it would drop the template silently
+    if any(inode.template is not None for inode in inodes):
+        raise ValueError("clsr_insert_many takes no templates, see template.py")
+    return (
+        owner,
+        parent,
+        [inode.name for inode in inodes],
+        [inode.node_type for inode in inodes],
+        [None if p is None else p + 1 for p in parents],
+    )
 
 
-def clsr_select_root_byid(cur: Cursor, owner: UUID, id: UUID):
-    cur.execute(
-        "SELECT select_root_byid(%s, %s)",
-        (
-            id,
-            owner,
-        ),
-    )
-    return cur.fetchone()
+def flatten_trees(
+    trees: Sequence[InodeTree],
+) -> tuple[list[Inode], list[int | None]]:
+    "The inodes of trees in depth-first order, with the index of their parent"
+    inodes: list[Inode] = []
+    parents: list[int | None] = []
+
+    stack: list[tuple[InodeTree, int | None]] = [(t, None) for t in reversed(trees)]
+    while stack:
+        (inode, children), parent_idx = stack.pop()
+        inodes.append(inode)
+        parents.append(parent_idx)
+        idx = len(inodes) - 1
+        stack.extend((child, idx) for child in reversed(children))
+
+    return inodes, parents
+
+
+def clsr_insert_subtree(
+    cur: Cursor, owner: UUID, parent: UUID | None, trees: Sequence[InodeTree]
+) -> list[UUID]:
+    "trees are (inode, children) pairs; ids are returned in depth-first order"
+    return clsr_insert_many(cur, owner, parent, *flatten_trees(trees))
+
+
+def clsr_select_roots(cur: Cursor, owner: UUID) -> list[InodeRow]:
+    with rows_as(cur, InodeRow) as typed:
+        typed.execute(queries.SELECT_ROOTS, (owner,))
+        return typed.fetchall()
+
+
+def clsr_select_root_byid(cur: Cursor, owner: UUID, id: UUID) -> InodeRow | None:
+    with rows_as(cur, InodeRow) as typed:
+        typed.execute(
+            queries.SELECT_ROOT_BYID,
+            (
+                id,
+                owner,
+            ),
+        )
+        return typed.fetchone()
 
 
 def clsr_get_path(cur: Cursor, owner: UUID, id: UUID) -> Any:
 
-    cur.execute(
-        """
-                SELECT string_agg(n.name, '.' ORDER BY t.depth DESC) AS path FROM inode n
-                JOIN link t ON t.parent = n.id
-                WHERE t.child = %s
-                """,
-        (id,),
-    )
+    cur.execute(queries.GET_PATH, (id, owner))
     return cur.fetchone()
 
 
-def clsr_select_bypath(cur: Cursor, owner: UUID, root: str, names: list[str]) -> Any:
+def clsr_get_paths(
+    cur: Cursor, owner: UUID, ids: Sequence[UUID]
+) -> dict[UUID, str | IdNotFoundError]:
+    "The path of each of ids, in one query"
+    cur.execute(queries.GET_PATHS, (list(ids), owner))
+    return ids_found(owner, ids, dict(cur.fetchall()))
 
-    cur.execute("SELECT select_child_bypath(%s, %s, %s)", (owner, root, names))
-    return cur.fetchone()
+
+def ids_found(owner: UUID, ids: Sequence[UUID], found: dict[UUID, Any]) -> Any:
+    "found keyed by each of ids in order, IdNotFoundError for the missing ones"
+    return {
+        id: found.get(id) or IdNotFoundError(f"Id {id} not found for owner {owner}")
+        for id in ids
+    }
+
+
+def clsr_select_bypath(
+    cur: Cursor, owner: UUID, root: str, names: list[str]
+) -> InodeRow:
+
+    with rows_as(cur, InodeRow) as typed:
+        typed.execute(queries.SELECT_BYPATH, (owner, root, names))
+        row = typed.fetchone()
+    if row is None:
+        raise IdNotFoundError(f"Error on select by path. Root {root}, Names {names}")
+    return row
+
+
+def clsr_select_bypaths(
+    cur: Cursor, owner: UUID, paths: Sequence[str]
+) -> dict[str, UUID | IdNotFoundError]:
+    "paths are dotted, as returned by clsr_get_path"
+    cur.execute(queries.SELECT_BYPATHS, (owner, list(paths)))
+    return paths_found(owner, cur.fetchall())
+
+
+def paths_found(
+    owner: UUID, rows: list[tuple[str, UUID | None]]
+) -> dict[str, UUID | IdNotFoundError]:
+    return {
+        path: id or IdNotFoundError(f"Path {path} not found for owner {owner}")
+        for path, id in rows
+    }
+
+
+def clsr_select_bypattern(
+    cur: Cursor, owner: UUID, pattern: str, batch_size: int = 1000
+) -> Generator[Any, None, None]:
+    "Matches are streamed in path order, see pattern_to_regex for the syntax"
+    prefix, regex, min_depth, max_depth = pattern_to_regex(pattern)
+    yield from stream(
+        cur,
+        queries.SELECT_BYPATTERN,
+        (owner, prefix, regex, min_depth, max_depth),
+        batch_size,
+        PathRow,
+    )
 
 
-def clsr_select_byid(cur: Cursor, owner: UUID, id: UUID):
-    cur.execute("SELECT select_byid(%s, %s)", (id, owner))
-    row = cur.fetchone()
+def clsr_select_byid(cur: Cursor, owner: UUID, id: UUID) -> InodeRow:
+    with rows_as(cur, InodeRow) as typed:
+        typed.execute(queries.SELECT_BYID, (id, owner))
+        row = typed.fetchone()
     if row is None:
         raise IdNotFoundError(f"Id {id} not found for owner {owner}")
-    return row[0]
+    return row
+
+
+def clsr_select_byids(
+    cur: Cursor, owner: UUID, ids: Sequence[UUID]
+) -> dict[UUID, InodeRow | IdNotFoundError]:
+    "The row of each of ids, in one query"
+    with rows_as(cur, InodeRow) as typed:
+        typed.execute(queries.SELECT_BYIDS, (list(ids), owner))
+        rows = typed.fetchall()
+    return ids_found(owner, ids, {row.id: row for row in rows})
+
+
+def clsr_select_children(cur: Cursor, owner: UUID, id: UUID) -> list[InodeRow]:
+    with rows_as(cur, InodeRow) as typed:
+        typed.execute(queries.SELECT_CHILDREN, (id, owner))
+        return typed.fetchall()
+
+
+def clsr_select_children_page(
+    cur: Cursor,
+    owner: UUID,
+    id: UUID,
+    after: str | None = None,
+    limit: int | None = None,
+) -> Page:
+    "A Page of the children in path order, after the token of the previous one"
+    path, after_id = decode_after(after, 2)
+    cur.execute(queries.SELECT_CHILD_PAGE, (id, owner, path, after_id, limit))
+    return child_page(cur.fetchall(), limit)
+
+
+def child_page(rows: list[Any], limit: int | None) -> Page:
+    "Page of select_child_page rows, (path, id) being the keyset"
+    last = rows[-1] if rows and len(rows) == limit else None
+    return Page(
+        rows=[InodeRow._make(row[1:]) for row in rows],
+        after=encode_after(*last[:2]) if last else None,
+    )
 
 
-def clsr_select_children(cur: Cursor, owner: UUID, id: UUID) -> Iterable[Any]:
-    cur.execute("SELECT select_child(%s, %s);", (id, owner))
-    return cur.fetchall()
+def clsr_select_descendants(cur: Cursor, owner: UUID, id: UUID) -> list[DescendantRow]:
+    with rows_as(cur, DescendantRow) as typed:
+        typed.execute(queries.SELECT_DESCENDANTS, (id, owner))
+        return typed.fetchall()
 
 
-def clsr_select_descendants(cur: Cursor, owner: UUID, id: UUID) -> Iterable[Any]:
-    cur.execute("SELECT select_descendants(%s, %s);", (id, owner))
-    return cur.fetchall()
+def clsr_select_descendants_page(
+    cur: Cursor,
+    owner: UUID,
+    id: UUID,
+    after: str | None = None,
+    limit: int | None = None,
+) -> Page:
+    "A Page of the descendants in (depth, path) order, see clsr_select_children_page"
+    depth, path, after_id = decode_after(after, 3)
+    cur.execute(
+        queries.SELECT_DESCENDANTS_PAGE, (id, owner, depth, path, after_id, limit)
+    )
+    return descendant_page(cur.fetchall(), limit)
 
 
-def clsr_select_children_wpath(cur: Cursor, owner: UUID, id: UUID) -> Iterable[Any]:
-    cur.execute("SELECT select_child_path(%s, %s);", (id, owner))
-    return cur.fetchall()
+def descendant_page(rows: list[Any], limit: int | None) -> Page:
+    "Page of select_descendants_page rows, (depth, path, id) being the keyset"
+    last = rows[-1] if rows and len(rows) == limit else None
+    return Page(
+        rows=[DescendantRow._make(row[2:]) for row in rows],
+        after=encode_after(*last[:2], last[3]) if last else None,
+    )
 
 
-def clsr_select_descendants_wpath(cur: Cursor, owner: UUID, id: UUID) -> Iterable[Any]:
-    cur.execute("SELECT select_descendants_path(%s, %s);", (id, owner))
-    return cur.fetchall()
+def clsr_select_children_wpath(cur: Cursor, owner: UUID, id: UUID) -> list[PathRow]:
+    with rows_as(cur, PathRow) as typed:
+        typed.execute(queries.SELECT_CHILDREN_WPATH, (id, owner))
+        return typed.fetchall()
+
+
+def clsr_select_descendants_wpath(
+    cur: Cursor, owner: UUID, id: UUID
+) -> list[DescendantPathRow]:
+    with rows_as(cur, DescendantPathRow) as typed:
+        typed.execute(queries.SELECT_DESCENDANTS_WPATH, (id, owner))
+        return typed.fetchall()
 
 
 def clsr_select_children_json(cur: Cursor, owner: UUID, id: UUID) -> Any:
-    cur.execute("SELECT select_children_json(%s, %s);", (id, owner))
+    cur.execute(queries.SELECT_CHILDREN_JSON, (id, owner))
     return cur.fetchone()
 
 
 def clsr_select_descendants_json(cur: Cursor, owner: UUID, id: UUID) -> Any:
-    cur.execute("SELECT select_descendants_json(%s, %s);", (id, owner))
+    cur.execute(queries.SELECT_DESCENDANTS_JSON, (id, owner))
+    return cur.fetchone()
+
+
+def clsr_select_subtree_json(
+    cur: Cursor,
+    owner: UUID,
+    id: UUID,
+    max_depth: int | None = None,
+    with_items: bool = False,
+) -> Any:
+    "id with nested children lists down to max_depth levels below it"
+    if max_depth is not None and max_depth < 0:
+        raise ValueError(f"max_depth {max_depth} is negative")
+    cur.execute(queries.SELECT_SUBTREE_JSON, (id, owner, max_depth, with_items))
+    return cur.fetchone()
+
+
+def iter_descendants(
+    cur: Cursor,
+    owner: UUID,
+    id: UUID,
+    order: Literal["depth", "path"] = "depth",
+    batch_size: int = 1000,
+    with_path: bool = False,
+) -> Generator[Any, None, None]:
+    "Streams (parent, id, name, [path,] template, node_type) rows of the subtree"
+    found = False
+    for row in stream(
+        cur,
+        iter_descendants_query(order, with_path),
+        {"id": id, "owner": owner},
+        batch_size,
+        DescendantPathRow if with_path else DescendantRow,
+    ):
+        found = True
+        yield row
+    # a leaf, or an id missing or not of owner
+    if not found:
+        cur.execute(queries.IS_OWNER, (id, owner))
+
+
+def iter_descendants_query(order: Literal["depth", "path"], with_path: bool) -> str:
+    query = queries.ITER_DESCENDANTS.format(path="d.path, " if with_path else "")
+    return query + queries.ORDER_BY[order]
+
+
+def iter_descendants_wpath(
+    cur: Cursor,
+    owner: UUID,
+    id: UUID,
+    order: Literal["depth", "path"] = "depth",
+    batch_size: int = 1000,
+) -> Generator[Any, None, None]:
+    yield from iter_descendants(cur, owner, id, order, batch_size, with_path=True)
+
+
+def clsr_rename(cur: Cursor, owner: UUID, id: UUID, name: str) -> Any:
+
+    with map_errors():
+        cur.execute(queries.RENAME, (id, owner, name))
+    return cur.fetchone()
+
+
+def clsr_move(cur: Cursor, owner: UUID, id: UUID, parent: UUID | None) -> Any:
+
+    with map_errors():
+        cur.execute(queries.MOVE, (id, owner, parent))
     return cur.fetchone()
 
 
 def clsr_delete_node(cur: Cursor, owner: UUID, id: UUID) -> Any:
 
-    cur.execute("SELECT delete_node(%s, %s);", (id, owner))
+    # children are promoted and may clash with a sibling of the deleted node
+    with map_errors():
+        cur.execute(queries.DELETE_NODE, (id, owner))
 
     return cur.fetchone()
 
 
 def clsr_delete_descendants(cur: Cursor, owner: UUID, id: UUID) -> Any:
 
-    cur.execute("SELECT delete_descendants(%s, %s);", (id, owner))
+    cur.execute(queries.DELETE_DESCENDANTS, (id, owner))
+
+    return cur.fetchone()
+
+
+def clsr_delete_many(cur: Cursor, owner: UUID, ids: Sequence[UUID]) -> dict[UUID, int]:
+    "Delete the subtrees of ids, counting each node once for its closest listed id"
+
+    cur.execute(queries.DELETE_MANY, (owner, list(ids)))
+
+    return dict(cur.fetchall())
+
+
+def clsr_trash_descendants(cur: Cursor, owner: UUID, id: UUID) -> Any:
+    "Hide the subtree of id until clsr_restore or clsr_purge"
+
+    cur.execute(queries.TRASH_DESCENDANTS, (id, owner))
+
+    return cur.fetchone()
+
+
+def clsr_restore(cur: Cursor, owner: UUID, id: UUID) -> Any:
+
+    # the name of the subtree root may have been reused meanwhile
+    with map_errors():
+        cur.execute(queries.RESTORE, (id, owner))
 
     return cur.fetchone()
 
+
+def clsr_purge(conn: Connection, chunk: int = 1000) -> int:
+    "Delete trashed rows chunk at a time, committing after each chunk"
+
+    total = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(queries.PURGE, (chunk,))
+            (deleted,) = cur.fetchone()  # type: ignore
+            conn.commit()
+            total += deleted
+            if deleted < chunk:
+                return total
+
     # def select_roots(self) -> Iterable[T]: ...
     # def select_node_root(self, id: str) -> T: ...
+
+
+class Batch:
+    "Calls queued by batch(), each returns the Future of its result"
+
+    def __init__(self, conn: Connection) -> None:
+        self.conn = conn
+        self.calls: list[
+            tuple[Cursor, str, Any, Callable[[Cursor[Any]], Any], Future[Any]]
+        ] = []
+
+    def queue(
+        self,
+        query: str,
+        params: Any,
+        row_type: type[Row] | None = None,
+        fetch: Callable[[Cursor[Any]], Any] = Cursor.fetchone,
+    ) -> Future[Any]:
+        # a cursor per call keeps its result until the pipeline is synced
+        cur = self.conn.cursor()
+        if row_type is not None:
+            cur.row_factory = args_row(row_type)
+        future: Future[Any] = Future()
+        self.calls.append((cur, query, params, fetch, future))
+        return future
+
+    def flush(self) -> None:
+        "Sends the queued calls in one pipeline and settles their futures"
+        calls, self.calls = self.calls, []
+        error: Exception | None = None
+        with self.conn.pipeline() as pipeline:
+            for cur, query, params, _, _ in calls:
+                try:
+                    cur.execute(query, params)
+                except errors.PipelineAborted:
+                    pass
+                except errors.Error as e:
+                    error = error or e
+            try:
+                pipeline.sync()
+            except errors.PipelineAborted:
+                pass
+            except errors.Error as e:
+                error = error or e
+
+        # the first call with no result failed, the server skipped the rest
+        failed = False
+        for cur, _, _, fetch, future in calls:
+            if cur.pgresult is None:
+                future.set_exception(
+                    errors.PipelineAborted("A previous call of the batch failed")
+                    if failed or error is None
+                    else map_error(error)
+                )
+                failed = True
+            else:
+                try:
+                    future.set_result(fetch(cur))
+                except Exception as e:
+                    future.set_exception(e)
+            cur.close()
+
+    def len(self, owner: UUID) -> Future[Any]:
+        return self.queue(queries.LEN, (owner,))
+
+    def insert(self, owner: UUID, parent: UUID | None, inode: Inode) -> Future[Any]:
+        return self.queue(
+            queries.INSERT,
+            (inode.name, owner, inode.node_type, inode.template, parent),
+        )
+
+    def select_byid(self, owner: UUID, id: UUID) -> Future[InodeRow]:
+
+        def fetch(cur: Cursor[InodeRow]) -> InodeRow:
+            row = cur.fetchone()
+            if row is None:
+                raise IdNotFoundError(f"Id {id} not found for owner {owner}")
+            return row
+
+        return self.queue(queries.SELECT_BYID, (id, owner), InodeRow, fetch)
+
+    def select_root_byid(self, owner: UUID, id: UUID) -> Future[InodeRow | None]:
+        return self.queue(queries.SELECT_ROOT_BYID, (id, owner), InodeRow)
+
+    def get_path(self, owner: UUID, id: UUID) -> Future[Any]:
+
+        def fetch(cur: Cursor[Any]) -> Any:
+            row = cur.fetchone()
+            if row is None:
+                raise IdNotFoundError(f"Id {id} not found for owner {owner}")
+            return row
+
+        return self.queue(queries.GET_PATH, (id, owner), None, fetch)
+
+    def select_bypath(
+        self, owner: UUID, root: str, names: list[str]
+    ) -> Future[InodeRow]:
+
+        def fetch(cur: Cursor[InodeRow]) -> InodeRow:
+            row = cur.fetchone()
+            if row is None:
+                raise IdNotFoundError(
+                    f"Error on select by path. Root {root}, Names {names}"
+                )
+            return row
+
+        return self.queue(queries.SELECT_BYPATH, (owner, root, names), InodeRow, fetch)
+
+    def select_children(self, owner: UUID, id: UUID) -> Future[list[InodeRow]]:
+        return self.queue(
+            queries.SELECT_CHILDREN, (id, owner), InodeRow, Cursor.fetchall
+        )
+
+    def select_descendants(self, owner: UUID, id: UUID) -> Future[list[DescendantRow]]:
+        return self.queue(
+            queries.SELECT_DESCENDANTS, (id, owner), DescendantRow, Cursor.fetchall
+        )
+
+    def rename(self, owner: UUID, id: UUID, name: str) -> Future[Any]:
+        return self.queue(queries.RENAME, (id, owner, name))
+
+    def move(self, owner: UUID, id: UUID, parent: UUID | None) -> Future[Any]:
+        return self.queue(queries.MOVE, (id, owner, parent))
+
+    def delete_node(self, owner: UUID, id: UUID) -> Future[Any]:
+        return self.queue(queries.DELETE_NODE, (id, owner))
+
+    def trash_descendants(self, owner: UUID, id: UUID) -> Future[Any]:
+        return self.queue(queries.TRASH_DESCENDANTS, (id, owner))
+
+    def restore(self, owner: UUID, id: UUID) -> Future[Any]:
+        return self.queue(queries.RESTORE, (id, owner))
+
+
+@contextmanager
+def batch(conn: Connection) -> Generator[Batch, None, None]:
+    """
+    Calls queued in the block are sent together in pipeline mode when it ends, or
+    on flush(), instead of one round trip each. A call returns a Future with the
+    result of the clsr_* function of the same name, or its error mapped by
+    map_error. Once a call fails the server skips the calls after it in the same
+    flush, they raise PipelineAborted. A flush is one transaction: a failure rolls
+    back what the calls before it wrote in autocommit mode, and otherwise leaves
+    the transaction failed, to be rolled back as after any error.
+    """
+    b = Batch(conn)
+    try:
+        yield b
+    except BaseException:
+        for *_, future in b.calls:
+            future.cancel()
+        raise
+    b.flush()
@@ -0,0 +1,128 @@
+from typing import TYPE_CHECKING, Any, NamedTuple, get_args
+from uuid import UUID
+
+from psycopg import Cursor
+
+from closure.closure import NodeType
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# node_type is exported as its index in NODE_TYPES
+NODE_TYPES: tuple[NodeType, ...] = get_args(NodeType)
+# parent of the owner roots
+NO_PARENT = UUID(int=0)
+# names are zero padded to a fixed width, the widest VARCHAR(64) in UTF8 by default
+NAME_BYTES = 256
+
+# every field has a fixed width, so each COPY tuple has the same size
+EXPORT = """
+    COPY (
+        SELECT n.id,
+            coalesce(n.parent, %(no_parent)s),
+            n.depth,
+            (array_position(%(node_types)s::NODETYPE[], n.node_type) - 1)::INT2,
+            substring(b.name for %(name_bytes)s)
+                || decode(repeat('00', %(name_bytes)s - octet_length(b.name)), 'hex')
+        FROM inode n, convert_to(n.name, 'UTF8') AS b(name)
+        WHERE n.owner = %(owner)s
+        AND n.trashed IS NULL
+        {subtree}
+        ORDER BY n.path
+    ) TO STDOUT (FORMAT BINARY)
+"""
+
+# the path range keeps the scan on idx_inode_path, in path order with no sort;
+# link drops what else the range holds: nodes of another type sharing the
+# path with their subtrees, and siblings whose name starts with the root name
+# and goes on with a character sorting before '/', such as '-'
+SUBTREE = """
+        AND n.path >= (
+            SELECT r.path FROM inode r WHERE r.id = %(id)s AND r.owner = %(owner)s
+        )
+        AND n.path < (
+            SELECT r.path FROM inode r WHERE r.id = %(id)s AND r.owner = %(owner)s
+        ) || '/'
+        AND EXISTS (
+            SELECT 1 FROM link t
+            WHERE t.owner = %(owner)s AND t.parent = %(id)s AND t.child = n.id
+        )"""
+
+SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+# signature, flags and header extension length before the tuples, -1 after them
+HEADER, TRAILER = len(SIGNATURE) + 8, 2
+
+
+class SubtreeColumns(NamedTuple):
+    id: "np.ndarray"  # V16, the uuid bytes
+    parent: "np.ndarray"  # V16, NO_PARENT for roots
+    depth: "np.ndarray"  # int32
+    node_type: "np.ndarray"  # int8, index in NODE_TYPES
+    name: "np.ndarray"  # S<name_bytes>, UTF8
+
+
+def row_dtype(name_bytes: int) -> Any:
+
+    import numpy as np
+
+    # binary COPY tuple: field count, then length and big endian value of each field
+    return np.dtype(
+        [
+            ("fields", ">i2"),
+            ("id_len", ">i4"),
+            ("id", "V16"),
+            ("parent_len", ">i4"),
+            ("parent", "V16"),
+            ("depth_len", ">i4"),
+            ("depth", ">i4"),
+            ("node_type_len", ">i4"),
+            ("node_type", ">i2"),
+            ("name_len", ">i4"),
+            ("name", f"S{name_bytes}"),
+        ]
+    )
+
+
+def clsr_export_subtree_columnar(
+    cur: Cursor, owner: UUID, id: UUID | None = None, name_bytes: int = NAME_BYTES
+) -> SubtreeColumns:
+    """
+    The subtree of id, or every node of owner, in path order. Needs numpy.
+    A smaller name_bytes (64 holds any ASCII name) shrinks the transfer, longer
+    names are cut.
+    """
+
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImportError("clsr_export_subtree_columnar needs numpy") from e
+
+    data = bytearray()
+    query = EXPORT.format(subtree=SUBTREE if id is not None else "")
+    params = {
+        "id": id,
+        "owner": owner,
+        "no_parent": NO_PARENT,
+        "node_types": list(NODE_TYPES),
+        "name_bytes": name_bytes,
+    }
+    with cur.copy(query, params) as copy:
+        for chunk in copy:
+            data += chunk
+
+    if data[: len(SIGNATURE)] != SIGNATURE:
+        raise ValueError("Not a binary COPY stream")
+
+    rows = np.frombuffer(memoryview(data)[HEADER:-TRAILER], dtype=row_dtype(name_bytes))
+
+    # the subtree holds id itself, it is empty when id is missing or not of owner
+    if id is not None and not len(rows):
+        cur.execute("CALL is_owner(%s, %s);", (id, owner))
+
+    return SubtreeColumns(
+        id=rows["id"].copy(),
+        parent=rows["parent"].copy(),
+        depth=rows["depth"].astype(np.int32),
+        node_type=rows["node_type"].astype(np.int8),
+        name=rows["name"].copy(),
+    )
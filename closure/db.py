@@ -1,31 +1,250 @@
-from collections.abc import Generator
-from contextlib import contextmanager
+import asyncio
+import atexit
+import os
+from collections.abc import AsyncGenerator, Generator
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
+from typing import Any
+from weakref import WeakKeyDictionary
 
-from psycopg import Connection, connect
+from psycopg import AsyncConnection, Connection
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from pydantic import BaseModel
 
+DB_HOST = "localhost"  # Use 'localhost' or the Docker network alias if running in a Docker network
+DB_PORT = "5432"  # Default PostgreSQL port
+DB_NAME = "postgres"  # Name of the database
+DB_USER = "postgres"  # PostgreSQL user
+DB_PASSWORD = "password"  # PostgreSQL password
 
-@contextmanager
-def bootstrap() -> Generator[Connection, None, None]:
 
-    DB_HOST = "localhost"  # Use 'localhost' or the Docker network alias if running in a Docker network
-    DB_PORT = "5432"  # Default PostgreSQL port
-    DB_NAME = "postgres"  # Name of the database
-    DB_USER = "postgres"  # PostgreSQL user
-    DB_PASSWORD = "password"  # PostgreSQL password
+class PoolConfig(BaseModel):
 
-    conn = connect(
+    conninfo: str = make_conninfo(
         host=DB_HOST,
         port=DB_PORT,
-        # database=DB_NAME,
+        # dbname=DB_NAME,
         user=DB_USER,
         password=DB_PASSWORD,
     )
-    # cur = conn.cursor()  # type: ignore
+    min_size: int = 1
+    max_size: int = 10
+    # seconds to wait for a connection, and before an idle one is closed
+    timeout: float = 30.0
+    max_idle: float = 600.0
+    # ping each connection as it is borrowed
+    check: bool = True
+    # executions of a query before psycopg prepares it, None to never prepare
+    # (needed behind pgbouncer in transaction mode)
+    prepare_threshold: int | None = 5
+    search_path: str | None = None
+
+    @classmethod
+    def from_env(cls, prefix: str = "CLOSURE_") -> "PoolConfig":
+        """
+        CLOSURE_DSN and CLOSURE_POOL_MIN_SIZE, _MAX_SIZE, _TIMEOUT, _MAX_IDLE, _CHECK,
+        CLOSURE_PREPARE_THRESHOLD (empty to never prepare) and CLOSURE_SEARCH_PATH
+        override the defaults
+        """
+        names = {
+            "conninfo": "DSN",
+            "min_size": "POOL_MIN_SIZE",
+            "max_size": "POOL_MAX_SIZE",
+            "timeout": "POOL_TIMEOUT",
+            "max_idle": "POOL_MAX_IDLE",
+            "check": "POOL_CHECK",
+            "prepare_threshold": "PREPARE_THRESHOLD",
+            "search_path": "SEARCH_PATH",
+        }
+        values: dict[str, Any] = {
+            field: os.environ[prefix + name]
+            for field, name in names.items()
+            if prefix + name in os.environ
+        }
+        if values.get("prepare_threshold") == "":
+            values["prepare_threshold"] = None
+        return cls(**values)
+
+
+class PoolStats(BaseModel):
+
+    size: int
+    available: int
+    waiting: int
+    requests: int
+    # requests that found no connection available, and how long they waited
+    queued: int
+    wait_ms: int
+    # requests that failed: timed out, or turned away by a full queue
+    errors: int
+
+    @property
+    def wait_avg_ms(self) -> float:
+        return self.wait_ms / self.queued if self.queued else 0.0
+
+
+def pool_stats(pool: ConnectionPool | AsyncConnectionPool) -> PoolStats:
+    "Counts since the pool was opened"
+    stats = pool.get_stats()
+    return PoolStats(
+        size=stats["pool_size"],
+        available=stats["pool_available"],
+        waiting=stats["requests_waiting"],
+        requests=stats.get("requests_num", 0),
+        queued=stats.get("requests_queued", 0),
+        wait_ms=stats.get("requests_wait_ms", 0),
+        errors=stats.get("requests_errors", 0),
+    )
+
+
+def pool_kwargs(config: PoolConfig) -> dict[str, Any]:
+    return {
+        "conninfo": config.conninfo,
+        "min_size": config.min_size,
+        "max_size": config.max_size,
+        "timeout": config.timeout,
+        "max_idle": config.max_idle,
+        "name": "closure",
+    }
+
+
+_pool: ConnectionPool | None = None
+# an asyncio pool runs its workers in the loop that opened it
+_apools: WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncConnectionPool] = (
+    WeakKeyDictionary()
+)
+# held while the pool of a loop opens, so concurrent first callers share it
+_apool_locks: WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = (
+    WeakKeyDictionary()
+)
+# what each pool was opened with
+_configs: WeakKeyDictionary[ConnectionPool | AsyncConnectionPool, PoolConfig] = (
+    WeakKeyDictionary()
+)
+
+
+def check_config(
+    pool: ConnectionPool | AsyncConnectionPool, config: PoolConfig | None
+) -> None:
+    "A pool keeps the config it was opened with, close it to open another"
+    if config is not None and config != _configs[pool]:
+        raise ValueError(f"Pool {pool.name} is open with another config")
+
+
+def get_pool(config: PoolConfig | None = None) -> ConnectionPool:
+    """
+    The process pool, opened on first use with config or PoolConfig.from_env().
+    Raises ValueError for a config other than the one of the open pool
+    """
+    global _pool
+    if _pool is not None:
+        check_config(_pool, config)
+    else:
+        config = config or PoolConfig.from_env()
+
+        def configure(conn: Connection) -> None:
+            conn.prepare_threshold = config.prepare_threshold
+            if config.search_path is not None:
+                conn.execute(
+                    "SELECT set_config('search_path', %s, false)",
+                    (config.search_path,),
+                )
+                conn.commit()
+
+        def reset(conn: Connection) -> None:
+            # a borrower may have left autocommit on, a LISTEN or a SET behind
+            conn.autocommit = True
+            conn.execute("UNLISTEN *")
+            conn.execute("RESET ALL")
+            conn.autocommit = False
+            configure(conn)
 
-    yield conn  # , cur
+        _pool = ConnectionPool(
+            **pool_kwargs(config),
+            configure=configure,
+            reset=reset,
+            check=ConnectionPool.check_connection if config.check else None,
+            open=True,
+        )
+        _configs[_pool] = config
+        atexit.register(_pool.close)
+    return _pool
 
-    conn.close()
+
+def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+async def get_apool(config: PoolConfig | None = None) -> AsyncConnectionPool:
+    """
+    The pool of the running event loop, see get_pool. Close it with close_apool
+    before the loop ends, a connection still being reset would keep it running.
+    """
+    loop = asyncio.get_running_loop()
+    # no await between the check and the setdefault, one lock per loop
+    async with _apool_locks.setdefault(loop, asyncio.Lock()):
+        if loop in _apools:
+            check_config(_apools[loop], config)
+            return _apools[loop]
+        config = config or PoolConfig.from_env()
+
+        async def configure(conn: AsyncConnection) -> None:
+            conn.prepare_threshold = config.prepare_threshold
+            if config.search_path is not None:
+                await conn.execute(
+                    "SELECT set_config('search_path', %s, false)",
+                    (config.search_path,),
+                )
+                await conn.commit()
+
+        async def reset(conn: AsyncConnection) -> None:
+            await conn.set_autocommit(True)
+            await conn.execute("UNLISTEN *")
+            await conn.execute("RESET ALL")
+            await conn.set_autocommit(False)
+            await configure(conn)
+
+        pool = AsyncConnectionPool(
+            **pool_kwargs(config),
+            configure=configure,
+            reset=reset,
+            check=AsyncConnectionPool.check_connection if config.check else None,
+            open=False,
+        )
+        await pool.open()
+        _configs[pool] = config
+        _apools[loop] = pool
+    return pool
+
+
+async def close_apool() -> None:
+    pool = _apools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+@contextmanager
+def bootstrap() -> Generator[Connection, None, None]:
+    "A connection of the pool, what was left uncommitted is rolled back"
+    with get_pool().connection() as conn:
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+
+@asynccontextmanager
+async def abootstrap() -> AsyncGenerator[AsyncConnection, None]:
+    pool = await get_apool()
+    async with pool.connection() as conn:
+        try:
+            yield conn
+        finally:
+            await conn.rollback()
 
 
 def make_tables(conn: Connection, file: str):
@@ -45,6 +264,28 @@ def make_tables(conn: Connection, file: str):
     conn.commit()
 
 
+# closure_users.sql and the node tables come first, see load_schema
+SCHEMA_FILES = (
+    "closure_common.sql",
+    "closure_checks.sql",
+    "closure_inserts.sql",
+    "closure_deletes.sql",
+    "closure_updates.sql",
+    "closure_selects.sql",
+    "closure_counts.sql",
+    "closure_template.sql",
+)
+
+
+def load_schema(conn: Connection, partitioned: bool = False) -> None:
+    "The tables and functions of closure/sql, with the node tables partitioned or not"
+    tables = "closure_tables_partitioned.sql" if partitioned else "closure_tables.sql"
+    sql = Path(__file__).resolve().parent / "sql"
+    for file in ("closure_users.sql", tables, *SCHEMA_FILES):
+        conn.execute((sql / file).read_bytes())
+    conn.commit()
+
+
 def query_tables(conn: Connection):
 
     cur = conn.cursor()
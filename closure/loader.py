@@ -0,0 +1,51 @@
+from collections.abc import Iterable
+from time import perf_counter
+from uuid import UUID, uuid4
+
+from psycopg import Cursor
+from pydantic import BaseModel
+
+from closure.closure import NodeType, map_errors
+
+# key, parent key (None for rows attached to the load parent), name, node_type
+StageRow = tuple[str, str | None, str, NodeType]
+
+
+class LoadReport(BaseModel):
+
+    nodes: int
+    links: int
+    seconds: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.nodes / self.seconds if self.seconds > 0 else float("inf")
+
+
+def clsr_copy_load(
+    cur: Cursor, owner: UUID, parent: UUID | None, rows: Iterable[StageRow]
+) -> LoadReport:
+
+    load_id = uuid4()
+    start = perf_counter()
+
+    with cur.copy(
+        "COPY inode_stage (load_id, key, parent_key, name, node_type) FROM STDIN"
+    ) as copy:
+        for key, parent_key, name, node_type in rows:
+            copy.write_row((load_id, key, parent_key, name, node_type))
+
+    try:
+        with map_errors():
+            cur.execute(
+                "SELECT * FROM load_nodes(%s, %s, %s);", (load_id, owner, parent)
+            )
+    except Exception:
+        # in autocommit mode the COPY is committed already, load_nodes only
+        # deletes the staged rows when it succeeds
+        if cur.connection.autocommit:
+            cur.execute("DELETE FROM inode_stage WHERE load_id = %s;", (load_id,))
+        raise
+    nodes, links = cur.fetchone()  # type: ignore
+
+    return LoadReport(nodes=nodes, links=links, seconds=perf_counter() - start)
@@ -0,0 +1,745 @@
+import re
+from collections.abc import Generator, Iterator, Sequence
+from typing import Any, Literal, get_args
+from uuid import UUID, uuid4
+
+from closure.closure import (
+    DescendantPathRow,
+    DescendantRow,
+    DuplicatedNameError,
+    IdNotFoundError,
+    Inode,
+    InodeRow,
+    InodeTree,
+    HierarchyError,
+    InvalidNameError,
+    NodeCounts,
+    NodeType,
+    OwnershipError,
+    Page,
+    PathRow,
+    child_page,
+    decode_after,
+    descendant_page,
+    flatten_trees,
+    ids_found,
+    paths_found,
+    pattern_to_regex,
+)
+
+# in NODETYPE order, the first one wins when nodes of several types share a path
+NODE_TYPES: tuple[NodeType, ...] = get_args(NodeType)
+# inode.name is VARCHAR(64)
+NAME_LENGTH = 64
+# the smallest uuid, where a page keyset starts
+NO_ID = str(UUID(int=0))
+
+
+class MemoryNode:
+    "An inode row, the parent pointers stand for its links"
+
+    __slots__ = (
+        "id",
+        "owner",
+        "parent",
+        "name",
+        "node_type",
+        "template",
+        "trashed",
+        "children",
+    )
+
+    def __init__(
+        self,
+        id: UUID,
+        owner: UUID,
+        parent: UUID | None,
+        name: str,
+        node_type: NodeType,
+    ) -> None:
+        self.id = id
+        self.owner = owner
+        self.parent = parent
+        self.name = name
+        self.node_type = node_type
+        self.template: UUID | None = None
+        # id of the trashed subtree root, as in inode
+        self.trashed: UUID | None = None
+        # trashed ones too, in insertion order
+        self.children: dict[UUID, None] = {}
+
+    def row(self) -> InodeRow:
+        return InodeRow(self.id, self.name, self.template, self.node_type)
+
+
+class MemoryTree:
+    """
+    The tables of closure_tables.sql held in dicts, passed to the clsr_* functions
+    of this module where closure.py takes a cursor. Results and errors are those of
+    closure.py, mapped as map_error does; an unknown owner raises OwnershipError.
+    A call that raises leaves the tree unchanged.
+    """
+
+    def __init__(self) -> None:
+        self.nodes: dict[UUID, MemoryNode] = {}
+        # the roots of each owner, trashed ones too; the users table
+        self.roots: dict[UUID, dict[UUID, None]] = {}
+        # (owner, parent, node_type, name) of the live nodes, idx_inode_sibling_name
+        self.names: dict[tuple[UUID, UUID | None, NodeType, str], UUID] = {}
+        # live nodes of each owner per node type, owner_counts
+        self.counts: dict[UUID, dict[NodeType, int]] = {}
+
+    def add_owner(self, owner: UUID | None = None) -> UUID:
+        "Nodes are inserted for known owners only, as for the users rows"
+        owner = owner or uuid4()
+        self.roots.setdefault(owner, {})
+        self.counts.setdefault(owner, dict.fromkeys(NODE_TYPES, 0))
+        return owner
+
+    def owner_exist(self, owner: UUID) -> None:
+        if owner not in self.roots:
+            raise OwnershipError(f"User {owner} does not exist")
+
+    def is_owner(self, owner: UUID, id: UUID | None) -> MemoryNode:
+        node = self.nodes.get(id)  # type: ignore
+        if node is None or node.owner != owner or node.trashed is not None:
+            raise IdNotFoundError(f"Id {id} not found for owner {owner}")
+        return node
+
+    def check_hierarchy(
+        self, owner: UUID, parent: UUID | None, node_type: NodeType
+    ) -> None:
+        if parent is None:
+            if node_type != "node":
+                raise HierarchyError(f"Root element cannot be {node_type}")
+            return
+        parent_type = self.is_owner(owner, parent).node_type
+        if node_type == "node" and parent_type != "node":
+            raise HierarchyError(
+                f"Node type {node_type} can't have a parent {parent_type}"
+            )
+
+    def check_chars(self, name: str) -> None:
+        "inode_name_no_dot, a dot separates the names of a path, and the column length"
+        if "." in name:
+            raise InvalidNameError(f"Name {name} holds a dot")
+        if len(name) > NAME_LENGTH:
+            raise InvalidNameError(f"Name {name} is longer than {NAME_LENGTH}")
+
+    def check_name(
+        self,
+        owner: UUID,
+        parent: UUID | None,
+        node_type: NodeType,
+        name: str,
+        id: UUID | None = None,
+    ) -> None:
+        "Raises if another live node of parent has name for node_type"
+        self.check_chars(name)
+        other = self.names.get((owner, parent, node_type, name))
+        if other is not None and other != id:
+            raise DuplicatedNameError(
+                f"Parent {parent} of user {owner} already has a {node_type}"
+                f" named {name}"
+            )
+
+    def siblings(self, owner: UUID, parent: UUID | None) -> dict[UUID, None]:
+        return self.roots[owner] if parent is None else self.nodes[parent].children
+
+    def key(self, node: MemoryNode) -> tuple[UUID, UUID | None, NodeType, str]:
+        return node.owner, node.parent, node.node_type, node.name
+
+    def ancestors(self, node: MemoryNode) -> Iterator[MemoryNode]:
+        "node and its ancestors up to the root"
+        while True:
+            yield node
+            if node.parent is None:
+                return
+            node = self.nodes[node.parent]
+
+    def path(self, node: MemoryNode) -> str:
+        return ".".join(reversed([n.name for n in self.ancestors(node)]))
+
+    def depth(self, node: MemoryNode) -> int:
+        return sum(1 for _ in self.ancestors(node)) - 1
+
+    def subtree(
+        self, node: MemoryNode, live: bool = True, max_depth: int | None = None
+    ) -> Iterator[tuple[int, str, MemoryNode]]:
+        """
+        (depth below node, path, node) of node and its descendants, shallowest first.
+        A live node has live ancestors only, so the trashed ones are pruned when live.
+        """
+        level = [(self.path(node), node)]
+        depth = 0
+        while level:
+            for path, n in level:
+                yield depth, path, n
+            if depth == max_depth:
+                return
+            level = [
+                (f"{path}.{c.name}", c)
+                for path, n in level
+                for c in map(self.nodes.__getitem__, n.children)
+                if not live or c.trashed is None
+            ]
+            depth += 1
+
+    def find(self, owner: UUID, path: str) -> list[MemoryNode]:
+        "The live nodes at path, one segment per name as no name holds a dot"
+        level: list[UUID | None] = [None]
+        for name in path.split("."):
+            level = [
+                id
+                for parent in level
+                for node_type in NODE_TYPES
+                if (id := self.names.get((owner, parent, node_type, name))) is not None
+            ]
+        return [self.nodes[id] for id in level if id is not None]
+
+    def add(
+        self, owner: UUID, parent: UUID | None, name: str, node_type: NodeType
+    ) -> UUID:
+        node = MemoryNode(uuid4(), owner, parent, name, node_type)
+        self.nodes[node.id] = node
+        self.siblings(owner, parent)[node.id] = None
+        self.names[self.key(node)] = node.id
+        self.counts[owner][node_type] += 1
+        return node.id
+
+    def hide(self, node: MemoryNode, trashed: UUID | None) -> None:
+        "Trash a live node under trashed, or restore a trashed one for None"
+        if trashed is None:
+            self.names[self.key(node)] = node.id
+        else:
+            del self.names[self.key(node)]
+        self.counts[node.owner][node.node_type] += 1 if trashed is None else -1
+        node.trashed = trashed
+
+    def drop(self, node: MemoryNode) -> int:
+        "Delete node with its whole subtree, returns how many rows went"
+        del self.siblings(node.owner, node.parent)[node.id]
+        dropped = 0
+        for _, _, n in self.subtree(node, live=False):
+            if n.trashed is None:
+                del self.names[self.key(n)]
+                self.counts[n.owner][n.node_type] -= 1
+            del self.nodes[n.id]
+            dropped += 1
+        return dropped
+
+    def relink(self, node: MemoryNode, parent: UUID | None) -> None:
+        "Move node under parent, its descendants follow"
+        del self.siblings(node.owner, node.parent)[node.id]
+        if node.trashed is None:
+            del self.names[self.key(node)]
+        node.parent = parent
+        self.siblings(node.owner, parent)[node.id] = None
+        if node.trashed is None:
+            self.names[self.key(node)] = node.id
+
+
+def clsr_len(tree: MemoryTree, owner: UUID) -> Any:
+    tree.owner_exist(owner)
+    return (sum(tree.counts[owner].values()),)
+
+
+def clsr_count_types(tree: MemoryTree, owner: UUID) -> dict[NodeType, int]:
+    "Live nodes of owner per node type, types with none are left out"
+    return {t: n for t, n in tree.counts.get(owner, {}).items() if n > 0}
+
+
+def clsr_select_counts(tree: MemoryTree, owner: UUID, id: UUID) -> NodeCounts:
+    "Counted by walking the subtree, there are no counters to keep"
+    descendants = items = 0
+    for depth, _, node in tree.subtree(tree.is_owner(owner, id)):
+        if depth > 0:
+            descendants += 1
+            items += int(node.node_type == "item")
+    return NodeCounts(descendants, items)
+
+
+def clsr_recount(tree: MemoryTree, owner: UUID) -> int:
+    "Rebuild the counters of owner, returns how many were wrong"
+    if owner not in tree.counts:
+        return 0
+    counted = dict.fromkeys(NODE_TYPES, 0)
+    for node in tree.nodes.values():
+        if node.owner == owner and node.trashed is None:
+            counted[node.node_type] += 1
+    wrong = sum(tree.counts[owner][t] != n for t, n in counted.items())
+    tree.counts[owner] = counted
+    return wrong
+
+
+def clsr_insert(
+    tree: MemoryTree, owner: UUID, parent: UUID | None, inode: Inode
+) -> Any:
+    tree.owner_exist(owner)
+    tree.check_hierarchy(owner, parent, inode.node_type)
+    # insert_node leaves the nodes of a template to closure_template.sql
+    if inode.template is not None:
+        return (None,)
+    tree.check_name(owner, parent, inode.node_type, inode.name)
+    return (tree.add(owner, parent, inode.name, inode.node_type),)
+
+
+def clsr_insert_many(
+    tree: MemoryTree,
+    owner: UUID,
+    parent: UUID | None,
+    inodes: Sequence[Inode],
+    parents: Sequence[int | None],
+) -> list[UUID]:
+    "parents[i] is the index of a previous entry in inodes, or None to attach to parent"
+    if len(inodes) != len(parents):
+        raise ValueError("Names, node types and parents must have the same length")
+    if any(p is not None and not 0 <= p < i for i, p in enumerate(parents)):
+        raise ValueError("Parent of a batch entry must be a previous entry")
+    if any(inode.template is not None for inode in inodes):
+        raise ValueError("clsr_insert_many takes no templates, see template.py")
+
+    tree.owner_exist(owner)
+    # with no entry to check the hierarchy of, parent is still checked
+    if not inodes:
+        if parent is not None:
+            tree.is_owner(owner, parent)
+        return []
+    for node_type in {
+        inode.node_type for inode, p in zip(inodes, parents, strict=True) if p is None
+    }:
+        tree.check_hierarchy(owner, parent, node_type)
+
+    # the whole batch is checked before the first node goes in, the names last
+    # as insert_nodes leaves them to idx_inode_sibling_name
+    for inode, p in zip(inodes, parents, strict=True):
+        if (
+            p is not None
+            and inode.node_type == "node"
+            and inodes[p].node_type != "node"
+        ):
+            raise HierarchyError("Node type node can't have a parent item")
+
+    # a name is keyed by the index of its parent entry inside the batch
+    names: set[tuple[int | None, NodeType, str]] = set()
+    for inode, p in zip(inodes, parents, strict=True):
+        if p is None:
+            tree.check_name(owner, parent, inode.node_type, inode.name)
+        else:
+            tree.check_chars(inode.name)
+        key = (p, inode.node_type, inode.name)
+        if key in names:
+            raise DuplicatedNameError(
+                f"Batch entry {p} already has a {inode.node_type} named {inode.name}"
+            )
+        names.add(key)
+
+    ids: list[UUID] = []
+    for inode, p in zip(inodes, parents, strict=True):
+        ids.append(
+            tree.add(
+                owner, parent if p is None else ids[p], inode.name, inode.node_type
+            )
+        )
+    return ids
+
+
+def clsr_insert_subtree(
+    tree: MemoryTree, owner: UUID, parent: UUID | None, trees: Sequence[InodeTree]
+) -> list[UUID]:
+    "trees are (inode, children) pairs; ids are returned in depth-first order"
+    return clsr_insert_many(tree, owner, parent, *flatten_trees(trees))
+
+
+def clsr_select_roots(tree: MemoryTree, owner: UUID) -> list[InodeRow]:
+    return [
+        node.row()
+        for node in map(tree.nodes.__getitem__, tree.roots.get(owner, {}))
+        if node.trashed is None
+    ]
+
+
+def clsr_select_root_byid(tree: MemoryTree, owner: UUID, id: UUID) -> InodeRow | None:
+    try:
+        node = tree.is_owner(owner, id)
+    except IdNotFoundError:
+        return None
+    *_, root = tree.ancestors(node)
+    return root.row()
+
+
+def clsr_get_path(tree: MemoryTree, owner: UUID, id: UUID) -> Any:
+    try:
+        return (tree.path(tree.is_owner(owner, id)),)
+    except IdNotFoundError:
+        return None
+
+
+def clsr_get_paths(
+    tree: MemoryTree, owner: UUID, ids: Sequence[UUID]
+) -> dict[UUID, str | IdNotFoundError]:
+    found: dict[UUID, str] = {}
+    for id in ids:
+        row = clsr_get_path(tree, owner, id)
+        if row is not None:
+            found[id] = row[0]
+    return ids_found(owner, ids, found)
+
+
+def clsr_select_bypath(
+    tree: MemoryTree, owner: UUID, root: str, names: list[str]
+) -> InodeRow:
+    found = [
+        node
+        for node in tree.find(owner, ".".join([root, *names]))
+        if tree.depth(node) == len(names)
+    ]
+    if not found:
+        raise IdNotFoundError(f"Error on select by path. Root {root}, Names {names}")
+    return min(found, key=lambda n: NODE_TYPES.index(n.node_type)).row()
+
+
+def clsr_select_bypaths(
+    tree: MemoryTree, owner: UUID, paths: Sequence[str]
+) -> dict[str, UUID | IdNotFoundError]:
+    "paths are dotted, as returned by clsr_get_path"
+    rows: list[tuple[str, UUID | None]] = []
+    for path in paths:
+        found = tree.find(owner, path)
+        first = min(found, key=lambda n: NODE_TYPES.index(n.node_type), default=None)
+        rows.append((path, None if first is None else first.id))
+    return paths_found(owner, rows)
+
+
+def clsr_select_bypattern(
+    tree: MemoryTree, owner: UUID, pattern: str, batch_size: int = 1000
+) -> Generator[Any, None, None]:
+    "Matches in path order, see pattern_to_regex for the syntax"
+    prefix, regex, min_depth, max_depth = pattern_to_regex(pattern)
+    match = re.compile(regex).search
+    rows: list[PathRow] = []
+    # a subtree is read only if its paths may start with prefix, as in the
+    # path range of select_bypattern
+    stack = [
+        (0, node.name, node)
+        for node in map(tree.nodes.__getitem__, tree.roots.get(owner, {}))
+    ]
+    while stack:
+        depth, path, node = stack.pop()
+        if node.trashed is not None:
+            continue
+        if not (path.startswith(prefix) or prefix.startswith(path)):
+            continue
+        if depth >= min_depth and (max_depth is None or depth <= max_depth):
+            if match(path):
+                rows.append(
+                    PathRow(node.id, node.name, path, node.template, node.node_type)
+                )
+        stack.extend(
+            (depth + 1, f"{path}.{c.name}", c)
+            for c in map(tree.nodes.__getitem__, node.children)
+        )
+    rows.sort(key=lambda row: row.path)
+    yield from rows
+
+
+def clsr_select_byid(tree: MemoryTree, owner: UUID, id: UUID) -> InodeRow:
+    return tree.is_owner(owner, id).row()
+
+
+def clsr_select_byids(
+    tree: MemoryTree, owner: UUID, ids: Sequence[UUID]
+) -> dict[UUID, InodeRow | IdNotFoundError]:
+    found: dict[UUID, InodeRow] = {}
+    for id in ids:
+        node = tree.nodes.get(id)
+        if node is not None and node.owner == owner and node.trashed is None:
+            found[id] = node.row()
+    return ids_found(owner, ids, found)
+
+
+def live_children(tree: MemoryTree, owner: UUID, id: UUID) -> list[MemoryNode]:
+    "The live children of id, raising for a missing id only once none are found"
+    node = tree.nodes.get(id)
+    children = (
+        [c for c in map(tree.nodes.__getitem__, node.children) if c.trashed is None]
+        if node is not None and node.owner == owner and node.trashed is None
+        else []
+    )
+    if not children:
+        tree.is_owner(owner, id)
+    return children
+
+
+def clsr_select_children(tree: MemoryTree, owner: UUID, id: UUID) -> list[InodeRow]:
+    return [c.row() for c in live_children(tree, owner, id)]
+
+
+def clsr_select_children_page(
+    tree: MemoryTree,
+    owner: UUID,
+    id: UUID,
+    after: str | None = None,
+    limit: int | None = None,
+) -> Page:
+    "A Page of the children in path order, after the token of the previous one"
+    children = live_children(tree, owner, id)
+    path, after_id = decode_after(after, 2)
+    prefix = tree.path(tree.nodes[id]) + "."
+    rows = sorted(
+        (prefix + c.name, c.id, c.name, c.template, c.node_type) for c in children
+    )
+    key = (path or "", after_id or NO_ID)
+    rows = [row for row in rows if (row[0], str(row[1])) > key][:limit]
+    return child_page(rows, limit)
+
+
+def descendant_rows(
+    tree: MemoryTree, owner: UUID, id: UUID
+) -> list[tuple[int, str, MemoryNode]]:
+    "(depth below id, path, node) of the live descendants of id, shallowest first"
+    return list(tree.subtree(tree.is_owner(owner, id)))[1:]
+
+
+def clsr_select_descendants(
+    tree: MemoryTree, owner: UUID, id: UUID
+) -> list[DescendantRow]:
+    return [
+        DescendantRow(n.parent, n.id, n.name, n.template, n.node_type)  # type: ignore
+        for _, _, n in descendant_rows(tree, owner, id)
+    ]
+
+
+def clsr_select_descendants_page(
+    tree: MemoryTree,
+    owner: UUID,
+    id: UUID,
+    after: str | None = None,
+    limit: int | None = None,
+) -> Page:
+    "A Page of the descendants in (depth, path) order, see clsr_select_children_page"
+    rows = descendant_rows(tree, owner, id)
+    depth, path, after_id = decode_after(after, 3)
+    # the keyset holds the depth of the rows from their root
+    base = tree.depth(tree.nodes[id])
+    key = (base + 1 if depth is None else depth, path or "", after_id or NO_ID)
+    page = sorted(
+        (
+            (base + d, p, n.parent, n.id, n.name, n.template, n.node_type)
+            for d, p, n in rows
+            if (base + d, p, str(n.id)) > key
+        ),
+        key=lambda row: (row[0], row[1], row[3]),
+    )
+    return descendant_page(page[:limit], limit)
+
+
+def clsr_select_children_wpath(
+    tree: MemoryTree, owner: UUID, id: UUID
+) -> list[PathRow]:
+    children = live_children(tree, owner, id)
+    prefix = tree.path(tree.nodes[id]) + "." if children else ""
+    return [
+        PathRow(c.id, c.name, prefix + c.name, c.template, c.node_type)
+        for c in children
+    ]
+
+
+def clsr_select_descendants_wpath(
+    tree: MemoryTree, owner: UUID, id: UUID
+) -> list[DescendantPathRow]:
+    return [
+        DescendantPathRow(n.parent, n.id, n.name, p, n.template, n.node_type)  # type: ignore
+        for _, p, n in descendant_rows(tree, owner, id)
+    ]
+
+
+def to_json(node: MemoryNode) -> dict[str, Any]:
+    "The jsonb_build_object of a row, uuids come back from Postgres as text"
+    return {
+        "id": str(node.id),
+        "name": node.name,
+        "template": node.template and str(node.template),
+        "node_type": node.node_type,
+    }
+
+
+def clsr_select_children_json(tree: MemoryTree, owner: UUID, id: UUID) -> Any:
+    return ([to_json(c) for c in live_children(tree, owner, id)] or None,)
+
+
+def clsr_select_descendants_json(tree: MemoryTree, owner: UUID, id: UUID) -> Any:
+    rows = [
+        {"parent_id": str(n.parent), **to_json(n)}
+        for _, _, n in descendant_rows(tree, owner, id)
+    ]
+    return (rows or None,)
+
+
+def clsr_select_subtree_json(
+    tree: MemoryTree,
+    owner: UUID,
+    id: UUID,
+    max_depth: int | None = None,
+    with_items: bool = False,
+) -> Any:
+    "id with nested children lists down to max_depth levels below it"
+    if max_depth is not None and max_depth < 0:
+        raise ValueError(f"max_depth {max_depth} is negative")
+    # no item rows are kept here, with_items has nothing to add
+    rows = list(tree.subtree(tree.is_owner(owner, id), max_depth=max_depth))
+    # bottom up, as select_subtree_nested_json builds it
+    below: dict[UUID | None, list[dict[str, Any]]] = {}
+    for depth, _, node in reversed(rows):
+        entry = to_json(node)
+        if depth != max_depth:
+            children = below.pop(node.id, [])
+            children.sort(key=lambda c: c["name"])
+            entry["children"] = children
+        below.setdefault(node.parent, []).append(entry)
+    return (entry,)
+
+
+def iter_descendants(
+    tree: MemoryTree,
+    owner: UUID,
+    id: UUID,
+    order: Literal["depth", "path"] = "depth",
+    batch_size: int = 1000,
+    with_path: bool = False,
+) -> Generator[Any, None, None]:
+    "Yields (parent, id, name, [path,] template, node_type) rows of the subtree"
+    rows = descendant_rows(tree, owner, id)
+    rows.sort(key=(lambda r: r[:2]) if order == "depth" else (lambda r: r[1]))
+    for _, path, n in rows:
+        if with_path:
+            yield DescendantPathRow(
+                n.parent, n.id, n.name, path, n.template, n.node_type  # type: ignore
+            )
+        else:
+            yield DescendantRow(n.parent, n.id, n.name, n.template, n.node_type)  # type: ignore
+
+
+def iter_descendants_wpath(
+    tree: MemoryTree,
+    owner: UUID,
+    id: UUID,
+    order: Literal["depth", "path"] = "depth",
+    batch_size: int = 1000,
+) -> Generator[Any, None, None]:
+    yield from iter_descendants(tree, owner, id, order, batch_size, with_path=True)
+
+
+def clsr_rename(tree: MemoryTree, owner: UUID, id: UUID, name: str) -> Any:
+    node = tree.is_owner(owner, id)
+    tree.check_name(owner, node.parent, node.node_type, name, id)
+    del tree.names[tree.key(node)]
+    node.name = name
+    tree.names[tree.key(node)] = id
+    # the rows whose path changed, trashed ones too
+    return (sum(1 for _ in tree.subtree(node, live=False)),)
+
+
+def clsr_move(tree: MemoryTree, owner: UUID, id: UUID, parent: UUID | None) -> Any:
+    node = tree.is_owner(owner, id)
+    tree.check_hierarchy(owner, parent, node.node_type)
+    if parent is not None and any(
+        n.id == id for n in tree.ancestors(tree.nodes[parent])
+    ):
+        raise HierarchyError(
+            f"Node {id} can't be moved under its own subtree node {parent}"
+        )
+    tree.check_name(owner, parent, node.node_type, node.name, id)
+    tree.relink(node, parent)
+    return (sum(1 for _ in tree.subtree(node, live=False)),)
+
+
+def clsr_delete_node(tree: MemoryTree, owner: UUID, id: UUID) -> Any:
+    node = tree.is_owner(owner, id)
+    children = list(map(tree.nodes.__getitem__, node.children))
+
+    # children are promoted and may clash with a sibling of the deleted node,
+    # not with the deleted node itself
+    for child in children:
+        if child.trashed is None:
+            tree.check_name(owner, node.parent, child.node_type, child.name, id)
+
+    # trashed as delete_node does, so its name is free for a child
+    tree.hide(node, id)
+    for child in children:
+        tree.relink(child, node.parent)
+    return (tree.drop(node),)
+
+
+def clsr_delete_descendants(tree: MemoryTree, owner: UUID, id: UUID) -> Any:
+    return (tree.drop(tree.is_owner(owner, id)),)
+
+
+def clsr_delete_many(
+    tree: MemoryTree, owner: UUID, ids: Sequence[UUID]
+) -> dict[UUID, int]:
+    "Delete the subtrees of ids, counting each node once for its closest listed id"
+    targets = dict.fromkeys(ids, 0)
+    for id in targets:
+        # trashed ids are deleted as well
+        node = tree.nodes.get(id)
+        if node is None or node.owner != owner:
+            raise IdNotFoundError(f"ID {id}, is not owned by {owner}")
+
+    tops = [
+        tree.nodes[id]
+        for id in targets
+        if not any(
+            n.id in targets for n in tree.ancestors(tree.nodes[id]) if n.id != id
+        )
+    ]
+    for top in tops:
+        stack = [(top, top.id)]
+        while stack:
+            node, target = stack.pop()
+            target = node.id if node.id in targets else target
+            targets[target] += 1
+            stack.extend((tree.nodes[c], target) for c in node.children)
+
+    for top in tops:
+        tree.drop(top)
+    return targets
+
+
+def clsr_trash_descendants(tree: MemoryTree, owner: UUID, id: UUID) -> Any:
+    "Hide the subtree of id until clsr_restore or clsr_purge"
+    rows = list(tree.subtree(tree.is_owner(owner, id)))
+    for _, _, node in rows:
+        tree.hide(node, id)
+    return (len(rows),)
+
+
+def clsr_restore(tree: MemoryTree, owner: UUID, id: UUID) -> Any:
+    node = tree.nodes.get(id)
+    if node is None or node.owner != owner or node.trashed != id:
+        raise IdNotFoundError(f"ID {id}, is not a trashed subtree of {owner}")
+
+    # the parent has to be restored first
+    if node.parent is not None:
+        tree.is_owner(owner, node.parent)
+    # the name of the subtree root may have been reused meanwhile
+    tree.check_name(owner, node.parent, node.node_type, node.name)
+
+    # rows trashed before id was keep their own subtree root
+    rows = [n for _, _, n in tree.subtree(node, live=False) if n.trashed == id]
+    for n in rows:
+        tree.hide(n, None)
+    return (len(rows),)
+
+
+def clsr_purge(tree: MemoryTree, chunk: int = 1000) -> int:
+    "Delete the trashed rows of every owner, chunk is there for closure.py parity"
+    # the children of a trashed row are trashed, so each trashed subtree goes
+    # whole from its topmost trashed row
+    tops = [
+        node
+        for node in tree.nodes.values()
+        if node.trashed is not None
+        and (node.parent is None or tree.nodes[node.parent].trashed is None)
+    ]
+    return sum(tree.drop(node) for node in tops)
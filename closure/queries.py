@@ -0,0 +1,100 @@
+# SQL of the clsr_* and tmplt_* functions, shared by the sync modules
+# (closure.py, template.py) and the async ones (aclosure.py, atemplate.py)
+
+LEN = "SELECT clsr_len(%s);"
+
+COUNT_TYPES = "SELECT node_type_, nodes_ FROM select_owner_counts(%s);"
+
+SELECT_COUNTS = "SELECT * FROM select_counts(%s, %s)"
+
+RECOUNT = "SELECT recount_nodes(%s);"
+
+IS_OWNER = "CALL is_owner(%s, %s);"
+
+INSERT = "SELECT insert_node(%s, %s, %s, %s, %s);"
+
+INSERT_MANY = """
+    SELECT id_ FROM insert_nodes(
+        %s, %s, %s::TEXT[], %s::NODETYPE[], %s::INTEGER[]
+    ) ORDER BY ord_;
+"""
+
+SELECT_ROOTS = "SELECT * FROM select_roots(%s)"
+
+SELECT_ROOT_BYID = "SELECT * FROM select_root_byid(%s, %s)"
+
+GET_PATH = "SELECT path FROM inode WHERE id = %s AND owner = %s AND trashed IS NULL;"
+
+GET_PATHS = """
+    SELECT id, path FROM inode
+        WHERE id = ANY(%s::UUID[]) AND owner = %s AND trashed IS NULL;
+"""
+
+SELECT_BYPATH = "SELECT * FROM select_child_bypath(%s, %s, %s)"
+
+SELECT_BYPATHS = "SELECT path_, id_ FROM select_bypaths(%s, %s::TEXT[]);"
+
+SELECT_BYPATTERN = "SELECT * FROM select_bypattern(%s, %s, %s, %s, %s);"
+
+SELECT_BYID = "SELECT * FROM select_byid(%s, %s)"
+
+SELECT_BYIDS = "SELECT * FROM select_byids(%s::UUID[], %s)"
+
+SELECT_CHILDREN = "SELECT * FROM select_child(%s, %s);"
+
+SELECT_CHILD_PAGE = "SELECT * FROM select_child_page(%s, %s, %s, %s, %s);"
+
+SELECT_DESCENDANTS = "SELECT * FROM select_descendants(%s, %s);"
+
+SELECT_DESCENDANTS_PAGE = (
+    "SELECT * FROM select_descendants_page(%s, %s, %s, %s, %s, %s);"
+)
+
+SELECT_CHILDREN_WPATH = "SELECT * FROM select_child_path(%s, %s);"
+
+SELECT_DESCENDANTS_WPATH = "SELECT * FROM select_descendants_path(%s, %s);"
+
+SELECT_CHILDREN_JSON = "SELECT select_children_json(%s, %s);"
+
+SELECT_DESCENDANTS_JSON = "SELECT select_descendants_json(%s, %s);"
+
+SELECT_SUBTREE_JSON = "SELECT select_subtree_nested_json(%s, %s, %s, %s);"
+
+# the subtree read through descendant_rows, inlined so the ORDER BY and the
+# path range below reach the indexes: a set returning plpgsql function would
+# build its whole result on the server before the first row is fetched
+ITER_DESCENDANTS = """
+    SELECT d.parent, d.id, d.name, {path}d.template, d.node_type
+        FROM descendant_rows(%(id)s, %(owner)s) d
+"""
+
+# by path the rows come in idx_inode_path order, with no sort on the server
+ORDER_BY = {
+    "depth": "ORDER BY d.depth, d.path",
+    "path": """
+        WHERE d.path > (
+            SELECT r.path FROM inode r WHERE r.id = %(id)s AND r.owner = %(owner)s
+        ) || '.'
+        AND d.path < (
+            SELECT r.path FROM inode r WHERE r.id = %(id)s AND r.owner = %(owner)s
+        ) || '/'
+        ORDER BY d.path""",
+}
+
+RENAME = "SELECT rename_node(%s, %s, %s);"
+
+MOVE = "SELECT move_node(%s, %s, %s);"
+
+DELETE_NODE = "SELECT delete_node(%s, %s);"
+
+DELETE_DESCENDANTS = "SELECT delete_descendants(%s, %s);"
+
+DELETE_MANY = "SELECT id_, deleted_ FROM delete_nodes(%s, %s::UUID[]);"
+
+TRASH_DESCENDANTS = "SELECT trash_descendants(%s, %s);"
+
+RESTORE = "SELECT restore_node(%s, %s);"
+
+PURGE = "SELECT purge_trash(%s);"
+
+ADD_TEMPLATE = "SELECT template.add_template(%s, %s)"
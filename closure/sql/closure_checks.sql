@@ -30,8 +30,10 @@ BEGIN
         FROM inode n
         WHERE n.owner = p_owner
         AND n.id = p_id
+        AND n.trashed IS NULL
     ) THEN
-        RAISE EXCEPTION 'ID %, is not owned by %', p_id, p_owner;
+        RAISE EXCEPTION 'ID %, is not owned by %', p_id, p_owner
+            USING ERRCODE = 'no_data_found';
     END IF;
 END;
 $$;
@@ -45,16 +47,18 @@ CREATE OR REPLACE PROCEDURE has_similar_root(
 LANGUAGE plpgsql
 AS $$
 BEGIN
+    -- probes idx_inode_sibling_name, the index that enforces the rule
     IF EXISTS (
-        SELECT 1 
+        SELECT 1
             FROM inode n
-            JOIN link t ON (n.id = t.child)
             WHERE n.owner = p_owner
-            AND n.name = p_name
+            AND n.parent IS NULL
             AND n.node_type = p_node_type
-            GROUP BY t.child HAVING COUNT(t.child) = 1
+            AND n.name = p_name
+            AND n.trashed IS NULL
     ) THEN
-        RAISE EXCEPTION 'Root %s named % already exists for user %', p_node_type, p_name, p_owner;
+        RAISE EXCEPTION 'Root %s named % already exists for user %', p_node_type, p_name, p_owner
+            USING ERRCODE = 'unique_violation';
     END IF;
 END;
 $$;
@@ -71,14 +75,14 @@ BEGIN
     IF EXISTS (
         SELECT 1
         FROM inode n
-        JOIN link t ON n.id = t.child
-        WHERE t.parent = p_parent
-        AND t.depth = 1
-        AND n.name = p_name
+        WHERE n.owner = p_owner
+        AND n.parent = p_parent
         AND n.node_type = p_node_type
-        AND n.owner = p_owner
+        AND n.name = p_name
+        AND n.trashed IS NULL
     ) THEN
-        RAISE EXCEPTION 'Given parent node for user %, already has a % child named %', p_owner, p_node_type, p_name;
+        RAISE EXCEPTION 'Given parent node for user %, already has a % child named %', p_owner, p_node_type, p_name
+            USING ERRCODE = 'unique_violation';
     END IF;
 END;
 $$;
@@ -116,7 +120,8 @@ BEGIN
     -- root should be "node" only
     IF p_parent IS NULL THEN
         IF p_node_type <> 'node' THEN
-            RAISE EXCEPTION 'Root Element cannot be %', p_node_type;
+            RAISE EXCEPTION 'Root Element cannot be %', p_node_type
+                USING ERRCODE = 'integrity_constraint_violation';
         ELSE
             RETURN;
         END IF;
@@ -126,10 +131,12 @@ BEGIN
     INTO v_parent_type
     WHERE  n.id = p_parent
     AND n.owner = p_owner
+    AND n.trashed IS NULL
     ;
 
     IF v_parent_type IS NULL THEN
-        RAISE EXCEPTION 'Parent %s not found for owner %s', p_parent, p_owner;
+        RAISE EXCEPTION 'Parent %s not found for owner %s', p_parent, p_owner
+            USING ERRCODE = 'no_data_found';
     END IF;
 
     IF 
@@ -137,7 +144,8 @@ BEGIN
         -- OR
         -- p_node_type = 'item' AND (v_parent_type <> 'node' OR v_parent_type <> 'item')
      THEN
-        RAISE EXCEPTION 'Node type % can´t have a parent %s', p_node_type,  v_parent_type;
+        RAISE EXCEPTION 'Node type % can´t have a parent %s', p_node_type,  v_parent_type
+            USING ERRCODE = 'integrity_constraint_violation';
     END IF;
 END;
 $$;
@@ -0,0 +1,173 @@
+-- what closure_tables.sql and closure_tables_partitioned.sql share, loaded
+-- after either
+
+CREATE INDEX idx_inode_owner ON inode (owner);
+-- children in keyset order, see select_child_page
+CREATE INDEX idx_inode_parent ON inode (parent, path, id);
+CREATE INDEX idx_inode_roots ON inode (owner, name) WHERE parent IS NULL AND trashed IS NULL;
+CREATE INDEX idx_inode_trashed ON inode (depth DESC) WHERE trashed IS NOT NULL;
+CREATE INDEX idx_inode_path ON inode (owner, path);
+-- a level of a subtree in keyset order, see select_descendants_page
+CREATE INDEX idx_inode_depth_path ON inode (owner, depth, path, id);
+
+-- no duplicated name for the same type and parent (NULL parent for roots),
+-- trashed rows give their name away
+CREATE UNIQUE INDEX idx_inode_sibling_name
+    ON inode (owner, parent, node_type, name) NULLS NOT DISTINCT
+    WHERE trashed IS NULL;
+
+CREATE OR REPLACE FUNCTION update_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER set_updated_at
+BEFORE UPDATE ON inode
+FOR EACH ROW
+EXECUTE FUNCTION update_updated_at();
+
+-- one notification per owner and statement for the caches of closure/cache.py,
+-- with the changed ids or, past what a payload holds, the owner alone.
+-- Every statement writing link also rewrites the inode rows of the nodes
+-- it relinks, so link needs no trigger of its own. Inserted ids are not
+-- cached yet, their owner is sent with no ids: a path looked up before may
+-- find one of them now
+CREATE OR REPLACE FUNCTION notify_inode_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_owner UUID;
+    v_ids UUID[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        FOR v_owner IN SELECT DISTINCT n.owner FROM new_rows n LOOP
+            PERFORM pg_notify('inode_changes', json_build_object(
+                'owner', v_owner, 'ids', '{}'::UUID[]
+            )::TEXT);
+        END LOOP;
+        RETURN NULL;
+    END IF;
+
+    FOR v_owner, v_ids IN
+        SELECT o.owner, array_agg(o.id) FROM old_rows o GROUP BY o.owner
+    LOOP
+        PERFORM pg_notify('inode_changes', CASE
+            WHEN cardinality(v_ids) > 150 THEN json_build_object('owner', v_owner)
+            ELSE json_build_object('owner', v_owner, 'ids', v_ids)
+        END::TEXT);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER notify_inode_inserts
+AFTER INSERT ON inode
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_inode_changes();
+
+CREATE TRIGGER notify_inode_updates
+AFTER UPDATE ON inode
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_inode_changes();
+
+CREATE TRIGGER notify_inode_deletes
+AFTER DELETE ON inode
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_inode_changes();
+
+CREATE INDEX idx_link_child ON link (child, depth);
+
+-- live (not trashed) nodes of an owner per type, for clsr_len
+CREATE TABLE owner_counts (
+    owner uuid NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    node_type NODETYPE NOT NULL,
+    nodes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (owner, node_type)
+);
+
+-- every write of inode moves owner_counts, whatever function or statement
+-- made it. Deletes and trash updates only find rows an insert created, and
+-- leave alone the owners deleted by the users cascade
+CREATE OR REPLACE FUNCTION count_inode_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO owner_counts AS c (owner, node_type, nodes)
+        SELECT n.owner, n.node_type, count(*)
+        FROM new_rows n
+        WHERE n.trashed IS NULL
+        GROUP BY n.owner, n.node_type
+        ON CONFLICT (owner, node_type) DO UPDATE SET nodes = c.nodes + EXCLUDED.nodes;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE owner_counts c
+        SET nodes = c.nodes - x.nodes
+        FROM (
+            SELECT o.owner, o.node_type, count(*) AS nodes
+            FROM old_rows o
+            WHERE o.trashed IS NULL
+            GROUP BY o.owner, o.node_type
+        ) x
+        WHERE c.owner = x.owner
+        AND c.node_type = x.node_type;
+    ELSE
+        UPDATE owner_counts c
+        SET nodes = c.nodes + x.nodes
+        FROM (
+            SELECT d.owner, d.node_type, sum(d.nodes) AS nodes
+            FROM (
+                SELECT o.owner, o.node_type, -1 AS nodes
+                FROM old_rows o
+                WHERE o.trashed IS NULL
+                UNION ALL
+                SELECT n.owner, n.node_type, 1
+                FROM new_rows n
+                WHERE n.trashed IS NULL
+            ) d
+            GROUP BY d.owner, d.node_type
+            HAVING sum(d.nodes) <> 0
+        ) x
+        WHERE c.owner = x.owner
+        AND c.node_type = x.node_type;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER count_inode_inserts
+AFTER INSERT ON inode
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION count_inode_changes();
+
+CREATE TRIGGER count_inode_updates
+AFTER UPDATE ON inode
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION count_inode_changes();
+
+CREATE TRIGGER count_inode_deletes
+AFTER DELETE ON inode
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION count_inode_changes();
+
+-- rows streamed by COPY before load_nodes turns them into inode and link rows
+CREATE UNLOGGED TABLE inode_stage (
+    load_id uuid NOT NULL,
+    key TEXT NOT NULL,
+    parent_key TEXT,
+    name VARCHAR(64) NOT NULL,
+    node_type NODETYPE NOT NULL,
+    id uuid,
+    parent_id uuid,
+    level INTEGER,
+    path TEXT,
+    PRIMARY KEY (load_id, key)
+);
+
+CREATE INDEX idx_inode_stage_level ON inode_stage (load_id, level);
@@ -0,0 +1,189 @@
+-- node_counts is kept by the functions that write link, which know the
+-- ancestors a change reaches; owner_counts by the triggers of
+-- closure_common.sql. Both are read in constant time by clsr_len,
+-- select_owner_counts and select_counts
+
+-- writers of an owner take turns from here to their commit: a counter
+-- update reads other counters first, and would add on stale ones next to a
+-- concurrent writer. FOR NO KEY UPDATE still lets the inode foreign key
+-- checks share the users row
+CREATE OR REPLACE PROCEDURE lock_counts(
+    p_owner UUID
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM 1 FROM users u WHERE u.id = p_owner FOR NO KEY UPDATE;
+END;
+$$;
+
+-- p_parent and its ancestors get p_nodes more descendants, p_items of them
+-- items; the counters of the inserted nodes are the caller's
+CREATE OR REPLACE PROCEDURE count_inserted(
+    p_parent UUID,
+    p_owner UUID,
+    p_nodes INTEGER,
+    p_items INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE node_counts c
+    SET descendants = c.descendants + p_nodes,
+        items = c.items + p_items
+    FROM link t
+    WHERE t.owner = p_owner
+    AND t.child = p_parent
+    AND c.owner = p_owner
+    AND c.id = t.parent;
+END;
+$$;
+
+-- adds p_sign times the subtree of p_id, as its own counter has it, to the
+-- ancestors sharing its trashed value. Called while the subtree is linked
+-- and p_id live: before a trash, a delete or a move, after a restore or
+-- the relink of a move
+CREATE OR REPLACE PROCEDURE count_subtree(
+    p_id UUID,
+    p_owner UUID,
+    p_sign INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_trashed UUID;
+    v_nodes INTEGER;
+    v_items INTEGER;
+BEGIN
+    SELECT n.trashed, c.descendants + 1, c.items + (n.node_type = 'item')::INTEGER
+    INTO v_trashed, v_nodes, v_items
+    FROM inode n
+    JOIN node_counts c ON (c.owner = p_owner AND c.id = n.id)
+    WHERE n.owner = p_owner
+    AND n.id = p_id;
+
+    UPDATE node_counts c
+    SET descendants = c.descendants + p_sign * v_nodes,
+        items = c.items + p_sign * v_items
+    FROM link t, inode a
+    WHERE t.owner = p_owner
+    AND t.child = p_id
+    AND t.depth > 0
+    AND a.owner = p_owner
+    AND a.id = t.parent
+    AND a.trashed IS NOT DISTINCT FROM v_trashed
+    AND c.owner = p_owner
+    AND c.id = t.parent;
+END;
+$$;
+
+-- live nodes of p_owner for each node type, none for an unknown owner
+CREATE OR REPLACE FUNCTION select_owner_counts(
+    p_owner UUID
+)
+RETURNS TABLE (node_type_ NODETYPE, nodes_ INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT c.node_type, c.nodes
+    FROM owner_counts c
+    WHERE c.owner = p_owner
+    AND c.nodes > 0
+    ORDER BY c.node_type;
+$$;
+
+-- live descendants of p_id and the items among them, no row when p_id is
+-- missing, trashed or not of p_owner
+CREATE OR REPLACE FUNCTION select_counts(
+    p_id UUID,
+    p_owner UUID
+)
+RETURNS TABLE (descendants_ INTEGER, items_ INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT c.descendants, c.items
+    FROM node_counts c
+    JOIN inode n ON (n.owner = p_owner AND n.id = c.id)
+    WHERE c.owner = p_owner
+    AND c.id = p_id
+    AND n.trashed IS NULL;
+$$;
+
+-- counts p_owner again from inode and link and rewrites the counters that
+-- differ, for a schema loaded over existing rows or to check the ones kept.
+-- Returns how many counters were wrong
+CREATE OR REPLACE FUNCTION recount_nodes(
+    p_owner UUID
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_wrong INTEGER;
+    v_count INTEGER;
+BEGIN
+
+    CALL lock_counts(p_owner);
+
+    -- a node counts itself, through its depth 0 link
+    WITH counted AS (
+        SELECT
+            n.id,
+            (count(*) - 1)::INTEGER AS descendants,
+            (count(*) FILTER (WHERE t.depth > 0 AND c.node_type = 'item'))::INTEGER AS items
+        FROM inode n
+        JOIN link t ON (t.owner = p_owner AND t.parent = n.id)
+        JOIN inode c ON (c.owner = p_owner AND c.id = t.child)
+        WHERE n.owner = p_owner
+        AND c.trashed IS NOT DISTINCT FROM n.trashed
+        GROUP BY n.id
+    ), fixed AS (
+        UPDATE node_counts c
+        SET descendants = k.descendants, items = k.items
+        FROM counted k
+        WHERE c.owner = p_owner
+        AND c.id = k.id
+        AND (c.descendants <> k.descendants OR c.items <> k.items)
+        RETURNING c.id
+    ), added AS (
+        INSERT INTO node_counts (id, owner, descendants, items)
+        SELECT k.id, p_owner, k.descendants, k.items
+        FROM counted k
+        WHERE NOT EXISTS (
+            SELECT 1 FROM node_counts c WHERE c.owner = p_owner AND c.id = k.id
+        )
+        RETURNING id
+    )
+    SELECT (SELECT count(*) FROM fixed) + (SELECT count(*) FROM added) INTO v_wrong;
+
+    SELECT count(*) INTO v_count
+    FROM (
+        SELECT n.node_type, count(*)::INTEGER AS nodes
+        FROM inode n
+        WHERE n.owner = p_owner
+        AND n.trashed IS NULL
+        GROUP BY n.node_type
+    ) l
+    FULL JOIN (
+        SELECT c.node_type, c.nodes
+        FROM owner_counts c
+        WHERE c.owner = p_owner
+        AND c.nodes <> 0
+    ) c USING (node_type)
+    WHERE l.nodes IS DISTINCT FROM c.nodes;
+
+    IF v_count > 0 THEN
+        DELETE FROM owner_counts c WHERE c.owner = p_owner;
+
+        INSERT INTO owner_counts (owner, node_type, nodes)
+        SELECT p_owner, n.node_type, count(*)
+        FROM inode n
+        WHERE n.owner = p_owner
+        AND n.trashed IS NULL
+        GROUP BY n.node_type;
+    END IF;
+
+    RETURN v_wrong + v_count;
+END;
+$$;
@@ -9,15 +9,19 @@ DECLARE
     v_deleted_count INTEGER;
 BEGIN
     
+    CALL lock_counts(p_owner);
+
     -- IF parent does not has same owner, raises
     CALL is_owner(p_id, p_owner);
 
+    CALL count_subtree(p_id, p_owner, -1);
 
-    DELETE FROM inode n WHERE n.id IN
-        (
-        SELECT DISTINCT t.child FROM link t
-            WHERE t.parent = p_id
-        );
+    DELETE FROM inode n
+    USING link t
+    WHERE t.owner = p_owner
+    AND t.parent = p_id
+    AND n.owner = p_owner
+    AND n.id = t.child;
         -- Get the number of rows deleted
     GET DIAGNOSTICS v_deleted_count = ROW_COUNT;
 
@@ -36,41 +40,266 @@ AS $$
 DECLARE
     v_deleted_count INTEGER;
 BEGIN
-    
+
+    CALL lock_counts(p_owner);
+
     CALL is_owner(p_id, p_owner);
--- Create a temporary table to store child nodes and their depths
-    CREATE TEMP TABLE temp_rows (
-        tgt UUID,
-        dep INTEGER
-    );
 
-    -- Populate the temporary table with child nodes and their depths
-    INSERT INTO temp_rows (tgt, dep)
-    SELECT t.child AS tgt, t.depth AS dep
-    FROM link t
-    WHERE t.parent = p_id
-      AND t.depth > 0;
+    -- The ancestors lose the node alone, its descendants stay below them
+    UPDATE node_counts c
+    SET descendants = c.descendants - 1,
+        items = c.items - (d.node_type = 'item')::INTEGER
+    FROM link t, inode d
+    WHERE t.owner = p_owner
+    AND t.child = p_id
+    AND t.depth > 0
+    AND d.owner = p_owner
+    AND d.id = p_id
+    AND c.owner = p_owner
+    AND c.id = t.parent;
+
+    -- Out of idx_inode_sibling_name before its children take its place, one
+    -- may share its name. The trashed row is counted out of owner_counts here
+    -- and left alone by the DELETE below
+    UPDATE inode SET trashed = p_id WHERE id = p_id AND owner = p_owner;
+
+    -- Descendants move one level up, children to the parent of the deleted node,
+    -- and the deleted name is cut out of their paths
+    UPDATE inode n
+    SET depth = n.depth - 1,
+        parent = CASE WHEN n.parent = p_id THEN d.parent ELSE n.parent END,
+        path = left(d.path, length(d.path) - length(d.name))
+            || substr(n.path, length(d.path) + 2)
+    FROM link t, inode d
+    WHERE t.owner = p_owner
+    AND t.parent = p_id
+    AND t.depth > 0
+    AND n.owner = p_owner
+    AND n.id = t.child
+    AND d.owner = p_owner
+    AND d.id = p_id;
 
-    -- Delete the node from the inode table
-    DELETE FROM inode WHERE id = p_id;
+    -- Links from the descendants to the ancestors of the deleted node get
+    -- one level shorter, d.depth being the distance to the deleted node
+    UPDATE link l
+    SET depth = l.depth - 1
+    FROM link d
+    WHERE d.owner = p_owner
+    AND d.parent = p_id
+    AND d.depth > 0
+    AND l.owner = p_owner
+    AND l.child = d.child
+    AND l.depth > d.depth;
+
+    -- Delete the node from the inode table, its links cascade
+    DELETE FROM inode WHERE id = p_id AND owner = p_owner;
 
     -- Get the count of rows affected by the DELETE statement
     GET DIAGNOSTICS v_deleted_count = ROW_COUNT;
 
-    -- Update the depth of child nodes based on the temporary table
-    UPDATE link
-    SET depth = depth - 1
-    WHERE child IN (
-        SELECT tgt FROM temp_rows
+    RETURN v_deleted_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION delete_nodes(
+    p_owner UUID,
+    p_ids UUID[]
+)
+RETURNS TABLE(id_ UUID, deleted_ INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_id UUID;
+BEGIN
+
+    CALL lock_counts(p_owner);
+
+    SELECT i.id INTO v_id FROM unnest(p_ids) i(id)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM inode n WHERE n.id = i.id AND n.owner = p_owner
     )
-    AND depth > (
-        SELECT dep FROM temp_rows WHERE tgt = link.child
+    LIMIT 1;
+
+    IF FOUND THEN
+        RAISE EXCEPTION 'ID %, is not owned by %', v_id, p_owner
+            USING ERRCODE = 'no_data_found';
+    END IF;
+
+    -- the ids with no listed ancestor take the others down with them
+    FOR v_id IN
+        SELECT DISTINCT i.id FROM unnest(p_ids) i(id)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM link t
+            WHERE t.owner = p_owner
+            AND t.child = i.id
+            AND t.depth > 0
+            AND t.parent = ANY(p_ids)
+        )
+    LOOP
+        CALL count_subtree(v_id, p_owner, -1);
+    END LOOP;
+
+    -- Subtrees may overlap: every deleted node is counted once, for its
+    -- closest listed ancestor (itself when listed)
+    RETURN QUERY
+    WITH targets AS (
+        SELECT DISTINCT i.id FROM unnest(p_ids) i(id)
+    ), closest AS (
+        SELECT DISTINCT ON (t.child) t.child, t.parent AS target
+        FROM link t
+        JOIN targets g ON g.id = t.parent
+        WHERE t.owner = p_owner
+        ORDER BY t.child, t.depth
+    ), deleted AS (
+        DELETE FROM inode n
+        USING closest c
+        WHERE n.owner = p_owner
+        AND n.id = c.child
+        RETURNING c.target
     )
-    ;
+    SELECT g.id, count(d.target)::INTEGER FROM targets g
+    LEFT JOIN deleted d ON d.target = g.id
+    GROUP BY g.id;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION trash_descendants(
+    p_id UUID,
+    p_owner UUID
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_trashed_count INTEGER;
+BEGIN
+
+    CALL lock_counts(p_owner);
+
+    CALL is_owner(p_id, p_owner);
+
+    -- the rows keep their own counters for a restore
+    CALL count_subtree(p_id, p_owner, -1);
+
+    -- rows trashed before keep their own subtree root, so they are not
+    -- brought back by restoring this one
+    UPDATE inode n
+    SET trashed = p_id
+    FROM link t
+    WHERE t.owner = p_owner
+    AND t.parent = p_id
+    AND n.owner = p_owner
+    AND n.id = t.child
+    AND n.trashed IS NULL;
 
-    -- Drop the temporary table
-    DROP TABLE temp_rows;
+    GET DIAGNOSTICS v_trashed_count = ROW_COUNT;
+
+    RETURN v_trashed_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION restore_node(
+    p_id UUID,
+    p_owner UUID
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_parent UUID;
+    v_restored_count INTEGER;
+BEGIN
+
+    CALL lock_counts(p_owner);
+
+    SELECT n.parent INTO v_parent
+    FROM inode n
+    WHERE n.id = p_id
+    AND n.owner = p_owner
+    AND n.trashed = p_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'ID %, is not a trashed subtree of %', p_id, p_owner
+            USING ERRCODE = 'no_data_found';
+    END IF;
+
+    -- the parent has to be restored first
+    CALL is_owner(v_parent, p_owner);
+
+    -- idx_inode_sibling_name rejects the subtree root if its name was taken
+    UPDATE inode n
+    SET trashed = NULL
+    WHERE n.owner = p_owner
+    AND n.trashed = p_id;
+
+    GET DIAGNOSTICS v_restored_count = ROW_COUNT;
+
+    CALL count_subtree(p_id, p_owner, 1);
+
+    RETURN v_restored_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION purge_trash(
+    p_limit INTEGER
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_owners UUID[];
+    v_ids UUID[];
+    v_deleted_count INTEGER;
+BEGIN
+
+    -- lock_counts for every owner of the next chunk, in one order
+    v_owners := ARRAY(
+        SELECT u.id FROM users u
+        WHERE u.id IN (
+            SELECT c.owner FROM inode c
+            WHERE c.trashed IS NOT NULL
+            ORDER BY c.depth DESC
+            LIMIT p_limit
+        )
+        ORDER BY u.id
+        FOR NO KEY UPDATE
+    );
+
+    -- deepest rows first, so no purged row still has children and each
+    -- call removes at most p_limit inodes with their links
+    v_ids := ARRAY(
+        SELECT c.id FROM inode c
+        WHERE c.trashed IS NOT NULL
+        AND c.owner = ANY(v_owners)
+        ORDER BY c.depth DESC
+        LIMIT p_limit
+        FOR UPDATE
+    );
+
+    -- the trashed ancestors left for a later call stop counting the purged
+    -- rows, their subtree may be restored before that
+    UPDATE node_counts c
+    SET descendants = c.descendants - x.nodes,
+        items = c.items - x.items
+    FROM (
+        SELECT
+            t.owner, t.parent, count(*) AS nodes,
+            count(*) FILTER (WHERE n.node_type = 'item') AS items
+        FROM inode n
+        JOIN link t ON (t.owner = n.owner AND t.child = n.id AND t.depth > 0)
+        JOIN inode a ON (a.owner = t.owner AND a.id = t.parent)
+        WHERE n.id = ANY(v_ids)
+        AND a.trashed = n.trashed
+        AND a.id <> ALL(v_ids)
+        GROUP BY t.owner, t.parent
+    ) x
+    WHERE c.owner = x.owner
+    AND c.id = x.parent;
+
+    DELETE FROM inode n WHERE n.id = ANY(v_ids);
+
+    GET DIAGNOSTICS v_deleted_count = ROW_COUNT;
 
     RETURN v_deleted_count;
 END;
-$$;
\ No newline at end of file
+$$;
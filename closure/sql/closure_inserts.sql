@@ -9,14 +9,28 @@ LANGUAGE plpgsql
 AS $$
 DECLARE
     v_inode_id UUID;
+    v_depth INTEGER := 0;
+    v_prefix TEXT := '';
 BEGIN
-    -- insert node 
-    INSERT INTO inode (name, node_type, owner, template) 
-    VALUES (p_name, p_node_type, p_owner, NULL)
+    CALL lock_counts(p_owner);
+
+    IF p_parent IS NOT NULL THEN
+        SELECT n.depth + 1, n.path || '.' INTO v_depth, v_prefix
+        FROM inode n
+        WHERE n.id = p_parent
+        AND n.owner = p_owner;
+    END IF;
+
+    -- insert node, idx_inode_sibling_name rejects a duplicated sibling
+    INSERT INTO inode (name, node_type, owner, parent, depth, path, template) 
+    VALUES (p_name, p_node_type, p_owner, p_parent, v_depth, v_prefix || p_name, NULL)
     RETURNING id INTO v_inode_id;
 
     -- insert links
-    CALL insert_link(p_parent, v_inode_id);
+    CALL insert_link(p_parent, v_inode_id, p_owner);
+
+    INSERT INTO node_counts (id, owner) VALUES (v_inode_id, p_owner);
+    CALL count_inserted(p_parent, p_owner, 1, (p_node_type = 'item')::INTEGER);
 
     RETURN v_inode_id;
 
@@ -44,9 +58,6 @@ BEGIN
     
     CALL check_hierarchy(p_parent, p_node_type, p_owner);
 
-    -- If there is a child with same name and type, raises
-    CALL has_child(p_parent, p_name, p_node_type, p_owner);
-
 
     IF p_template IS NULL THEN
         v_new_inode_id := insert_plain_node(p_name, p_owner, p_node_type, p_parent);
@@ -59,21 +70,23 @@ $$;
 
 CREATE OR REPLACE PROCEDURE insert_link(
     p_parent UUID,
-    p_child UUID
+    p_child UUID,
+    p_owner UUID
 )
 LANGUAGE plpgsql
 AS $$
 BEGIN
     -- Insert the node itself
-    INSERT INTO link (parent, child, depth)
-    VALUES (p_child, p_child, 0);
+    INSERT INTO link (owner, parent, child, depth)
+    VALUES (p_owner, p_child, p_child, 0);
 
     --  if parent, insert all other links
     IF p_parent IS NOT NULL THEN
-        INSERT INTO link (parent, child, depth)
-        SELECT link.parent, p_child, row_number() OVER (ORDER BY link.depth) 
+        INSERT INTO link (owner, parent, child, depth)
+        SELECT p_owner, link.parent, p_child, row_number() OVER (ORDER BY link.depth) 
         FROM link
-        WHERE link.child = p_parent;
+        WHERE link.owner = p_owner
+        AND link.child = p_parent;
     END IF;
 
 EXCEPTION
@@ -87,3 +100,306 @@ EXCEPTION
         RAISE;  -- Re-raise the exception to propagate it
 END;
 $$;
+
+
+CREATE OR REPLACE FUNCTION insert_nodes(
+    p_owner UUID,
+    p_parent UUID,
+    -- TEXT, so a name too long for inode.name raises instead of being cut
+    p_names TEXT[],
+    p_node_types NODETYPE[],
+    p_parents INTEGER[]
+)
+RETURNS TABLE (ord_ INTEGER, id_ UUID)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_ids UUID[];
+    v_parent_ids UUID[];
+    v_levels INTEGER[];
+    v_paths TEXT[];
+    v_link_parents UUID[] := '{}';
+    v_link_children UUID[] := '{}';
+    v_link_depths INTEGER[] := '{}';
+    v_links INTEGER := 0;
+    v_descendants INTEGER[];
+    v_items INTEGER[];
+    v_batch_items INTEGER;
+    v_ancestor INTEGER;
+    v_base INTEGER := 0;
+    v_prefix TEXT := '';
+    v_node_type NODETYPE;
+BEGIN
+
+    IF cardinality(p_names) <> cardinality(p_node_types)
+        OR cardinality(p_names) <> cardinality(p_parents) THEN
+        RAISE EXCEPTION 'Names, node types and parents must have the same length';
+    END IF;
+
+    -- p_parents holds the 1-based position of the parent inside the batch,
+    -- or NULL for entries attached to p_parent
+    IF EXISTS (
+        SELECT 1
+        FROM unnest(p_parents) WITH ORDINALITY AS b(parent, ord)
+        WHERE b.parent IS NOT NULL
+        AND (b.parent < 1 OR b.parent >= b.ord)
+    ) THEN
+        RAISE EXCEPTION 'Parent of a batch entry must be a previous entry';
+    END IF;
+
+    CALL lock_counts(p_owner);
+
+    -- with no entry to check the hierarchy of, p_parent is still checked
+    IF cardinality(p_names) = 0 THEN
+        CALL is_owner(p_parent, p_owner);
+        RETURN;
+    END IF;
+
+    -- node can only have node as parent
+    FOR v_node_type IN
+        SELECT DISTINCT b.node_type
+        FROM unnest(p_node_types, p_parents) AS b(node_type, parent)
+        WHERE b.parent IS NULL
+    LOOP
+        CALL check_hierarchy(p_parent, v_node_type, p_owner);
+    END LOOP;
+
+    v_ids := ARRAY(
+        SELECT gen_random_uuid() FROM generate_series(1, cardinality(p_names))
+    );
+
+    IF p_parent IS NOT NULL THEN
+        SELECT n.depth + 1, n.path || '.' INTO v_base, v_prefix
+        FROM inode n
+        WHERE n.id = p_parent
+        AND n.owner = p_owner;
+    END IF;
+
+    -- a parent always comes before its children in the batch; each entry
+    -- is linked to itself and to its ancestors inside the batch
+    v_parent_ids := array_fill(p_parent, ARRAY[cardinality(p_names)]);
+    v_levels := array_fill(0, ARRAY[cardinality(p_names)]);
+    v_paths := array_fill(NULL::TEXT, ARRAY[cardinality(p_names)]);
+    v_descendants := array_fill(0, ARRAY[cardinality(p_names)]);
+    v_items := array_fill(0, ARRAY[cardinality(p_names)]);
+    FOR i IN 1..cardinality(p_parents) LOOP
+        IF p_parents[i] IS NULL THEN
+            v_paths[i] := v_prefix || p_names[i];
+        ELSE
+            IF p_node_types[i] = 'node' AND p_node_types[p_parents[i]] <> 'node' THEN
+                RAISE EXCEPTION 'Node type node can´t have a parent item'
+                    USING ERRCODE = 'integrity_constraint_violation';
+            END IF;
+            v_parent_ids[i] := v_ids[p_parents[i]];
+            v_levels[i] := v_levels[p_parents[i]] + 1;
+            v_paths[i] := v_paths[p_parents[i]] || '.' || p_names[i];
+        END IF;
+
+        v_ancestor := i;
+        FOR v_depth IN 0..v_levels[i] LOOP
+            v_links := v_links + 1;
+            v_link_parents[v_links] := v_ids[v_ancestor];
+            v_link_children[v_links] := v_ids[i];
+            v_link_depths[v_links] := v_depth;
+            -- and counted by each of them
+            IF v_depth > 0 THEN
+                v_descendants[v_ancestor] := v_descendants[v_ancestor] + 1;
+                IF p_node_types[i] = 'item' THEN
+                    v_items[v_ancestor] := v_items[v_ancestor] + 1;
+                END IF;
+            END IF;
+            v_ancestor := p_parents[v_ancestor];
+        END LOOP;
+    END LOOP;
+
+    -- the statements below only unnest the arrays: subscripting a PL/pgSQL
+    -- array from SQL costs its whole length, which made large batches quadratic
+
+    -- idx_inode_sibling_name rejects duplicated siblings, inside the batch
+    -- or against the children p_parent already has
+    INSERT INTO inode (id, name, node_type, owner, parent, depth, path, template)
+    SELECT b.id, b.name, b.node_type, p_owner, b.parent, v_base + b.level, b.path, NULL
+    FROM unnest(v_ids, p_names, p_node_types, v_parent_ids, v_levels, v_paths)
+        AS b(id, name, node_type, parent, level, path);
+
+    -- the batch entries carry p_parent ancestors as well; those are read once
+    -- and crossed with the batch, so no plan here depends on link statistics
+    INSERT INTO link (owner, parent, child, depth)
+    SELECT p_owner, b.parent, b.child, b.depth
+    FROM unnest(v_link_parents, v_link_children, v_link_depths) AS b(parent, child, depth)
+    UNION ALL
+    SELECT p_owner, t.parent, b.id, t.depth + 1 + b.level
+    FROM link t, unnest(v_ids, v_levels) AS b(id, level)
+    WHERE t.owner = p_owner
+    AND t.child = p_parent;
+
+    INSERT INTO node_counts (id, owner, descendants, items)
+    SELECT b.id, p_owner, b.descendants, b.items
+    FROM unnest(v_ids, v_descendants, v_items) AS b(id, descendants, items);
+
+    SELECT (count(*) FILTER (WHERE b.node_type = 'item'))::INTEGER INTO v_batch_items
+    FROM unnest(p_node_types) AS b(node_type);
+
+    CALL count_inserted(p_parent, p_owner, cardinality(p_names), v_batch_items);
+
+    RETURN QUERY
+    SELECT b.ord::INTEGER, b.id
+    FROM unnest(v_ids) WITH ORDINALITY AS b(id, ord)
+    ORDER BY b.ord;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION load_nodes(
+    p_load_id UUID,
+    p_owner UUID,
+    p_parent UUID DEFAULT NULL
+)
+RETURNS TABLE (nodes_ INTEGER, links_ INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_nodes INTEGER;
+    v_links INTEGER;
+    v_count INTEGER;
+    v_max_level INTEGER;
+    v_level INTEGER;
+    v_key TEXT;
+    v_base INTEGER := 0;
+    v_prefix TEXT := '';
+    v_node_type NODETYPE;
+BEGIN
+
+    CALL lock_counts(p_owner);
+
+    IF p_parent IS NOT NULL THEN
+        SELECT n.depth + 1, n.path || '.' INTO v_base, v_prefix
+        FROM inode n
+        WHERE n.id = p_parent
+        AND n.owner = p_owner;
+    END IF;
+
+    -- level 0 rows are attached to p_parent, every other row hangs from
+    -- the staged row named by parent_key
+    WITH RECURSIVE levels AS (
+        SELECT s.key, 0 AS level, v_prefix || s.name AS path
+        FROM inode_stage s
+        WHERE s.load_id = p_load_id
+        AND s.parent_key IS NULL
+        UNION ALL
+        SELECT s.key, l.level + 1, l.path || '.' || s.name
+        FROM inode_stage s
+        JOIN levels l ON s.parent_key = l.key
+        WHERE s.load_id = p_load_id
+    )
+    UPDATE inode_stage s
+    SET level = l.level, path = l.path, id = gen_random_uuid()
+    FROM levels l
+    WHERE s.load_id = p_load_id
+    AND s.key = l.key;
+
+    GET DIAGNOSTICS v_nodes = ROW_COUNT;
+
+    SELECT COUNT(*) INTO v_count
+    FROM inode_stage s
+    WHERE s.load_id = p_load_id
+    AND s.level IS NULL;
+
+    IF v_count > 0 THEN
+        RAISE EXCEPTION 'Load %: % rows have a missing parent or are part of a cycle', p_load_id, v_count;
+    END IF;
+
+    UPDATE inode_stage s
+    SET parent_id = p.id
+    FROM inode_stage p
+    WHERE s.load_id = p_load_id
+    AND p.load_id = p_load_id
+    AND p.key = s.parent_key;
+
+    -- node can only have node as parent
+    FOR v_node_type IN
+        SELECT DISTINCT s.node_type
+        FROM inode_stage s
+        WHERE s.load_id = p_load_id
+        AND s.level = 0
+    LOOP
+        CALL check_hierarchy(p_parent, v_node_type, p_owner);
+    END LOOP;
+
+    SELECT s.key INTO v_key
+    FROM inode_stage s
+    JOIN inode_stage p ON (p.load_id = s.load_id AND p.key = s.parent_key)
+    WHERE s.load_id = p_load_id
+    AND s.node_type = 'node'
+    AND p.node_type <> 'node'
+    LIMIT 1;
+
+    IF v_key IS NOT NULL THEN
+        RAISE EXCEPTION 'Load %: row % is a node under an item', p_load_id, v_key
+            USING ERRCODE = 'integrity_constraint_violation';
+    END IF;
+
+    -- idx_inode_sibling_name rejects duplicated siblings
+    INSERT INTO inode (id, name, node_type, owner, parent, depth, path, template)
+    SELECT
+        s.id, s.name, s.node_type, p_owner,
+        COALESCE(s.parent_id, p_parent), v_base + s.level, s.path, NULL
+    FROM inode_stage s
+    WHERE s.load_id = p_load_id;
+
+    INSERT INTO link (owner, parent, child, depth)
+    SELECT p_owner, s.id, s.id, 0
+    FROM inode_stage s
+    WHERE s.load_id = p_load_id;
+
+    GET DIAGNOSTICS v_links = ROW_COUNT;
+
+    INSERT INTO link (owner, parent, child, depth)
+    SELECT p_owner, t.parent, s.id, t.depth + 1
+    FROM inode_stage s
+    JOIN link t ON (t.owner = p_owner AND t.child = p_parent)
+    WHERE s.load_id = p_load_id
+    AND s.level = 0;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    v_links := v_links + v_count;
+
+    -- one pass per level: a row gets its parent ancestors, already linked
+    SELECT MAX(s.level) INTO v_max_level
+    FROM inode_stage s
+    WHERE s.load_id = p_load_id;
+
+    FOR v_level IN 1..COALESCE(v_max_level, 0) LOOP
+        INSERT INTO link (owner, parent, child, depth)
+        SELECT p_owner, t.parent, s.id, t.depth + 1
+        FROM inode_stage s
+        JOIN link t ON (t.owner = p_owner AND t.child = s.parent_id)
+        WHERE s.load_id = p_load_id
+        AND s.level = v_level;
+
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_links := v_links + v_count;
+    END LOOP;
+
+    -- every staged row has its subtree linked by now
+    INSERT INTO node_counts (id, owner, descendants, items)
+    SELECT
+        s.id, p_owner,
+        (count(*) - 1)::INTEGER,
+        (count(*) FILTER (WHERE t.depth > 0 AND c.node_type = 'item'))::INTEGER
+    FROM inode_stage s
+    JOIN link t ON (t.owner = p_owner AND t.parent = s.id)
+    JOIN inode_stage c ON (c.load_id = p_load_id AND c.id = t.child)
+    WHERE s.load_id = p_load_id
+    GROUP BY s.id;
+
+    SELECT (count(*) FILTER (WHERE s.node_type = 'item'))::INTEGER INTO v_count
+    FROM inode_stage s
+    WHERE s.load_id = p_load_id;
+
+    CALL count_inserted(p_parent, p_owner, v_nodes, v_count);
+
+    DELETE FROM inode_stage s WHERE s.load_id = p_load_id;
+
+    RETURN QUERY SELECT v_nodes, v_links;
+END;
+$$;
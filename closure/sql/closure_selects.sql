@@ -7,50 +7,89 @@ AS $$
 DECLARE
     v_count INTEGER;
 BEGIN
-    -- IF OWNER DOES NOT EXIST, RAISE
-    CALL owner_exist(p_owner);
-
-    SELECT COUNT(*) INTO v_count FROM inode WHERE owner = p_owner;
+    -- kept by count_inode_changes, see closure_counts.sql
+    SELECT sum(c.nodes) INTO v_count FROM owner_counts c WHERE c.owner = p_owner;
+
+    -- no counts before the first insert; IF OWNER DOES NOT EXIST, RAISE
+    IF v_count IS NULL THEN
+        CALL owner_exist(p_owner);
+        v_count := 0;
+    END IF;
     RETURN v_count;
 END;
 $$;
 
 
 
+-- LANGUAGE sql STABLE functions of a single SELECT are inlined: the planner
+-- expands them inside the calling query, whose WHERE, ORDER BY and LIMIT then
+-- reach the inode and link indexes. They raise nothing, a missing or foreign
+-- id gives no rows; the plpgsql functions built on them add the errors
+
+-- the rows of the children of p_parent_id, on idx_inode_parent
+CREATE OR REPLACE FUNCTION child_rows(
+    p_parent_id UUID,
+    p_owner UUID
+)
+RETURNS TABLE (
+    parent UUID, id UUID, name VARCHAR(64), path TEXT, template UUID,
+    node_type NODETYPE
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT n.parent, n.id, n.name, n.path, n.template, n.node_type FROM inode n
+        WHERE n.owner = p_owner
+        AND n.parent = p_parent_id
+        AND n.trashed IS NULL;
+$$;
+
+-- the rows below p_parent_id, depth being the distance to it
+CREATE OR REPLACE FUNCTION descendant_rows(
+    p_parent_id UUID,
+    p_owner UUID
+)
+RETURNS TABLE (
+    depth INTEGER, parent UUID, id UUID, name VARCHAR(64), path TEXT,
+    template UUID, node_type NODETYPE
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT t.depth, n.parent, n.id, n.name, n.path, n.template, n.node_type
+        FROM link t
+        JOIN inode n ON (n.id = t.child)
+        WHERE t.owner = p_owner
+        AND t.parent = p_parent_id
+        AND t.depth > 0
+        AND n.owner = p_owner
+        AND n.trashed IS NULL;
+$$;
+
 CREATE OR REPLACE FUNCTION select_root_byid(
     p_id UUID,
     p_owner UUID
 )
 RETURNS TABLE (id UUID, name VARCHAR(64), template UUID, node_type NODETYPE)
-LANGUAGE plpgsql
+LANGUAGE sql STABLE
 AS $$
-BEGIN
-    RETURN QUERY
-    SELECT n.id, n.name, n.template, n.node_type FROM inode n
-        WHERE n.id IN (
-            SELECT parent FROM link t
-            WHERE t.child = p_id
-            AND n.owner = p_owner
-            ORDER BY t.depth DESC
-            LIMIT 1
-        );
-END;
+    -- the root is the ancestor as far away as the node depth
+    SELECT n.id, n.name, n.template, n.node_type FROM inode c
+        JOIN link t ON (t.owner = p_owner AND t.child = c.id AND t.depth = c.depth)
+        JOIN inode n ON (n.owner = p_owner AND n.id = t.parent)
+        WHERE c.id = p_id
+        AND c.owner = p_owner
+        AND c.trashed IS NULL;
 $$;
 
 CREATE OR REPLACE FUNCTION select_roots(
     p_owner UUID
 )
 RETURNS TABLE (id UUID, name VARCHAR(64), template UUID, node_type NODETYPE)
-LANGUAGE plpgsql
+LANGUAGE sql STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT n.id, n.name, n.template, n.node_type FROM inode n
-        JOIN link t ON (n.id = t.child)
-        WHERE n.owner = p_owner 
-        GROUP BY n.id, n.name, n.template, n.node_type
-        HAVING COUNT(t.child) = 1;
-END;
+        WHERE n.owner = p_owner
+        AND n.parent IS NULL
+        AND n.trashed IS NULL;
 $$;
 
 CREATE OR REPLACE FUNCTION select_byid(
@@ -58,15 +97,24 @@ CREATE OR REPLACE FUNCTION select_byid(
     p_owner UUID
 )
 RETURNS TABLE (id UUID, name VARCHAR(64), template UUID, node_type NODETYPE)
-LANGUAGE plpgsql
+LANGUAGE sql STABLE
 AS $$
-BEGIN
+    SELECT n.id, n.name, n.template, n.node_type
+        FROM inode n
+        WHERE n.id = p_id AND n.owner = p_owner AND n.trashed IS NULL;
+$$;
 
-    RETURN QUERY
+-- ids missing, trashed or of another owner are left out
+CREATE OR REPLACE FUNCTION select_byids(
+    p_ids UUID[],
+    p_owner UUID
+)
+RETURNS TABLE (id UUID, name VARCHAR(64), template UUID, node_type NODETYPE)
+LANGUAGE sql STABLE
+AS $$
     SELECT n.id, n.name, n.template, n.node_type
         FROM inode n
-        WHERE n.id = p_id AND n.owner = p_owner;
-END;
+        WHERE n.id = ANY(p_ids) AND n.owner = p_owner AND n.trashed IS NULL;
 $$;
 
 CREATE OR REPLACE FUNCTION select_child(
@@ -78,14 +126,15 @@ LANGUAGE plpgsql
 AS $$
 BEGIN
 
-    CALL is_owner(p_parent_id, p_owner);
-
     RETURN QUERY
-    SELECT t.child, n.name, n.template, n.node_type FROM inode n
-            JOIN link t ON (n.id = t.child) 
-            WHERE t.parent = p_parent_id 
-            AND t.depth = 1
-            AND n.owner = p_owner;
+    SELECT c.id, c.name, c.template, c.node_type
+        FROM child_rows(p_parent_id, p_owner) c;
+
+    -- the rows are filtered by owner already, is_owner only runs to tell a
+    -- missing, trashed or foreign p_parent_id from a node with no children
+    IF NOT FOUND THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
 END;
 $$;
 
@@ -98,15 +147,14 @@ LANGUAGE plpgsql
 AS $$
 BEGIN
 
-    CALL is_owner(p_parent_id, p_owner);
-
     RETURN QUERY
-    SELECT t.parent, n.id, n.name, n.template, n.node_type FROM inode n
-             JOIN link t ON (n.id = t.child) 
-             WHERE t.parent = p_parent_id 
-             AND t.depth > 0
-             AND n.owner = p_owner
-             ORDER BY t.depth ASC;
+    SELECT d.parent, d.id, d.name, d.template, d.node_type
+        FROM descendant_rows(p_parent_id, p_owner) d
+        ORDER BY d.depth ASC;
+
+    IF NOT FOUND THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
 END;
 $$;
 
@@ -121,8 +169,6 @@ DECLARE
     result jsonb;
 BEGIN
 
-    CALL is_owner(p_parent_id, p_owner);
-
     SELECT jsonb_agg(
         jsonb_build_object(
             'id', n.id,
@@ -133,9 +179,15 @@ BEGIN
     ) INTO result
     FROM inode n
     JOIN link t ON (n.id = t.child) 
-    WHERE t.parent = p_parent_id 
+    WHERE t.owner = p_owner
+    AND t.parent = p_parent_id 
     AND t.depth = 1
-    AND n.owner = p_owner;
+    AND n.owner = p_owner
+    AND n.trashed IS NULL;
+
+    IF result IS NULL THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
 
     RETURN result;
 END;
@@ -152,11 +204,9 @@ DECLARE
     result jsonb;
 BEGIN
 
-    CALL is_owner(p_parent_id, p_owner);
-
     SELECT jsonb_agg(
         jsonb_build_object(
-            'parent_id', t.parent,
+            'parent_id', n.parent,
             'id', n.id,
             'name', n.name,
             'template', n.template,
@@ -165,29 +215,231 @@ BEGIN
     ) INTO result
     FROM inode n
     JOIN link t ON (n.id = t.child)
-    WHERE t.parent = p_parent_id
+    WHERE t.owner = p_owner
+    AND t.parent = p_parent_id
     AND t.depth > 0
-    AND n.owner = p_owner;
+    AND n.owner = p_owner
+    AND n.trashed IS NULL;
+
+    IF result IS NULL THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
+
     RETURN result;
 END;
 $$;
 
--- Function to return a set of UUIDs
-CREATE OR REPLACE FUNCTION select_internal_child_path(
+CREATE OR REPLACE FUNCTION select_child_page(
     p_parent_id UUID,
-    p_owner UUID
+    p_owner UUID,
+    p_after_path TEXT DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT NULL
 )
-RETURNS TABLE (child UUID)
+RETURNS TABLE (path_ TEXT, id_ UUID, name_ VARCHAR(64), template_ UUID, node_type_ NODETYPE)
 LANGUAGE plpgsql
 AS $$
 BEGIN
+
+    -- keyset on idx_inode_parent, a page after (p_after_path, p_after_id)
+    -- costs the same as the first one. No OR for the first page, the row
+    -- comparison has to stay an index condition
     RETURN QUERY
-        SELECT t.child
-        FROM inode n
-        JOIN link t ON n.id = t.child
-        WHERE t.parent = p_parent_id
-        AND t.depth = 1
-        AND n.owner = p_owner;
+    SELECT n.path, n.id, n.name, n.template, n.node_type FROM inode n
+        WHERE n.parent = p_parent_id
+        AND (n.path, n.id) > (
+            coalesce(p_after_path, ''),
+            coalesce(p_after_id, '00000000-0000-0000-0000-000000000000')
+        )
+        AND n.owner = p_owner
+        AND n.trashed IS NULL
+        ORDER BY n.path, n.id
+        LIMIT p_limit;
+
+    IF NOT FOUND THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION select_descendants_page(
+    p_parent_id UUID,
+    p_owner UUID,
+    p_after_depth INTEGER DEFAULT NULL,
+    p_after_path TEXT DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    depth_ INTEGER, path_ TEXT, parent_id_ UUID, id_ UUID, name_ VARCHAR(64),
+    template_ UUID, node_type_ NODETYPE
+)
+LANGUAGE plpgsql
+-- a generic plan hashes every link of p_parent_id, whatever the page size
+SET plan_cache_mode = force_custom_plan
+AS $$
+DECLARE
+    v_path TEXT;
+    v_depth INTEGER;
+    v_after_path TEXT := coalesce(p_after_path, '');
+    v_after_id UUID := coalesce(p_after_id, '00000000-0000-0000-0000-000000000000');
+    v_left INTEGER := p_limit;
+    v_count INTEGER;
+BEGIN
+
+    SELECT n.path, coalesce(p_after_depth, n.depth + 1) INTO v_path, v_depth
+    FROM inode n
+    WHERE n.id = p_parent_id
+    AND n.owner = p_owner
+    AND n.trashed IS NULL;
+
+    IF NOT FOUND THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
+
+    -- (depth, path, id) order, one level at a time: each level is a path range
+    -- on idx_inode_depth_path. A node of another type named like p_parent_id
+    -- shares its path, link drops the rows below it.
+    -- Below a level with no rows there are none either
+    LOOP
+        RETURN QUERY
+        SELECT n.depth, n.path, n.parent, n.id, n.name, n.template, n.node_type
+            FROM inode n
+            WHERE n.owner = p_owner
+            AND n.depth = v_depth
+            AND n.path > v_path || '.'
+            AND n.path < v_path || '/'
+            AND (n.path, n.id) > (v_after_path, v_after_id)
+            AND n.trashed IS NULL
+            AND EXISTS (
+                SELECT 1 FROM link t
+                WHERE t.owner = p_owner AND t.parent = p_parent_id AND t.child = n.id
+            )
+            ORDER BY n.path, n.id
+            LIMIT v_left;
+
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_left := v_left - v_count;
+
+        EXIT WHEN v_left = 0;
+        -- the level of the cursor may just be exhausted
+        EXIT WHEN v_count = 0 AND v_after_path = '';
+
+        -- deeper levels are read from their start
+        v_depth := v_depth + 1;
+        v_after_path := '';
+    END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION select_subtree_nested_json(
+    p_id UUID,
+    p_owner UUID,
+    p_max_depth INTEGER DEFAULT NULL,
+    p_with_items BOOLEAN DEFAULT false
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_ids UUID[];
+    v_parents UUID[];
+    v_depths INTEGER[];
+    v_names VARCHAR(64)[];
+    v_templates UUID[];
+    v_node_types NODETYPE[];
+    v_items json[];
+    v_below_ids UUID[] := '{}';
+    v_below json[] := '{}';
+    v_lo INTEGER;
+    v_hi INTEGER;
+BEGIN
+
+    -- a NULL bound would reach the FOR loop below otherwise
+    IF p_max_depth < 0 THEN
+        RAISE EXCEPTION 'max_depth % is negative', p_max_depth
+            USING ERRCODE = 'invalid_parameter_value';
+    END IF;
+
+    -- one read of the subtree, shallowest first, so each level is a slice
+    SELECT
+        array_agg(n.id ORDER BY t.depth),
+        array_agg(n.parent ORDER BY t.depth),
+        array_agg(t.depth ORDER BY t.depth),
+        array_agg(n.name ORDER BY t.depth),
+        array_agg(n.template ORDER BY t.depth),
+        array_agg(n.node_type ORDER BY t.depth),
+        array_agg(i.item ORDER BY t.depth)
+    INTO v_ids, v_parents, v_depths, v_names, v_templates, v_node_types, v_items
+    FROM link t
+    JOIN inode n ON (n.id = t.child)
+    LEFT JOIN LATERAL (
+        SELECT json_build_object(
+            'data_type', m.data_type,
+            'data_source', m.data_source,
+            'config_str', m.config_str
+        ) AS item
+        FROM item m
+        WHERE p_with_items
+        AND m.owner = n.id
+        LIMIT 1
+    ) i ON true
+    WHERE t.owner = p_owner
+    AND t.parent = p_id
+    AND (p_max_depth IS NULL OR t.depth <= p_max_depth)
+    AND n.owner = p_owner
+    AND n.trashed IS NULL;
+
+    -- p_id comes with its subtree, at depth 0
+    IF v_ids IS NULL THEN
+        CALL is_owner(p_id, p_owner);
+    END IF;
+
+    -- bottom up, v_below holds the children lists of the ids in v_below_ids.
+    -- json, not jsonb: nesting a list then appends text instead of rebuilding
+    -- the whole subtree below at every level
+    v_hi := cardinality(v_ids);
+    FOR v_level IN REVERSE v_depths[v_hi]..0 LOOP
+        v_lo := array_position(v_depths, v_level);
+
+        SELECT array_agg(k.parent), array_agg(k.children) INTO v_below_ids, v_below
+        FROM (
+            SELECT r.parent, json_agg(
+                CASE
+                WHEN v_level = p_max_depth AND r.item IS NULL THEN json_build_object(
+                    'id', r.id, 'name', r.name, 'template', r.template,
+                    'node_type', r.node_type
+                )
+                WHEN v_level = p_max_depth THEN json_build_object(
+                    'id', r.id, 'name', r.name, 'template', r.template,
+                    'node_type', r.node_type, 'item', r.item
+                )
+                WHEN r.item IS NULL THEN json_build_object(
+                    'id', r.id, 'name', r.name, 'template', r.template,
+                    'node_type', r.node_type, 'children', coalesce(b.children, '[]')
+                )
+                ELSE json_build_object(
+                    'id', r.id, 'name', r.name, 'template', r.template,
+                    'node_type', r.node_type, 'item', r.item,
+                    'children', coalesce(b.children, '[]')
+                )
+                END
+                ORDER BY r.name
+            ) AS children
+            FROM unnest(
+                v_ids[v_lo:v_hi], v_parents[v_lo:v_hi], v_names[v_lo:v_hi],
+                v_templates[v_lo:v_hi], v_node_types[v_lo:v_hi], v_items[v_lo:v_hi]
+            ) AS r(id, parent, name, template, node_type, item)
+            LEFT JOIN unnest(v_below_ids, v_below) AS b(id, children)
+                ON (b.id = r.id)
+            GROUP BY r.parent
+        ) k;
+
+        v_hi := v_lo - 1;
+    END LOOP;
+
+    -- the list holding p_id alone
+    RETURN (v_below[1] -> 0)::jsonb;
 END;
 $$;
 
@@ -199,24 +451,13 @@ RETURNS TABLE (id UUID, name VARCHAR(64), path TEXT, template UUID, node_type NO
 LANGUAGE plpgsql
 AS $$
 BEGIN
-    -- Call another function for permission check or similar
-    CALL is_owner(p_parent_id, p_owner);
-
-    -- Use subquery with function call correctly
     RETURN QUERY
-    WITH child_ids AS (
-            SELECT child FROM select_internal_child_path(p_parent_id, p_owner)
-        ), child_ids_names AS (
-        SELECT n.name, t.child
-        FROM inode n
-        JOIN link t ON t.parent = n.id
-        WHERE t.child IN (SELECT child FROM child_ids)
-        ORDER BY t.depth DESC
-        ), paths AS (
-        SELECT c.child, string_agg(c.name, '.') AS path FROM child_ids_names c 
-        GROUP BY c.child)
-        SELECT n.id, n.name, p.path, n.template, n.node_type FROM paths p
-        JOIN inode n ON p.child = n.id;
+    SELECT c.id, c.name, c.path, c.template, c.node_type
+        FROM child_rows(p_parent_id, p_owner) c;
+
+    IF NOT FOUND THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
 END;
 $$;
 
@@ -230,36 +471,14 @@ RETURNS TABLE (parent_id UUID, id UUID, name VARCHAR(64), path TEXT,template UUI
 LANGUAGE plpgsql
 AS $$
 BEGIN
-    -- Call another function for permission check or similar
-    CALL is_owner(p_parent_id, p_owner);
-
-    -- Use subquery with function call correctly
     RETURN QUERY
-    WITH child_ids AS (
-        SELECT child FROM (
-           SELECT t.child
-            FROM inode n
-            JOIN link t ON n.id = t.child
-            WHERE t.parent = p_parent_id
-            AND t.depth > 0
-            AND n.owner = p_owner
-        )
-    ), child_ids_names AS (
-        SELECT n.name, t.child
-        FROM inode n
-        JOIN link t ON t.parent = n.id
-        WHERE t.child IN (SELECT child FROM child_ids)
-        ORDER BY t.child, t.depth DESC
-    ), paths AS (
-        SELECT 
-        c.child, string_agg(c.name, '.') AS path FROM child_ids_names c 
-        GROUP BY c.child
-    )
-    SELECT l.parent, n.id, n.name, p.path, n.template, n.node_type FROM paths p
-        JOIN inode n ON p.child = n.id
-        JOIN link l ON p.child = l.child
-        WHERE l.depth = 1
-        ;
+    SELECT d.parent, d.id, d.name, d.path, d.template, d.node_type
+        FROM descendant_rows(p_parent_id, p_owner) d
+        ORDER BY d.depth ASC;
+
+    IF NOT FOUND THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
 END;
 $$;
 
@@ -275,12 +494,15 @@ LANGUAGE plpgsql
 AS $$
 BEGIN
 
-    CALL is_owner(p_parent_id, p_owner);
-
+    -- the name reaches the index scan of child_rows
     RETURN QUERY
-    SELECT * 
-        FROM select_child(p_parent_id, p_owner) 
-        WHERE name = p_name;
+    SELECT c.id, c.name, c.template, c.node_type
+        FROM child_rows(p_parent_id, p_owner) c
+        WHERE c.name = p_name;
+
+    IF NOT FOUND THEN
+        CALL is_owner(p_parent_id, p_owner);
+    END IF;
 END;
 $$;
 
@@ -292,33 +514,70 @@ CREATE OR REPLACE FUNCTION select_child_bypath(
 RETURNS TABLE (id_ UUID, name_ VARCHAR(64), template_ UUID, node_type_ NODETYPE)
 LANGUAGE plpgsql
 AS $$
-DECLARE
-    v_string TEXT;
-    v_id UUID;
-    v_old UUID;
 BEGIN
 
-    SELECT id 
-        FROM select_roots(p_owner)
-        WHERE name = p_root
-        INTO v_id;
-    v_old := v_id;
-    FOREACH v_string IN ARRAY p_names
-    LOOP
-        SELECT id 
-            FROM select_child(v_id, p_owner) 
-            WHERE name = v_string
-            INTO v_id;
-            
-        IF v_id IS NULL THEN
-            RAISE EXCEPTION 'Error on select by path. Parent %, Name %s', v_old, v_string;
-        END IF;
-        v_old := v_id;
-    END LOOP;
-
+    -- one probe on idx_inode_path; no stored name holds a dot (inode_name_no_dot),
+    -- so depth keeps a p_root or p_names holding one from matching a deeper node
     RETURN QUERY
-    SELECT id, name, template, node_type 
-    FROM inode
-    WHERE id = v_id;
+    SELECT n.id, n.name, n.template, n.node_type
+        FROM inode n
+        WHERE n.owner = p_owner
+        AND n.path = array_to_string(p_root || p_names, '.')
+        AND n.depth = cardinality(p_names)
+        AND n.trashed IS NULL
+        ORDER BY n.node_type
+        LIMIT 1;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Error on select by path. Root %, Names %', p_root, p_names
+            USING ERRCODE = 'no_data_found';
+    END IF;
 END;
+$$;
+
+CREATE OR REPLACE FUNCTION select_bypaths(
+    p_owner UUID,
+    p_paths TEXT[]
+)
+RETURNS TABLE (ord_ INTEGER, path_ TEXT, id_ UUID, name_ VARCHAR(64), template_ UUID, node_type_ NODETYPE)
+LANGUAGE sql STABLE
+AS $$
+    -- paths not found come back with NULL id; no name holds a dot, so a path
+    -- names a single chain of nodes
+    SELECT b.ord::INTEGER, b.path, n.id, n.name, n.template, n.node_type
+        FROM unnest(p_paths) WITH ORDINALITY AS b(path, ord)
+        LEFT JOIN LATERAL (
+            SELECT i.id, i.name, i.template, i.node_type
+            FROM inode i
+            WHERE i.owner = p_owner
+            AND i.path = b.path
+            AND i.trashed IS NULL
+            ORDER BY i.node_type
+            LIMIT 1
+        ) n ON true
+        ORDER BY b.ord;
+$$;
+
+CREATE OR REPLACE FUNCTION select_bypattern(
+    p_owner UUID,
+    p_prefix TEXT,
+    p_regex TEXT,
+    p_min_depth INTEGER DEFAULT 0,
+    p_max_depth INTEGER DEFAULT NULL
+)
+RETURNS TABLE (id UUID, name VARCHAR(64), path TEXT, template UUID, node_type NODETYPE)
+LANGUAGE sql STABLE
+AS $$
+    -- inlined into the calling query, so a server side cursor streams it.
+    -- p_prefix holds the literal leading segments of the pattern: only its
+    -- subtree is read, as a range on idx_inode_path ('/' follows '.' in "C");
+    -- with no prefix, the regex can use idx_inode_path_trgm of closure_trgm.sql
+    SELECT n.id, n.name, n.path, n.template, n.node_type FROM inode n
+        WHERE n.owner = p_owner
+        AND (p_prefix = '' OR (n.path >= p_prefix AND n.path < p_prefix || '/'))
+        AND n.path ~ p_regex
+        AND n.depth >= p_min_depth
+        AND (p_max_depth IS NULL OR n.depth <= p_max_depth)
+        AND n.trashed IS NULL
+        ORDER BY n.path;
 $$;
\ No newline at end of file
@@ -1,39 +1,23 @@
-CREATE TABLE users (
-    id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
-    name VARCHAR(64) NOT NULL UNIQUE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE TYPE DATATYPE AS ENUM ('float32', 'float64', 'byte','integer32', 'uinteger32', 'uinteger64', 'integer64', 'boolean', 'string');
-CREATE TYPE DATASOURCE AS ENUM ('datapoint', 'formula', 'calc', 'aggregator','fixed');
-CREATE TYPE NODETYPE AS ENUM ('node', 'item', 'template');
-
+-- the node tables, closure_tables_partitioned.sql has them partitioned by
+-- owner. Loaded after closure_users.sql, closure_common.sql adds the indexes
+-- and triggers both share
 
 CREATE TABLE inode (
     id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
-    name VARCHAR(64) NOT NULL,
+    -- a dot separates the names of path, so no name holds one
+    name VARCHAR(64) NOT NULL CONSTRAINT inode_name_no_dot CHECK (strpos(name, '.') = 0),
     node_type NODETYPE NOT NULL,
     owner uuid NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    parent uuid REFERENCES inode(id) DEFAULT NULL,
+    depth INTEGER NOT NULL DEFAULT 0,
+    path TEXT COLLATE "C" NOT NULL,
+    -- id of the trashed subtree root, the row is hidden until restored or purged
+    trashed uuid DEFAULT NULL,
     template uuid REFERENCES inode(id) ON DELETE SET NULL DEFAULT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX idx_inode_owner ON inode (owner);
-
-CREATE OR REPLACE FUNCTION update_updated_at()
-RETURNS TRIGGER AS $$
-BEGIN
-    NEW.updated_at = CURRENT_TIMESTAMP;
-    RETURN NEW;
-END;
-$$ LANGUAGE plpgsql;
-
-CREATE TRIGGER set_updated_at
-BEFORE UPDATE ON inode
-FOR EACH ROW
-EXECUTE FUNCTION update_updated_at();
-
 CREATE TABLE item (
     data_type DATATYPE,
     data_source DATASOURCE,
@@ -41,9 +25,23 @@ CREATE TABLE item (
     owner uuid NOT NULL REFERENCES inode(id) ON DELETE CASCADE
 );
 
+-- owner repeats the inode owner, so link can be partitioned like inode,
+-- see closure_tables_partitioned.sql
 CREATE TABLE link(
+    owner uuid NOT NULL,
     parent uuid NOT NULL REFERENCES inode(id) ON DELETE CASCADE,
     child uuid NOT NULL REFERENCES inode(id) ON DELETE CASCADE,
     depth INTEGER NOT NULL,
     PRIMARY KEY (parent, child)
-);
\ No newline at end of file
+);
+
+-- descendants of a node sharing its trashed value, and the items among them:
+-- the live ones for a live node, the ones its restore brings back otherwise.
+-- Kept by the insert, move, delete, trash and restore functions, see
+-- closure_counts.sql
+CREATE TABLE node_counts (
+    id uuid PRIMARY KEY REFERENCES inode(id) ON DELETE CASCADE,
+    owner uuid NOT NULL,
+    descendants INTEGER NOT NULL DEFAULT 0,
+    items INTEGER NOT NULL DEFAULT 0
+);
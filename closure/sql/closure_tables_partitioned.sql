@@ -0,0 +1,132 @@
+-- closure_tables.sql with inode, link and node_counts hash partitioned by
+-- owner: load it instead of closure_tables.sql, the other scripts are the
+-- same for both. Every function filters inode and link by owner, so a call
+-- touches the partitions of a single owner and a large owner bloats only its
+-- own indexes. Partitioned tables are only unique on keys holding owner, the
+-- foreign keys to inode go through (id, owner)
+
+CREATE TABLE inode (
+    id uuid DEFAULT gen_random_uuid(),
+    -- a dot separates the names of path, so no name holds one
+    name VARCHAR(64) NOT NULL CONSTRAINT inode_name_no_dot CHECK (strpos(name, '.') = 0),
+    node_type NODETYPE NOT NULL,
+    owner uuid NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    parent uuid DEFAULT NULL,
+    depth INTEGER NOT NULL DEFAULT 0,
+    path TEXT COLLATE "C" NOT NULL,
+    -- id of the trashed subtree root, the row is hidden until restored or purged
+    trashed uuid DEFAULT NULL,
+    template uuid DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, owner),
+    FOREIGN KEY (parent, owner) REFERENCES inode(id, owner),
+    FOREIGN KEY (template, owner) REFERENCES inode(id, owner)
+        ON DELETE SET NULL (template)
+) PARTITION BY HASH (owner);
+
+CREATE TABLE item (
+    data_type DATATYPE,
+    data_source DATASOURCE,
+    config_str VARCHAR,
+    owner uuid NOT NULL,
+    -- the owner of the inode above, inode is unique on (id, owner) only
+    inode_owner uuid NOT NULL,
+    FOREIGN KEY (owner, inode_owner) REFERENCES inode(id, owner) ON DELETE CASCADE
+);
+
+-- items are written as in closure_tables.sql, naming their inode alone
+CREATE OR REPLACE FUNCTION set_item_inode_owner()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.inode_owner IS NULL THEN
+        SELECT n.owner INTO NEW.inode_owner FROM inode n WHERE n.id = NEW.owner;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER set_inode_owner
+BEFORE INSERT ON item
+FOR EACH ROW
+EXECUTE FUNCTION set_item_inode_owner();
+
+-- no foreign keys: checking one against a partitioned table goes through
+-- the partitions for every row, and made inserts five times slower. The
+-- functions only link existing nodes, delete_inode_links does the cascade
+CREATE TABLE link(
+    owner uuid NOT NULL,
+    parent uuid NOT NULL,
+    child uuid NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (parent, child, owner)
+) PARTITION BY HASH (owner);
+
+-- descendants of a node sharing its trashed value, and the items among them:
+-- the live ones for a live node, the ones its restore brings back otherwise.
+-- Kept by the insert, move, delete, trash and restore functions, see
+-- closure_counts.sql. No foreign key either, delete_inode_links drops them
+CREATE TABLE node_counts (
+    id uuid NOT NULL,
+    owner uuid NOT NULL,
+    descendants INTEGER NOT NULL DEFAULT 0,
+    items INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (id, owner)
+) PARTITION BY HASH (owner);
+
+-- links and counters of the deleted rows, a subtree is deleted with its root
+-- or a node alone (delete_node) with the links through it
+CREATE OR REPLACE FUNCTION delete_inode_links()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM link t
+    USING old_rows o
+    WHERE t.owner = o.owner
+    AND t.child = o.id;
+
+    DELETE FROM link t
+    USING old_rows o
+    WHERE t.owner = o.owner
+    AND t.parent = o.id;
+
+    DELETE FROM node_counts c
+    USING old_rows o
+    WHERE c.owner = o.owner
+    AND c.id = o.id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER delete_links
+AFTER DELETE ON inode
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION delete_inode_links();
+
+-- the same number of partitions for every table, so an owner has its inode,
+-- link and node_counts rows in partitions of the same remainder. Raise it
+-- before loading the schema, repartitioning later means copying every row
+DO $$
+DECLARE
+    v_partitions INTEGER := 16;
+BEGIN
+    FOR i IN 0..v_partitions - 1 LOOP
+        EXECUTE format(
+            'CREATE TABLE inode_p%s PARTITION OF inode '
+            'FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+            i, v_partitions, i
+        );
+        EXECUTE format(
+            'CREATE TABLE link_p%s PARTITION OF link '
+            'FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+            i, v_partitions, i
+        );
+        EXECUTE format(
+            'CREATE TABLE node_counts_p%s PARTITION OF node_counts '
+            'FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+            i, v_partitions, i
+        );
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,7 @@
+-- Optional, after closure_common.sql (with either table script) where the
+-- pg_trgm contrib module is installed. Without it select_bypattern still works,
+-- but a pattern with no literal prefix scans all the paths of the owner.
+
+-- regex matches on path (select_bypattern) when there is no literal prefix
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_inode_path_trgm ON inode USING gin (path gin_trgm_ops);
@@ -0,0 +1,129 @@
+CREATE OR REPLACE FUNCTION rename_node(
+    p_id UUID,
+    p_owner UUID,
+    p_name VARCHAR(64)
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_old TEXT;
+    v_new TEXT;
+    v_updated_count INTEGER;
+BEGIN
+
+    CALL is_owner(p_id, p_owner);
+
+    SELECT n.path, left(n.path, length(n.path) - length(n.name)) || p_name
+    INTO v_old, v_new
+    FROM inode n
+    WHERE n.id = p_id
+    AND n.owner = p_owner;
+
+    -- idx_inode_sibling_name rejects a duplicated sibling
+    UPDATE inode SET name = p_name WHERE id = p_id AND owner = p_owner;
+
+    -- the node and its descendants share the renamed path prefix
+    UPDATE inode n
+    SET path = v_new || substr(n.path, length(v_old) + 1)
+    FROM link t
+    WHERE t.owner = p_owner
+    AND t.parent = p_id
+    AND n.owner = p_owner
+    AND n.id = t.child;
+
+    GET DIAGNOSTICS v_updated_count = ROW_COUNT;
+
+    RETURN v_updated_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION move_node(
+    p_id UUID,
+    p_owner UUID,
+    p_parent UUID DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_node_type NODETYPE;
+    v_name VARCHAR(64);
+    v_old_depth INTEGER;
+    v_old_path TEXT;
+    v_depth INTEGER := 0;
+    v_prefix TEXT := '';
+    v_moved_count INTEGER;
+BEGIN
+
+    CALL lock_counts(p_owner);
+
+    CALL is_owner(p_id, p_owner);
+
+    SELECT n.node_type, n.name, n.depth, n.path
+    INTO v_node_type, v_name, v_old_depth, v_old_path
+    FROM inode n
+    WHERE n.id = p_id
+    AND n.owner = p_owner;
+
+    CALL check_hierarchy(p_parent, v_node_type, p_owner);
+
+    IF EXISTS (
+        SELECT 1 FROM link t
+        WHERE t.owner = p_owner
+        AND t.parent = p_id
+        AND t.child = p_parent
+    ) THEN
+        RAISE EXCEPTION 'Node % can´t be moved under its own subtree node %', p_id, p_parent
+            USING ERRCODE = 'integrity_constraint_violation';
+    END IF;
+
+    IF p_parent IS NOT NULL THEN
+        SELECT n.depth + 1, n.path || '.' INTO v_depth, v_prefix
+        FROM inode n
+        WHERE n.id = p_parent
+        AND n.owner = p_owner;
+    END IF;
+
+    -- the old ancestors stop counting the subtree, the new ones start once
+    -- it is linked below them
+    CALL count_subtree(p_id, p_owner, -1);
+
+    -- disconnect the subtree from the ancestors of p_id: the links of a
+    -- descendant longer than its distance to p_id, read on idx_link_child.
+    -- Joined by parent, the links of the ancestors were read whole
+    DELETE FROM link t
+    USING link sub
+    WHERE sub.owner = p_owner
+    AND sub.parent = p_id
+    AND t.owner = p_owner
+    AND t.child = sub.child
+    AND t.depth > sub.depth;
+
+    -- and connect it to p_parent and its ancestors
+    INSERT INTO link (owner, parent, child, depth)
+    SELECT p_owner, sup.parent, sub.child, sup.depth + sub.depth + 1
+    FROM link sup, link sub
+    WHERE sup.owner = p_owner
+    AND sup.child = p_parent
+    AND sub.owner = p_owner
+    AND sub.parent = p_id;
+
+    CALL count_subtree(p_id, p_owner, 1);
+
+    -- idx_inode_sibling_name rejects a duplicated name under p_parent
+    UPDATE inode n
+    SET parent = CASE WHEN n.id = p_id THEN p_parent ELSE n.parent END,
+        depth = n.depth + v_depth - v_old_depth,
+        path = v_prefix || substr(n.path, length(v_old_path) - length(v_name) + 1)
+    FROM link t
+    WHERE t.owner = p_owner
+    AND t.parent = p_id
+    AND n.owner = p_owner
+    AND n.id = t.child;
+
+    GET DIAGNOSTICS v_moved_count = ROW_COUNT;
+
+    RETURN v_moved_count;
+END;
+$$;
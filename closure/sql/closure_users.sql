@@ -0,0 +1,12 @@
+-- loaded first, then closure_tables.sql or closure_tables_partitioned.sql
+-- and closure_common.sql
+
+CREATE TABLE users (
+    id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
+    name VARCHAR(64) NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TYPE DATATYPE AS ENUM ('float32', 'float64', 'byte','integer32', 'uinteger32', 'uinteger64', 'integer64', 'boolean', 'string');
+CREATE TYPE DATASOURCE AS ENUM ('datapoint', 'formula', 'calc', 'aggregator','fixed');
+CREATE TYPE NODETYPE AS ENUM ('node', 'item', 'template');
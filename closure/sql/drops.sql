@@ -1,7 +1,14 @@
+DROP SCHEMA template CASCADE;
+
+DROP TABLE inode_stage;
 DROP TABLE item;
+DROP TABLE link;
+DROP TABLE node_counts;
+DROP TABLE owner_counts;
 DROP TABLE inode;
 DROP TABLE users;
 
-DROP TYPE DATATYPE;
-DROP TYPE DATASOURCE;
-DROP TYPE NODETYPE;
\ No newline at end of file
+-- the functions of closure/sql take these types, CASCADE drops them too
+DROP TYPE DATATYPE CASCADE;
+DROP TYPE DATASOURCE CASCADE;
+DROP TYPE NODETYPE CASCADE;
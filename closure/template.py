@@ -5,6 +5,8 @@ from uuid import UUID
 from psycopg import Cursor
 from pydantic import BaseModel
 
+from closure import queries
+
 
 class Template(BaseModel):
 
@@ -31,12 +33,7 @@ class TemplateItem(BaseModel):
 
 
 def tmplt_insert_template(cur: Cursor, owner: UUID, template: Template) -> Any:
-    cur.execute(
-        """
-                SELECT template.add_template(%s, %s)
-                """,
-        (template.name, template.owner),
-    )
+    cur.execute(queries.ADD_TEMPLATE, (template.name, template.owner))
     return cur.fetchone()
 
 
@@ -0,0 +1,38 @@
+import pytest
+from psycopg import connect
+
+from closure.db import PoolConfig, load_schema
+
+# the owners the tests write as
+OWNERS = (
+    "3c07ee61-4fc0-44ca-b2ad-e6820f614f74",
+    "9a0cd152-259a-4852-8eaf-da8c7af032d6",
+)
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--schema",
+        choices=("plain", "partitioned"),
+        default=None,
+        help="drop the database schema and load closure/sql before the run, "
+        "with closure_tables.sql (plain) or closure_tables_partitioned.sql",
+    )
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema(request: pytest.FixtureRequest) -> None:
+    layout = request.config.getoption("--schema")
+    if layout is None:
+        return
+    with connect(PoolConfig.from_env().conninfo) as conn:
+        conn.execute(
+            "DROP SCHEMA IF EXISTS template CASCADE;"
+            " DROP SCHEMA IF EXISTS public CASCADE; CREATE SCHEMA public;"
+        )
+        load_schema(conn, partitioned=layout == "partitioned")
+        for n, owner in enumerate(OWNERS):
+            conn.execute(
+                "INSERT INTO users (id, name) VALUES (%s, %s)", (owner, f"u{n + 1}")
+            )
+        conn.commit()
@@ -0,0 +1,212 @@
+import asyncio
+from collections.abc import Sequence
+from uuid import UUID
+
+import pytest
+from psycopg import AsyncCursor, Error
+
+from closure.aclosure import (
+    clsr_delete_many,
+    clsr_count_types,
+    clsr_get_path,
+    clsr_get_paths,
+    clsr_insert,
+    clsr_insert_subtree,
+    clsr_len,
+    clsr_move,
+    clsr_purge,
+    clsr_recount,
+    clsr_rename,
+    clsr_restore,
+    clsr_select_byid,
+    clsr_select_byids,
+    clsr_select_bypath,
+    clsr_select_bypattern,
+    clsr_select_bypaths,
+    clsr_select_children,
+    clsr_select_children_page,
+    clsr_select_counts,
+    clsr_select_descendants,
+    clsr_select_descendants_wpath,
+    clsr_select_roots,
+    clsr_select_subtree_json,
+    clsr_trash_descendants,
+    iter_descendants,
+)
+from closure.atemplate import tmplt_insert_template
+from closure.closure import (
+    DuplicatedNameError,
+    IdNotFoundError,
+    Inode,
+    InodeRow,
+    InodeTree,
+    Page,
+)
+from closure.db import abootstrap, close_apool
+from closure.template import Template
+
+owner = UUID("3c07ee61-4fc0-44ca-b2ad-e6820f614f74")
+
+
+def make_node(i: int, name: str = "NODE") -> Inode:
+    return Inode(id=None, name=f"{name}{i}", template=None, node_type="node")
+
+
+# NODE0 with NODE1..3 below it, each with three children of its own; the ids
+# come depth-first: NODE1 is ids[1], NODE2 ids[5] and NODE3 ids[9]
+tree: InodeTree = (
+    make_node(0),
+    [
+        (make_node(i), [(make_node(3 * i + j), []) for j in range(1, 4)])
+        for i in range(1, 4)
+    ],
+)
+n = 13
+
+
+@pytest.fixture(scope="function")
+async def apack():
+
+    async with abootstrap() as conn:
+
+        cur = conn.cursor()
+        try:
+            ids = await clsr_insert_subtree(cur, owner, None, [tree])
+
+            yield cur, ids
+
+        finally:
+            await conn.rollback()
+            await cur.execute("DELETE FROM inode")  # Cleanup the test data
+            await conn.commit()
+            await cur.close()
+
+    # the pool of this test's loop, its reset must not outlive the loop
+    await close_apool()
+
+
+async def test_select(apack: tuple[AsyncCursor, Sequence[UUID]]):
+
+    cur, ids = apack
+
+    assert await clsr_len(cur, owner) == (n,)
+    assert await clsr_count_types(cur, owner) == {"node": n}
+    assert await clsr_select_counts(cur, owner, ids[1]) == (3, 0)
+    assert [row.name for row in await clsr_select_roots(cur, owner)] == ["NODE0"]
+    assert await clsr_select_byid(cur, owner, ids[1]) == InodeRow(
+        ids[1], "NODE1", None, "node"
+    )
+
+    children = await clsr_select_children(cur, owner, ids[0])
+    assert [row.name for row in children] == ["NODE1", "NODE2", "NODE3"]
+    descendants = await clsr_select_descendants(cur, owner, ids[0])
+    assert len(descendants) == n - 1
+
+    (path,) = await clsr_get_path(cur, owner, ids[2])
+    assert path == "NODE0.NODE1.NODE4"
+    row = await clsr_select_bypath(cur, owner, "NODE0", ["NODE1", "NODE4"])
+    assert row.id == ids[2]
+    assert await clsr_select_bypaths(cur, owner, [path]) == {path: ids[2]}
+    rows = await clsr_select_byids(cur, owner, [ids[2], UUID(int=1)])
+    assert rows[ids[2]] == InodeRow(ids[2], "NODE4", None, "node")
+    assert isinstance(rows[UUID(int=1)], IdNotFoundError)
+    assert await clsr_get_paths(cur, owner, [ids[2]]) == {ids[2]: path}
+
+    page = await clsr_select_children_page(cur, owner, ids[0], limit=2)
+    assert isinstance(page, Page)
+    page = await clsr_select_children_page(
+        cur, owner, ids[0], after=page.after, limit=2
+    )
+    assert [row.name for row in page.rows] == ["NODE3"]
+
+    (subtree,) = await clsr_select_subtree_json(cur, owner, ids[0], max_depth=1)
+    assert [child["name"] for child in subtree["children"]] == [
+        "NODE1",
+        "NODE2",
+        "NODE3",
+    ]
+
+    with pytest.raises(IdNotFoundError):
+        await clsr_select_byid(cur, owner, UUID(int=1))
+
+
+async def test_stream(apack: tuple[AsyncCursor, Sequence[UUID]]):
+
+    cur, ids = apack
+
+    rows = [row async for row in iter_descendants(cur, owner, ids[0], batch_size=4)]
+    assert [row.name for row in rows[:3]] == ["NODE1", "NODE2", "NODE3"]
+    assert len(rows) == n - 1
+
+    rows = [row async for row in clsr_select_bypattern(cur, owner, "NODE0.*.NODE1?")]
+    assert [row.path for row in rows] == [
+        "NODE0.NODE3.NODE10",
+        "NODE0.NODE3.NODE11",
+        "NODE0.NODE3.NODE12",
+    ]
+
+
+async def test_update(apack: tuple[AsyncCursor, Sequence[UUID]]):
+
+    cur, ids = apack
+
+    await clsr_rename(cur, owner, ids[1], "NAME1")
+    (path,) = await clsr_get_path(cur, owner, ids[2])
+    assert path == "NODE0.NAME1.NODE4"
+
+    with pytest.raises(DuplicatedNameError):
+        await clsr_insert(cur, owner, ids[0], make_node(2))
+    await cur.connection.rollback()
+
+    ids = await clsr_insert_subtree(cur, owner, None, [tree])
+    await clsr_move(cur, owner, ids[5], ids[1])
+    rows = await clsr_select_descendants_wpath(cur, owner, ids[1])
+    assert "NODE0.NODE1.NODE2.NODE9" in [row.path for row in rows]
+
+    await clsr_trash_descendants(cur, owner, ids[1])
+    assert await clsr_len(cur, owner) == (n - 8,)
+    await clsr_restore(cur, owner, ids[1])
+    assert await clsr_len(cur, owner) == (n,)
+
+    await clsr_trash_descendants(cur, owner, ids[9])
+    assert await clsr_purge(cur.connection, chunk=2) == 4
+    assert await clsr_delete_many(cur, owner, [ids[1]]) == {ids[1]: 8}
+    assert await clsr_recount(cur, owner) == 0
+
+
+async def test_concurrent(apack: tuple[AsyncCursor, Sequence[UUID]]):
+
+    cur, ids = apack
+    await cur.connection.commit()
+
+    # one connection per task, the queries run side by side on the server
+    async def children(id: UUID) -> list[str]:
+        async with abootstrap() as conn:
+            return [
+                row.name for row in await clsr_select_children(conn.cursor(), owner, id)
+            ]
+
+    names = await asyncio.gather(*(children(id) for id in ids))
+    assert names[0] == ["NODE1", "NODE2", "NODE3"]
+    assert names[1] == ["NODE4", "NODE5", "NODE6"]
+    assert sum(len(x) for x in names) == n - 1
+
+
+async def test_insert_template():
+
+    async with abootstrap() as conn:
+        cur = conn.cursor()
+
+        (inserted,) = await tmplt_insert_template(
+            cur, owner, Template(id=None, name="atemp1", owner=owner)
+        )
+        assert isinstance(inserted, UUID)
+
+        with pytest.raises(expected_exception=Error):
+            await tmplt_insert_template(
+                cur, owner, Template(id=None, name="atemp1", owner=owner)
+            )
+
+        await conn.rollback()
+
+    await close_apool()
@@ -0,0 +1,135 @@
+import asyncio
+from threading import Thread
+from typing import Any
+
+import pytest
+from psycopg_pool import AsyncConnectionPool
+
+from closure.db import (
+    PoolConfig,
+    abootstrap,
+    bootstrap,
+    close_apool,
+    close_pool,
+    get_apool,
+    get_pool,
+    pool_stats,
+)
+
+
+def test_config_from_env(monkeypatch: pytest.MonkeyPatch):
+
+    monkeypatch.setenv("CLOSURE_DSN", "host=db user=app")
+    monkeypatch.setenv("CLOSURE_POOL_MAX_SIZE", "20")
+    monkeypatch.setenv("CLOSURE_POOL_CHECK", "false")
+    monkeypatch.setenv("CLOSURE_PREPARE_THRESHOLD", "")
+    monkeypatch.setenv("CLOSURE_SEARCH_PATH", "tenant1, public")
+
+    config = PoolConfig.from_env()
+    assert config.conninfo == "host=db user=app"
+    assert (config.min_size, config.max_size) == (1, 20)
+    assert config.check is False
+    assert config.prepare_threshold is None
+    assert config.search_path == "tenant1, public"
+
+    monkeypatch.delenv("CLOSURE_DSN")
+    assert PoolConfig.from_env().conninfo == PoolConfig().conninfo
+
+
+@pytest.fixture(scope="function")
+def small_pool():
+
+    close_pool()
+    config = PoolConfig(max_size=2, prepare_threshold=None, search_path="public")
+    yield get_pool(config)
+    close_pool()
+
+
+def test_pool(small_pool):
+
+    with bootstrap() as conn:
+        assert conn.prepare_threshold is None
+        assert conn.execute("SHOW search_path").fetchone() == ("public",)
+        conn.execute("CREATE TEMP TABLE t (x INTEGER)")
+
+    # uncommitted work does not survive the return to the pool
+    with bootstrap() as conn:
+        assert conn.execute("SELECT to_regclass('t')").fetchone() == (None,)
+
+    def borrow():
+        with bootstrap() as conn:
+            conn.execute("SELECT pg_sleep(0.05)")
+
+    threads = [Thread(target=borrow) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = pool_stats(small_pool)
+    assert stats.requests == 6
+    assert stats.size <= 2
+    # four borrowers for two connections, two of them waited
+    assert stats.queued >= 2
+    assert stats.wait_ms > 0 and stats.wait_avg_ms > 0
+    assert stats.errors == 0
+
+    # the pool keeps its config, another one is refused
+    assert get_pool() is small_pool
+    assert (
+        get_pool(PoolConfig(max_size=2, prepare_threshold=None, search_path="public"))
+        is small_pool
+    )
+    with pytest.raises(ValueError):
+        get_pool(PoolConfig(max_size=3))
+
+
+def test_pool_reset():
+
+    close_pool()
+    get_pool(PoolConfig(min_size=1, max_size=1, search_path="public"))
+
+    # the session settings and channels of a borrower go with it
+    with bootstrap() as conn:
+        conn.autocommit = True
+        conn.execute("LISTEN inode_changes")
+        conn.execute("SET search_path = pg_catalog")
+        conn.execute("SET work_mem = '1MB'")
+    with bootstrap() as conn:
+        assert conn.autocommit is False
+        assert conn.execute("SHOW search_path").fetchone() == ("public",)
+        assert conn.execute("SHOW work_mem").fetchone() != ("1MB",)
+        assert conn.execute("SELECT pg_listening_channels()").fetchall() == []
+
+    close_pool()
+
+
+async def test_apool(monkeypatch: pytest.MonkeyPatch):
+
+    await close_apool()
+    # callers racing for the first pool of the loop all get the same one, even
+    # when opening it lets the others run
+    open_pool = AsyncConnectionPool.open
+
+    async def slow_open(pool: AsyncConnectionPool, *args: Any, **kwargs: Any) -> None:
+        await asyncio.sleep(0.01)
+        await open_pool(pool, *args, **kwargs)
+
+    monkeypatch.setattr(AsyncConnectionPool, "open", slow_open)
+    pools = await asyncio.gather(*(get_apool(PoolConfig(max_size=2)) for _ in range(4)))
+    pool = pools[0]
+    assert all(p is pool for p in pools)
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        await get_apool(PoolConfig(max_size=3))
+
+    async def borrow():
+        async with abootstrap() as conn:
+            await conn.execute("SELECT pg_sleep(0.05)")
+
+    await asyncio.gather(*(borrow() for _ in range(4)))
+
+    stats = pool_stats(pool)
+    assert stats.requests == 4
+    assert stats.queued >= 2
+    await close_apool()
@@ -0,0 +1,491 @@
+from collections.abc import Callable, Generator
+from contextlib import AbstractContextManager, nullcontext
+from functools import partial
+from types import ModuleType
+from typing import Any, NamedTuple
+from uuid import UUID, uuid4
+
+import pytest
+
+from closure import closure, memory
+from closure.closure import (
+    DuplicatedNameError,
+    HierarchyError,
+    IdNotFoundError,
+    Inode,
+    InvalidNameError,
+    NodeCounts,
+    OwnershipError,
+    map_error,
+)
+from closure.db import bootstrap
+
+owner = UUID("3c07ee61-4fc0-44ca-b2ad-e6820f614f74")
+owner2 = UUID("9a0cd152-259a-4852-8eaf-da8c7af032d6")
+
+
+class Backend(NamedTuple):
+    api: ModuleType
+    # a cursor for closure.py, a MemoryTree for memory.py
+    cur: Any
+    # what clsr_purge takes
+    conn: Any
+    savepoint: Callable[[], AbstractContextManager[Any]]
+
+    def fails(self, call: Callable[[], Any]) -> Exception:
+        "The error of call, mapped as a batch call maps it; the tree stays usable"
+        with pytest.raises(Exception) as info:
+            with self.savepoint():
+                call()
+        return map_error(info.value)
+
+
+def node(name: str, node_type: Any = "node") -> Inode:
+    return Inode(id=None, name=name, template=None, node_type=node_type)
+
+
+# NODE0
+#   NODE1
+#     NODE3
+#     NODE4
+#       NODE5
+#   NODE2
+#     ITEM6 (item)
+#     NODE7
+def populate_tree(b: Backend) -> list[UUID]:
+
+    tree = [
+        (
+            node("NODE0"),
+            [
+                (
+                    node("NODE1"),
+                    [(node("NODE3"), []), (node("NODE4"), [(node("NODE5"), [])])],
+                ),
+                (node("NODE2"), [(node("ITEM6", "item"), []), (node("NODE7"), [])]),
+            ],
+        )
+    ]
+    # depth-first: NODE0, NODE1, NODE3, NODE4, NODE5, NODE2, ITEM6, NODE7
+    i0, i1, i3, i4, i5, i2, i6, i7 = b.api.clsr_insert_subtree(b.cur, owner, None, tree)
+    return [i0, i1, i2, i3, i4, i5, i6, i7]
+
+
+n = 8
+
+
+@pytest.fixture(scope="function", params=["postgres", "memory"])
+def pack(
+    request: pytest.FixtureRequest,
+) -> Generator[tuple[Backend, list[UUID]], None, None]:
+
+    if request.param == "memory":
+        tree = memory.MemoryTree()
+        tree.add_owner(owner)
+        tree.add_owner(owner2)
+        b = Backend(memory, tree, tree, nullcontext)
+        yield b, populate_tree(b)
+        return
+
+    with bootstrap() as conn:
+        cur = conn.cursor()
+        b = Backend(closure, cur, conn, conn.transaction)
+        try:
+            yield b, populate_tree(b)
+        finally:
+            conn.rollback()
+            cur.execute("DELETE FROM inode")
+            conn.commit()
+            cur.close()
+
+
+def names(rows: list[Any]) -> list[str]:
+    return sorted(row.name for row in rows)
+
+
+def test_len(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    assert b.api.clsr_len(b.cur, owner) == (n,)
+    assert b.api.clsr_len(b.cur, owner2) == (0,)
+    assert b.api.clsr_count_types(b.cur, owner) == {"node": n - 1, "item": 1}
+    assert b.api.clsr_count_types(b.cur, owner2) == {}
+
+    assert b.api.clsr_select_counts(b.cur, owner, ids[0]) == NodeCounts(n - 1, 1)
+    assert b.api.clsr_select_counts(b.cur, owner, ids[1]) == (3, 0)
+    assert b.api.clsr_select_counts(b.cur, owner, ids[5]) == (0, 0)
+    assert b.api.clsr_recount(b.cur, owner) == 0
+
+
+def test_select(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+    missing = uuid4()
+
+    assert names(b.api.clsr_select_roots(b.cur, owner)) == ["NODE0"]
+    assert b.api.clsr_select_roots(b.cur, owner2) == []
+    assert b.api.clsr_select_root_byid(b.cur, owner, ids[5]).id == ids[0]
+    assert b.api.clsr_select_root_byid(b.cur, owner2, ids[5]) is None
+
+    assert b.api.clsr_select_byid(b.cur, owner, ids[6]) == (
+        ids[6],
+        "ITEM6",
+        None,
+        "item",
+    )
+    rows = b.api.clsr_select_byids(b.cur, owner, [ids[3], missing])
+    assert rows[ids[3]].name == "NODE3"
+    assert isinstance(rows[missing], IdNotFoundError)
+
+    assert b.api.clsr_get_path(b.cur, owner, ids[5]) == ("NODE0.NODE1.NODE4.NODE5",)
+    assert b.api.clsr_get_path(b.cur, owner2, ids[5]) is None
+    paths = b.api.clsr_get_paths(b.cur, owner, [ids[2], missing])
+    assert paths[ids[2]] == "NODE0.NODE2"
+    assert isinstance(paths[missing], IdNotFoundError)
+
+
+def test_select_bypath(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    row = b.api.clsr_select_bypath(b.cur, owner, "NODE0", ["NODE1", "NODE4"])
+    assert row.id == ids[4]
+    row = b.api.clsr_select_bypath(b.cur, owner, "NODE0", [])
+    assert row.id == ids[0]
+    e = b.fails(lambda: b.api.clsr_select_bypath(b.cur, owner, "NODE0", ["NODE3"]))
+    assert isinstance(e, IdNotFoundError)
+    # a dot in the root or a name is no way around the depth of the path
+    for args in (("NODE0.NODE1", ["NODE4"]), ("NODE0", ["NODE1.NODE4"])):
+        e = b.fails(partial(b.api.clsr_select_bypath, b.cur, owner, *args))
+        assert isinstance(e, IdNotFoundError)
+
+    found = b.api.clsr_select_bypaths(b.cur, owner, ["NODE0.NODE2.ITEM6", "NODE9"])
+    assert found["NODE0.NODE2.ITEM6"] == ids[6]
+    assert isinstance(found["NODE9"], IdNotFoundError)
+
+    rows = list(b.api.clsr_select_bypattern(b.cur, owner, "NODE0.*.NODE?"))
+    assert [row.path for row in rows] == [
+        "NODE0.NODE1.NODE3",
+        "NODE0.NODE1.NODE4",
+        "NODE0.NODE2.NODE7",
+    ]
+    rows = list(b.api.clsr_select_bypattern(b.cur, owner, "**.NODE5"))
+    assert [row.id for row in rows] == [ids[5]]
+    # ** matches no segment as well
+    rows = list(b.api.clsr_select_bypattern(b.cur, owner, "NODE0.**"))
+    assert len(rows) == n
+
+
+def test_children(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    assert names(b.api.clsr_select_children(b.cur, owner, ids[0])) == ["NODE1", "NODE2"]
+    assert b.api.clsr_select_children(b.cur, owner, ids[5]) == []
+
+    rows = b.api.clsr_select_children_wpath(b.cur, owner, ids[2])
+    assert sorted(row.path for row in rows) == [
+        "NODE0.NODE2.ITEM6",
+        "NODE0.NODE2.NODE7",
+    ]
+
+    (rows,) = b.api.clsr_select_children_json(b.cur, owner, ids[2])
+    assert sorted(rows, key=lambda r: r["name"]) == [
+        {"id": str(ids[6]), "name": "ITEM6", "template": None, "node_type": "item"},
+        {"id": str(ids[7]), "name": "NODE7", "template": None, "node_type": "node"},
+    ]
+    assert b.api.clsr_select_children_json(b.cur, owner, ids[5]) == (None,)
+
+
+def test_descendants(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    rows = b.api.clsr_select_descendants(b.cur, owner, ids[1])
+    assert names(rows) == ["NODE3", "NODE4", "NODE5"]
+    assert [row.parent_id for row in rows] == [ids[1], ids[1], ids[4]]
+    # by depth
+    assert rows[-1].name == "NODE5"
+
+    rows = b.api.clsr_select_descendants_wpath(b.cur, owner, ids[1])
+    assert rows[-1] == (
+        ids[4],
+        ids[5],
+        "NODE5",
+        "NODE0.NODE1.NODE4.NODE5",
+        None,
+        "node",
+    )
+
+    (rows,) = b.api.clsr_select_descendants_json(b.cur, owner, ids[4])
+    assert rows == [
+        {
+            "parent_id": str(ids[4]),
+            "id": str(ids[5]),
+            "name": "NODE5",
+            "template": None,
+            "node_type": "node",
+        }
+    ]
+    (rows,) = b.api.clsr_select_descendants_json(b.cur, owner, ids[1])
+    assert {row["name"]: row["parent_id"] for row in rows} == {
+        "NODE3": str(ids[1]),
+        "NODE4": str(ids[1]),
+        "NODE5": str(ids[4]),
+    }
+
+    rows = list(b.api.iter_descendants(b.cur, owner, ids[0], order="path"))
+    assert [row.id for row in rows] == [ids[i] for i in (1, 3, 4, 5, 2, 6, 7)]
+    assert rows[3].parent_id == ids[4]
+    rows = list(b.api.iter_descendants_wpath(b.cur, owner, ids[0]))
+    assert [row.path.count(".") for row in rows] == [1, 1, 2, 2, 2, 2, 3]
+    assert list(b.api.iter_descendants(b.cur, owner, ids[7])) == []
+
+
+def test_subtree_json(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    (tree,) = b.api.clsr_select_subtree_json(b.cur, owner, ids[2])
+    assert tree == {
+        "id": str(ids[2]),
+        "name": "NODE2",
+        "template": None,
+        "node_type": "node",
+        "children": [
+            {
+                "id": str(ids[6]),
+                "name": "ITEM6",
+                "template": None,
+                "node_type": "item",
+                "children": [],
+            },
+            {
+                "id": str(ids[7]),
+                "name": "NODE7",
+                "template": None,
+                "node_type": "node",
+                "children": [],
+            },
+        ],
+    }
+
+    (tree,) = b.api.clsr_select_subtree_json(b.cur, owner, ids[0], max_depth=1)
+    assert [c["name"] for c in tree["children"]] == ["NODE1", "NODE2"]
+    assert "children" not in tree["children"][0]
+
+    (tree,) = b.api.clsr_select_subtree_json(b.cur, owner, ids[0], max_depth=0)
+    assert "children" not in tree
+    e = b.fails(lambda: b.api.clsr_select_subtree_json(b.cur, owner, ids[0], -1))
+    assert isinstance(e, ValueError)
+
+
+def test_pages(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    def pages(select: Callable[..., Any], id: UUID, limit: int) -> list[Any]:
+        rows, after = [], None
+        while True:
+            page = select(b.cur, owner, id, after=after, limit=limit)
+            rows += page.rows
+            if page.after is None:
+                return rows
+            after = page.after
+
+    rows = pages(b.api.clsr_select_children_page, ids[2], 1)
+    assert [row.name for row in rows] == ["ITEM6", "NODE7"]
+
+    # (depth, path) order
+    rows = pages(b.api.clsr_select_descendants_page, ids[0], 2)
+    assert [row.id for row in rows] == [ids[i] for i in (1, 2, 3, 4, 6, 7, 5)]
+    assert rows[-1].parent_id == ids[4]
+
+    # rows sharing a path go in id order, none is skipped between pages
+    (item,) = b.api.clsr_insert(b.cur, owner, ids[1], node("NODE4", "item"))
+    b.api.clsr_insert(b.cur, owner, item, node("NODE5", "item"))
+    rows = pages(b.api.clsr_select_descendants_page, ids[0], 1)
+    assert len({row.id for row in rows}) == n + 1
+
+
+def test_rename_move(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    assert b.api.clsr_rename(b.cur, owner, ids[1], "NODE8") == (4,)
+    assert b.api.clsr_get_path(b.cur, owner, ids[5]) == ("NODE0.NODE8.NODE4.NODE5",)
+
+    assert b.api.clsr_move(b.cur, owner, ids[4], ids[7]) == (2,)
+    assert b.api.clsr_get_path(b.cur, owner, ids[5]) == (
+        "NODE0.NODE2.NODE7.NODE4.NODE5",
+    )
+    assert b.api.clsr_select_counts(b.cur, owner, ids[2]) == (4, 1)
+
+    assert b.api.clsr_move(b.cur, owner, ids[4], None) == (2,)
+    assert names(b.api.clsr_select_roots(b.cur, owner)) == ["NODE0", "NODE4"]
+    assert b.api.clsr_select_root_byid(b.cur, owner, ids[5]).id == ids[4]
+
+
+def test_delete(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    # NODE4 and NODE5 go to NODE1
+    assert b.api.clsr_delete_node(b.cur, owner, ids[4]) == (1,)
+    assert b.api.clsr_get_path(b.cur, owner, ids[5]) == ("NODE0.NODE1.NODE5",)
+    assert names(b.api.clsr_select_children(b.cur, owner, ids[1])) == ["NODE3", "NODE5"]
+
+    # a child named like its deleted parent takes its place
+    (id,) = b.api.clsr_insert(b.cur, owner, ids[5], node("NODE5"))
+    assert b.api.clsr_delete_node(b.cur, owner, ids[5]) == (1,)
+    assert b.api.clsr_get_path(b.cur, owner, id) == ("NODE0.NODE1.NODE5",)
+    assert b.api.clsr_select_counts(b.cur, owner, ids[1]) == (2, 0)
+    assert b.api.clsr_recount(b.cur, owner) == 0
+
+    assert b.api.clsr_delete_descendants(b.cur, owner, ids[1]) == (3,)
+    assert b.api.clsr_len(b.cur, owner) == (n - 4,)
+
+    assert b.api.clsr_delete_many(b.cur, owner, [ids[7], ids[2], ids[7]]) == {
+        ids[7]: 1,
+        ids[2]: 2,
+    }
+    assert b.api.clsr_len(b.cur, owner) == (1,)
+    assert b.api.clsr_select_counts(b.cur, owner, ids[0]) == (0, 0)
+
+
+def test_trash_restore_purge(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+
+    assert b.api.clsr_trash_descendants(b.cur, owner, ids[5]) == (1,)
+    assert b.api.clsr_trash_descendants(b.cur, owner, ids[1]) == (3,)
+    assert b.api.clsr_len(b.cur, owner) == (n - 4,)
+    assert b.api.clsr_select_counts(b.cur, owner, ids[0]) == (n - 5, 1)
+    assert b.api.clsr_get_path(b.cur, owner, ids[3]) is None
+
+    # the name is free while NODE1 is in the trash
+    (id,) = b.api.clsr_insert(b.cur, owner, ids[0], node("NODE1"))
+    e = b.fails(lambda: b.api.clsr_restore(b.cur, owner, ids[1]))
+    assert isinstance(e, DuplicatedNameError)
+    b.api.clsr_delete_node(b.cur, owner, id)
+
+    # NODE5 was trashed on its own and stays there
+    assert b.api.clsr_restore(b.cur, owner, ids[1]) == (3,)
+    assert b.api.clsr_select_counts(b.cur, owner, ids[1]) == (2, 0)
+    e = b.fails(lambda: b.api.clsr_restore(b.cur, owner, ids[1]))
+    assert isinstance(e, IdNotFoundError)
+
+    assert b.api.clsr_purge(b.conn) == 1
+    assert b.api.clsr_len(b.cur, owner) == (n - 1,)
+    assert b.api.clsr_recount(b.cur, owner) == 0
+
+
+def test_fail(pack: tuple[Backend, list[UUID]]):
+
+    b, ids = pack
+    api, cur = b.api, b.cur
+
+    for call in (
+        lambda: api.clsr_select_children(cur, owner2, ids[0]),
+        lambda: api.clsr_select_descendants(cur, owner, uuid4()),
+        lambda: api.clsr_select_subtree_json(cur, owner2, ids[0]),
+        lambda: list(api.iter_descendants(cur, owner2, ids[0])),
+        lambda: api.clsr_select_counts(cur, owner2, ids[0]),
+        lambda: api.clsr_insert(cur, owner2, ids[0], node("NODE9")),
+        lambda: api.clsr_rename(cur, owner2, ids[1], "NODE9"),
+        lambda: api.clsr_move(cur, owner, ids[1], uuid4()),
+        lambda: api.clsr_delete_node(cur, owner2, ids[1]),
+        lambda: api.clsr_delete_many(cur, owner, [ids[1], uuid4()]),
+        lambda: api.clsr_trash_descendants(cur, owner2, ids[1]),
+    ):
+        assert isinstance(b.fails(call), IdNotFoundError)
+
+    # NODE3 under NODE2 and NODE5 under NODE1 again
+    api.clsr_insert(cur, owner, ids[2], node("NODE3"))
+    api.clsr_insert(cur, owner, ids[1], node("NODE5"))
+    for call in (
+        lambda: api.clsr_insert(cur, owner, ids[0], node("NODE2")),
+        lambda: api.clsr_rename(cur, owner, ids[3], "NODE4"),
+        lambda: api.clsr_move(cur, owner, ids[3], ids[2]),
+        # NODE5 would be promoted next to the other one
+        lambda: api.clsr_delete_node(cur, owner, ids[4]),
+        lambda: api.clsr_insert_many(
+            cur, owner, ids[5], [node("A"), node("B"), node("B")], [None, 0, 0]
+        ),
+    ):
+        assert isinstance(b.fails(call), DuplicatedNameError)
+
+    for call in (
+        lambda: api.clsr_insert(cur, owner, None, node("ITEM9", "item")),
+        lambda: api.clsr_insert(cur, owner, ids[6], node("NODE9")),
+        lambda: api.clsr_move(cur, owner, ids[1], ids[5]),
+        lambda: api.clsr_move(cur, owner, ids[1], ids[1]),
+    ):
+        assert isinstance(b.fails(call), HierarchyError)
+    with pytest.raises(ValueError):
+        api.clsr_insert_many(cur, owner, None, [node("A")], [0])
+
+    for call in (
+        lambda: api.clsr_insert(cur, owner, ids[0], node("A.B")),
+        lambda: api.clsr_rename(cur, owner, ids[3], "NODE3."),
+        lambda: api.clsr_insert_many(
+            cur, owner, ids[5], [node("A"), node(".B")], [None, 0]
+        ),
+    ):
+        assert isinstance(b.fails(call), InvalidNameError)
+
+    for call in (
+        lambda: api.clsr_insert(cur, owner, ids[0], node("A" * 65)),
+        lambda: api.clsr_rename(cur, owner, ids[3], "A" * 65),
+        lambda: api.clsr_insert_many(
+            cur, owner, ids[5], [node("A"), node("B" * 65)], [None, 0]
+        ),
+    ):
+        assert isinstance(b.fails(call), InvalidNameError)
+    api.clsr_rename(cur, owner, ids[7], "A" * 64)
+    api.clsr_rename(cur, owner, ids[7], "NODE7")
+
+    template = Inode(id=None, name="A", template=ids[0], node_type="node")
+    with pytest.raises(ValueError):
+        api.clsr_insert_many(cur, owner, ids[5], [template], [None])
+    # an empty batch still checks its parent
+    assert api.clsr_insert_many(cur, owner, ids[5], [], []) == []
+    assert isinstance(
+        b.fails(lambda: api.clsr_insert_many(cur, owner, uuid4(), [], [])),
+        IdNotFoundError,
+    )
+
+    # what failed left no trace
+    assert api.clsr_len(cur, owner) == (n + 2,)
+    assert api.clsr_get_path(cur, owner, ids[5]) == ("NODE0.NODE1.NODE4.NODE5",)
+
+
+def test_memory_owner():
+
+    tree = memory.MemoryTree()
+
+    with pytest.raises(OwnershipError):
+        memory.clsr_len(tree, owner)
+    with pytest.raises(OwnershipError):
+        memory.clsr_insert(tree, owner, None, node("NODE0"))
+
+    tree.add_owner(owner)
+    assert memory.clsr_len(tree, owner) == (0,)
+
+
+def test_memory_wide_tree():
+
+    tree = memory.MemoryTree()
+    tree.add_owner(owner)
+    size = 20_000
+    inodes = [node(f"NODE{i}") for i in range(size)]
+    parents = [None] + [(i - 1) // 20 for i in range(1, size)]
+    ids = memory.clsr_insert_many(tree, owner, None, inodes, parents)
+
+    assert memory.clsr_select_counts(tree, owner, ids[0]) == (size - 1, 0)
+    below = memory.clsr_select_counts(tree, owner, ids[1]).descendants
+    assert memory.clsr_trash_descendants(tree, owner, ids[1]) == (below + 1,)
+    assert memory.clsr_len(tree, owner) == (size - below - 1,)
+    assert memory.clsr_purge(tree) == below + 1
+    assert memory.clsr_recount(tree, owner) == 0
@@ -2,20 +2,45 @@ from collections.abc import Sequence
 from uuid import UUID, uuid4
 
 import pytest
-from psycopg import Cursor, Error
+from psycopg import Cursor, Error, connect
+from psycopg.errors import (
+    InvalidParameterValue,
+    PipelineAborted,
+)
 
 from closure.closure import (
+    DuplicatedNameError,
+    HierarchyError,
     IdNotFoundError,
     Inode,
+    InvalidNameError,
+    batch,
     clsr_delete_descendants,
+    clsr_delete_many,
     clsr_delete_node,
     clsr_insert,
+    clsr_insert_many,
     clsr_len,
+    clsr_move,
+    clsr_rename,
+    clsr_restore,
+    clsr_select_bypath,
     clsr_select_byid,
     clsr_select_children,
+    clsr_select_children_page,
+    clsr_select_children_json,
+    clsr_select_children_wpath,
+    clsr_select_counts,
     clsr_select_descendants,
+    clsr_select_descendants_page,
+    clsr_select_descendants_json,
+    clsr_select_descendants_wpath,
+    clsr_select_subtree_json,
+    clsr_trash_descendants,
+    iter_descendants,
 )
-from closure.db import bootstrap
+from closure.db import PoolConfig, bootstrap
+from closure.loader import StageRow, clsr_copy_load
 
 
 def populate_tree(cur: Cursor, nodes: Sequence[Inode], owner: UUID):
@@ -77,7 +102,6 @@ def pack():  # request: pytest.FixtureRequest):
                 conn.rollback()  # Rollback if cleanup fails (optional)
             finally:
                 cur.close()  # Close cursor
-                conn.close()  # Close connection
 
 
 def test_owner_low_level(pack: tuple[Cursor, UUID, Sequence[UUID]]):
@@ -168,10 +192,11 @@ def test_insert_fail_same_name_sibling(pack: tuple[Cursor, UUID, Sequence[UUID]]
 
     clsr_insert(cur, owner, ids[4], new_node)
 
-    with pytest.raises(expected_exception=Error):
-        clsr_insert(cur, owner, ids[1], new_node)
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        with cur.connection.transaction():
+            clsr_insert(cur, owner, ids[1], new_node)
 
-    with pytest.raises(expected_exception=Error):
+    with pytest.raises(expected_exception=DuplicatedNameError):
         clsr_insert(cur, owner, ids[2], new_node2)
 
 
@@ -180,7 +205,7 @@ def test_insert_fail_same_name_root(pack: tuple[Cursor, UUID, Sequence[UUID]]):
 
     new_node = Inode(id=None, name="NODE0", template=None, node_type="node")
 
-    with pytest.raises(expected_exception=Error):
+    with pytest.raises(expected_exception=DuplicatedNameError):
         clsr_insert(cur, owner, None, new_node)
 
 
@@ -267,6 +292,403 @@ def test_delete_descendants_fail_noid(pack: tuple[Cursor, UUID, Sequence[UUID]])
         clsr_delete_descendants(cur, owner2, ids[0])
 
 
+def test_insert_many_fail_same_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        clsr_insert_many(cur, owner, ids[0], [nodes[3], nodes[3]], [None, None])
+
+
+def test_insert_many_fail_existing_sibling(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        clsr_insert_many(cur, owner, ids[0], [nodes[1]], [None])
+
+
+def test_insert_many_fail_hierarchy(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    item = Inode(id=None, name="ITEM", template=None, node_type="item")
+
+    with pytest.raises(expected_exception=HierarchyError):
+        clsr_insert_many(cur, owner, ids[0], [item, nodes[1]], [None, 0])
+
+
+def test_insert_many_fail_parent_index(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=ValueError):
+        clsr_insert_many(cur, owner, ids[0], [nodes[3], nodes[4]], [1, None])
+
+
+def test_insert_many_fail_long_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+    "Too long for inode.name, as with clsr_insert, rather than cut to 64"
+    cur, owner, ids = pack
+
+    inode = Inode(id=None, name="N" * 70, template=None, node_type="node")
+    with pytest.raises(expected_exception=InvalidNameError):
+        clsr_insert_many(cur, owner, ids[0], [inode], [None])
+
+
+def test_insert_many_fail_empty(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, _, ids = pack
+
+    with pytest.raises(expected_exception=Error):
+        clsr_insert_many(cur, owner2, ids[0], [], [])
+
+
+def test_insert_many_fail_template(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    inode = Inode(id=None, name="NODE", template=ids[1], node_type="node")
+    with pytest.raises(expected_exception=ValueError):
+        clsr_insert_many(cur, owner, ids[0], [inode], [None])
+
+
+def test_copy_load_fail_cycle(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    rows: list[StageRow] = [("a", "b", "A", "node"), ("b", "a", "B", "node")]
+    with pytest.raises(expected_exception=Error):
+        clsr_copy_load(cur, owner, ids[0], rows)
+
+
+def test_copy_load_fail_same_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    rows: list[StageRow] = [
+        ("a", None, "A", "node"),
+        ("b", "a", "B", "node"),
+        ("c", "a", "B", "node"),
+    ]
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        clsr_copy_load(cur, owner, ids[0], rows)
+
+
+def test_copy_load_fail_existing_sibling(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        clsr_copy_load(cur, owner, ids[0], [("a", None, "NODE1", "node")])
+
+
+def test_copy_load_fail_hierarchy(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    rows: list[StageRow] = [("a", None, "A", "item"), ("b", "a", "B", "node")]
+    with pytest.raises(expected_exception=HierarchyError):
+        clsr_copy_load(cur, owner, ids[0], rows)
+
+
+def test_fail_dotted_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+    "A dot separates the names of a path, no name may hold one"
+    cur, owner, ids = pack
+
+    inode = Inode(id=None, name="NODE.9", template=None, node_type="node")
+    for call in (
+        lambda: clsr_insert(cur, owner, ids[0], inode),
+        lambda: clsr_rename(cur, owner, ids[1], "NODE.1"),
+        lambda: clsr_copy_load(cur, owner, ids[0], [("a", None, "A.B", "node")]),
+    ):
+        with pytest.raises(expected_exception=InvalidNameError):
+            with cur.connection.transaction():
+                call()
+
+
+def test_copy_load_fail_autocommit():
+    "A failed load leaves no staged rows behind once the COPY is committed"
+    with connect(PoolConfig.from_env().conninfo, autocommit=True) as conn:
+        cur = conn.cursor()
+        with pytest.raises(expected_exception=Error):
+            clsr_copy_load(cur, uuid4(), uuid4(), [("a", None, "A", "node")])
+        cur.execute("SELECT count(*) FROM inode_stage;")
+        assert cur.fetchone() == (0,)
+
+
+def test_delete_node_fail_promoted_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+    "Children of a deleted node move up and can clash with its siblings"
+    cur, owner, ids = pack
+
+    clsr_insert(cur, owner, ids[1], nodes[2])
+
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        clsr_delete_node(cur, owner, ids[1])
+
+
+def test_rename_fail_same_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        clsr_rename(cur, owner, ids[1], "NODE2")
+
+
+def test_rename_fail_owner(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, _, ids = pack
+
+    with pytest.raises(expected_exception=Error):
+        clsr_rename(cur, owner2, ids[1], "NEWNAME")
+
+
+def test_select_bypath_fail_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, _ = pack
+
+    with pytest.raises(expected_exception=Error):
+        clsr_select_bypath(cur, owner, "NODE0", ["NODE1", "NODE6"])
+
+
+def test_select_bypath_fail_owner(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, _, _ = pack
+
+    with pytest.raises(expected_exception=Error):
+        clsr_select_bypath(cur, owner2, "NODE0", ["NODE1"])
+
+
+def test_move_fail_cycle(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=HierarchyError):
+        clsr_move(cur, owner, ids[1], ids[4])
+
+
+def test_move_fail_itself(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=HierarchyError):
+        clsr_move(cur, owner, ids[1], ids[1])
+
+
+def test_move_fail_same_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_insert(cur, owner, ids[2], nodes[3])
+
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        clsr_move(cur, owner, ids[3], ids[2])
+
+
+def test_move_fail_hierarchy(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    item = Inode(id=None, name="ITEM", template=None, node_type="item")
+    (item_id,) = clsr_insert(cur, owner, ids[2], item)
+
+    with pytest.raises(expected_exception=HierarchyError):
+        clsr_move(cur, owner, ids[3], item_id)
+
+
+def test_move_fail_owner(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, _, ids = pack
+
+    with pytest.raises(expected_exception=Error):
+        clsr_move(cur, owner2, ids[3], ids[2])
+
+
+def test_delete_many_fail_owner(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=Error):
+        clsr_delete_many(cur, owner2, [ids[3], ids[2]])
+
+
+def test_restore_fail_same_name(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_trash_descendants(cur, owner, ids[4])
+    clsr_insert(cur, owner, ids[1], nodes[4])
+
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        clsr_restore(cur, owner, ids[4])
+
+
+def test_restore_fail_parent_trashed(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_trash_descendants(cur, owner, ids[3])
+    clsr_trash_descendants(cur, owner, ids[1])
+
+    with pytest.raises(expected_exception=Error):
+        clsr_restore(cur, owner, ids[3])
+
+
+def test_restore_fail_not_trashed(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_trash_descendants(cur, owner, ids[1])
+
+    with pytest.raises(expected_exception=Error):
+        clsr_restore(cur, owner, ids[3])
+
+
+def test_trash_fail_insert(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_trash_descendants(cur, owner, ids[1])
+
+    with pytest.raises(expected_exception=Error):
+        clsr_insert(cur, owner, ids[3], nodes[2])
+
+
+def test_trash_fail_owner(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, _, ids = pack
+
+    with pytest.raises(expected_exception=Error):
+        clsr_trash_descendants(cur, owner2, ids[4])
+
+
+def test_iter_descendants_fail_owner(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, _, ids = pack
+
+    with pytest.raises(expected_exception=Error):
+        list(iter_descendants(cur, owner2, ids[1]))
+
+
+def test_select_subtree_json_fail_depth(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=ValueError):
+        clsr_select_subtree_json(cur, owner, ids[0], max_depth=-1)
+
+    # called in SQL, the function raises on its own
+    with pytest.raises(expected_exception=InvalidParameterValue):
+        cur.execute(
+            "SELECT select_subtree_nested_json(%s, %s, %s)", (ids[0], owner, -1)
+        )
+
+
+def test_select_subtree_json_fail_owner(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, _, ids = pack
+
+    with pytest.raises(expected_exception=Error):
+        clsr_select_subtree_json(cur, owner2, ids[1])
+
+
+def test_select_fail_trashed(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    def child_byname(cur: Cursor, owner: UUID, id: UUID):
+        cur.execute(
+            "SELECT * FROM select_child_byname(%s, %s, %s)", (id, owner, "NODE3")
+        )
+        return cur.fetchall()
+
+    selects = [
+        clsr_select_children,
+        clsr_select_children_wpath,
+        clsr_select_children_json,
+        clsr_select_descendants,
+        clsr_select_descendants_wpath,
+        clsr_select_descendants_json,
+        lambda cur, owner, id: clsr_select_children_page(cur, owner, id, limit=2),
+        lambda cur, owner, id: clsr_select_descendants_page(cur, owner, id, limit=2),
+        lambda cur, owner, id: list(iter_descendants(cur, owner, id)),
+        child_byname,
+    ]
+
+    # an empty result is no error for a leaf
+    for select in selects:
+        select(cur, owner, ids[3])
+    assert [row[1] for row in child_byname(cur, owner, ids[1])] == ["NODE3"]
+
+    clsr_trash_descendants(cur, owner, ids[1])
+    for select in selects + [clsr_select_subtree_json]:
+        with pytest.raises(expected_exception=Error):
+            with cur.connection.transaction():
+                select(cur, owner, ids[1])
+
+
+def test_select_page_fail_token(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with pytest.raises(expected_exception=ValueError):
+        clsr_select_children_page(cur, owner, ids[1], after="bm90IGEgdG9rZW4=", limit=2)
+
+    with pytest.raises(expected_exception=ValueError):
+        clsr_select_descendants_page(cur, owner, ids[1], after="???", limit=2)
+
+
+def test_batch_fail(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with batch(cur.connection) as b:
+        missing = b.select_byid(owner, uuid4())
+        foreign = b.select_children(owner2, ids[1])
+        after = b.get_path(owner, ids[1])
+
+    # the missing id is found out on the client, the foreign one on the server
+    with pytest.raises(expected_exception=IdNotFoundError):
+        missing.result()
+    with pytest.raises(expected_exception=IdNotFoundError):
+        foreign.result()
+    with pytest.raises(expected_exception=PipelineAborted):
+        after.result()
+    cur.connection.rollback()
+
+    ids = populate_tree(cur, nodes, owner)
+    with batch(cur.connection) as b:
+        first = b.insert(owner, ids[0], make_node(10))
+        duplicated = b.insert(owner, ids[0], make_node(1))
+        b.rename(owner, ids[2], "NAME2")
+
+    assert first.result() is not None
+    with pytest.raises(expected_exception=DuplicatedNameError):
+        duplicated.result()
+
+    # a missing id settles with an error, not with None
+    cur.connection.rollback()
+    with batch(cur.connection) as b:
+        path = b.get_path(owner, uuid4())
+        row = b.select_bypath(owner, "NODE0", ["NODE9"])
+    with pytest.raises(expected_exception=IdNotFoundError):
+        path.result()
+    with pytest.raises(expected_exception=IdNotFoundError):
+        row.result()
+
+
+def test_select_counts_fail(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_trash_descendants(cur, owner, ids[1])
+
+    for id in (ids[4], uuid4()):
+        with pytest.raises(expected_exception=IdNotFoundError):
+            clsr_select_counts(cur, owner, id)
+    with pytest.raises(expected_exception=IdNotFoundError):
+        clsr_select_counts(cur, owner2, ids[1])
+
+
 # len
 # owner nao existe -> raise --OKKKKKKKKK
 # owner existe mas nao tem nodes ->return 0 -- OKKKKKKK
@@ -73,7 +73,6 @@ def pack():  # request: pytest.FixtureRequest):
                 conn.rollback()  # Rollback if cleanup fails (optional)
             finally:
                 cur.close()  # Close cursor
-                conn.close()  # Close connection
 
 
 def test_len(pack: tuple[Cursor, UUID, Sequence[UUID]]):
@@ -115,7 +114,7 @@ def test_select_children_item(pack: tuple[Cursor, UUID, Sequence[UUID]]):
 
     rows = clsr_select_children_wpath(cur, owner, ids[1])
 
-    assert sorted([x[0][1] for x in rows]) == sorted(
+    assert sorted([x.name for x in rows]) == sorted(
         ["ITEM2", "ITEM3", "NODE3", "NODE4"]
     )
 
@@ -1,30 +1,65 @@
+import json
 from collections.abc import Sequence
 from copy import deepcopy
+from pathlib import Path
 from typing import Any
 from uuid import UUID
 
 import pytest
-from psycopg import Cursor
+from psycopg import Cursor, connect
 
+from closure import closure, queries
+from closure.cache import CacheStats, TreeCache
 from closure.closure import (
+    DescendantPathRow,
+    IdNotFoundError,
     Inode,
+    InodeRow,
+    InodeTree,
+    NodeCounts,
+    Page,
+    batch,
     clsr_delete_descendants,
+    clsr_delete_many,
     clsr_delete_node,
+    clsr_count_types,
     clsr_get_path,
+    clsr_get_paths,
     clsr_insert,
+    clsr_insert_many,
+    clsr_insert_subtree,
     clsr_len,
+    clsr_move,
+    clsr_purge,
+    clsr_recount,
+    clsr_rename,
+    clsr_restore,
     clsr_select_byid,
+    clsr_select_byids,
     clsr_select_bypath,
+    clsr_select_bypattern,
+    clsr_select_bypaths,
     clsr_select_children,
+    clsr_select_children_page,
     clsr_select_children_json,
     clsr_select_children_wpath,
+    clsr_select_counts,
     clsr_select_descendants,
+    clsr_select_descendants_page,
     clsr_select_descendants_json,
     clsr_select_descendants_wpath,
     clsr_select_root_byid,
     clsr_select_roots,
+    clsr_select_subtree_json,
+    clsr_trash_descendants,
+    iter_descendants,
+    iter_descendants_wpath,
+    pattern_to_regex,
+    to_inode,
 )
-from closure.db import bootstrap
+from closure.columnar import NODE_TYPES, NO_PARENT, clsr_export_subtree_columnar
+from closure.db import PoolConfig, bootstrap
+from closure.loader import StageRow, clsr_copy_load
 
 
 def populate_tree(cur: Cursor, nodes: Sequence[Inode], owner: UUID):
@@ -110,7 +145,6 @@ def pack():  # request: pytest.FixtureRequest):
                 conn.rollback()  # Rollback if cleanup fails (optional)
             finally:
                 cur.close()  # Close cursor
-                conn.close()  # Close connection
 
 
 def get_name(rows: list[Any], idx: int | str):
@@ -131,16 +165,16 @@ def test_root(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     cur, owner, ids = pack
 
     roots = clsr_select_roots(cur, owner)
-    assert get_name([x[0] for x in roots], 1) == sorted(["NODE0"])
+    assert get_name(roots, 1) == sorted(["NODE0"])
 
     root = clsr_select_root_byid(cur, owner, ids[0])
-    assert root[0][1] == "NODE0"  # type: ignore
+    assert root.name == "NODE0"  # type: ignore
 
     root2 = clsr_select_root_byid(cur, owner, ids[1])
-    assert root2[0][1] == "NODE0"  # type: ignore
+    assert root2.name == "NODE0"  # type: ignore
 
     root3 = clsr_select_root_byid(cur, owner, ids[18])
-    assert root3[0][1] == "NODE0"  # type: ignore
+    assert root3.name == "NODE0"  # type: ignore
 
 
 def test_select_byid(pack: tuple[Cursor, UUID, Sequence[UUID]]):
@@ -160,7 +194,7 @@ def test_select_child(pack: tuple[Cursor, UUID, Sequence[UUID]]):
 
     cur, owner, ids = pack
 
-    children = [i[0] for i in clsr_select_children(cur, owner, ids[0])]
+    children = clsr_select_children(cur, owner, ids[0])
     assert get_name(children, 1) == sorted(["NODE1", "NODE2"])
 
 
@@ -168,10 +202,10 @@ def test_select_descendants(pack: tuple[Cursor, UUID, Sequence[UUID]]):
 
     cur, owner, ids = pack
 
-    descendants = [i[0] for i in clsr_select_descendants(cur, owner, ids[0])]
+    descendants = clsr_select_descendants(cur, owner, ids[0])
     assert get_name(descendants, 2) == sorted([x.name for x in nodes[1:]])
 
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, ids[16])]
+    descendants2 = clsr_select_descendants(cur, owner, ids[16])
     assert get_name(descendants2, 2) == sorted(["NODE18", "NODE19"])
 
 
@@ -181,20 +215,20 @@ def test_delete_node(pack: tuple[Cursor, UUID, Sequence[UUID]]):
 
     tgt = ids[10]
 
-    children = [i[0] for i in clsr_select_children(cur, owner, tgt)]
+    children = clsr_select_children(cur, owner, tgt)
     assert get_name(children, 1) == sorted(["NODE16", "NODE17"])
 
-    descendants = [i[0] for i in clsr_select_descendants(cur, owner, tgt)]
+    descendants = clsr_select_descendants(cur, owner, tgt)
     assert get_name(descendants, 2) == sorted(["NODE16", "NODE17", "NODE18", "NODE19"])
-    # descendants = [i[0] for i in clsr_select_descendants_wpath(cur, owner, tgt)]
+    # descendants = clsr_select_descendants_wpath(cur, owner, tgt)
     # assert get_name(descendants, 2) == sorted(["NODE16", "NODE17", "NODE18", "NODE19"])
 
     nums = clsr_delete_node(cur, owner, ids[16])
     assert nums[0] == 1
 
-    children2 = [i[0] for i in clsr_select_children(cur, owner, tgt)]
+    children2 = clsr_select_children(cur, owner, tgt)
     assert get_name(children2, 1) == sorted(["NODE17", "NODE18", "NODE19"])
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, tgt)]
+    descendants2 = clsr_select_descendants(cur, owner, tgt)
     assert get_name(descendants2, 2) == sorted(["NODE17", "NODE18", "NODE19"])
 
 
@@ -204,10 +238,10 @@ def test_delete_node2(pack: tuple[Cursor, UUID, Sequence[UUID]]):
 
     tgt = ids[1]
 
-    children = [i[0] for i in clsr_select_children(cur, owner, tgt)]
+    children = clsr_select_children(cur, owner, tgt)
     assert get_name(children, 1) == sorted(["NODE3", "NODE4", "NODE5"])
 
-    descendants = [i[0] for i in clsr_select_descendants(cur, owner, tgt)]
+    descendants = clsr_select_descendants(cur, owner, tgt)
     desc = sorted(
         [
             "NODE3",
@@ -226,9 +260,9 @@ def test_delete_node2(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     nums = clsr_delete_node(cur, owner, ids[4])
     assert nums[0] == 1
 
-    children2 = [i[0] for i in clsr_select_children(cur, owner, tgt)]
+    children2 = clsr_select_children(cur, owner, tgt)
     assert get_name(children2, 1) == sorted(["NODE3", "NODE5", "NODE10", "NODE15"])
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, tgt)]
+    descendants2 = clsr_select_descendants(cur, owner, tgt)
     popped_desc = deepcopy(desc)
     popped_desc.remove("NODE4")
     assert get_name(descendants2, 2) == popped_desc
@@ -239,10 +273,10 @@ def test_delete_descendants(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     cur, owner, ids = pack
     tgt = ids[1]
 
-    children = [i[0] for i in clsr_select_children(cur, owner, tgt)]
+    children = clsr_select_children(cur, owner, tgt)
     assert get_name(children, 1) == sorted(["NODE3", "NODE4", "NODE5"])
 
-    descendants = [i[0] for i in clsr_select_descendants(cur, owner, tgt)]
+    descendants = clsr_select_descendants(cur, owner, tgt)
     desc = sorted(
         [
             "NODE3",
@@ -261,10 +295,10 @@ def test_delete_descendants(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     num = clsr_delete_descendants(cur, owner, ids[4])
     assert num[0] == 7
 
-    children2 = [i[0] for i in clsr_select_children(cur, owner, tgt)]
+    children2 = clsr_select_children(cur, owner, tgt)
     assert get_name(children2, 1) == sorted(["NODE3", "NODE5"])
 
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, tgt)]
+    descendants2 = clsr_select_descendants(cur, owner, tgt)
     assert get_name(descendants2, 2) == sorted(["NODE3", "NODE5"])
 
 
@@ -281,7 +315,7 @@ def test_delete_descendants2(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     (len_,) = clsr_len(cur, owner)
     assert len_ == 4
 
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, ids[0])]
+    descendants2 = clsr_select_descendants(cur, owner, ids[0])
     assert get_name(descendants2, 2) == sorted(["NODE1", "NODE3", "NODE5"])
 
 
@@ -301,24 +335,24 @@ def test_insert_second_tree(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     node4 = clsr_select_byid(cur, owner, ids2[4])
     assert (node4[1]) == "NAME4"  # type: ignore
 
-    children = [i[0] for i in clsr_select_children(cur, owner, ids[0])]
+    children = clsr_select_children(cur, owner, ids[0])
     assert get_name(children, 1) == sorted(["NODE1", "NODE2"])
 
-    descendants = [i[0] for i in clsr_select_descendants(cur, owner, ids[0])]
+    descendants = clsr_select_descendants(cur, owner, ids[0])
     assert get_name(descendants, 2) == sorted([x.name for x in nodes[1:]])
 
-    children2 = [i[0] for i in clsr_select_children(cur, owner, ids2[0])]
+    children2 = clsr_select_children(cur, owner, ids2[0])
     assert get_name(children2, 1) == sorted(["NAME1", "NAME2"])
 
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, ids2[0])]
+    descendants2 = clsr_select_descendants(cur, owner, ids2[0])
     assert get_name(descendants2, 2) == sorted([x.name for x in nodes2[1:]])
 
     tgt = ids[1]
 
-    children = [i[0] for i in clsr_select_children(cur, owner, tgt)]
+    children = clsr_select_children(cur, owner, tgt)
     assert get_name(children, 1) == sorted(["NODE3", "NODE4", "NODE5"])
 
-    descendants = [i[0] for i in clsr_select_descendants(cur, owner, tgt)]
+    descendants = clsr_select_descendants(cur, owner, tgt)
     desc = sorted(
         [
             "NODE3",
@@ -337,20 +371,20 @@ def test_insert_second_tree(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     nums = clsr_delete_node(cur, owner, ids[4])
     assert nums[0] == 1
 
-    children2 = [i[0] for i in clsr_select_children(cur, owner, tgt)]
+    children2 = clsr_select_children(cur, owner, tgt)
     assert get_name(children2, 1) == sorted(["NODE3", "NODE5", "NODE10", "NODE15"])
 
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, tgt)]
+    descendants2 = clsr_select_descendants(cur, owner, tgt)
     popped_desc = deepcopy(desc)
     popped_desc.remove("NODE4")
     assert get_name(descendants2, 2) == popped_desc
 
     tgt2 = ids2[1]
 
-    children2 = [i[0] for i in clsr_select_children(cur, owner, tgt2)]
+    children2 = clsr_select_children(cur, owner, tgt2)
     assert get_name(children2, 1) == sorted(["NAME3", "NAME4", "NAME5"])
 
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, tgt2)]
+    descendants2 = clsr_select_descendants(cur, owner, tgt2)
     desc2 = sorted(
         [
             "NAME3",
@@ -369,10 +403,10 @@ def test_insert_second_tree(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     nums2 = clsr_delete_node(cur, owner, ids2[4])
     assert nums2[0] == 1
 
-    children2 = [i[0] for i in clsr_select_children(cur, owner, tgt2)]
+    children2 = clsr_select_children(cur, owner, tgt2)
     assert get_name(children2, 1) == sorted(["NAME3", "NAME5", "NAME10", "NAME15"])
 
-    descendants2 = [i[0] for i in clsr_select_descendants(cur, owner, tgt2)]
+    descendants2 = clsr_select_descendants(cur, owner, tgt2)
     popped = deepcopy(desc2)
     popped.remove("NAME4")
     assert get_name(descendants2, 2) == popped
@@ -404,19 +438,19 @@ def test_insert_second_tree_roots(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     ids2 = populate_tree(cur, nodes2, owner)
 
     roots = clsr_select_roots(cur, owner)
-    assert get_name([x[0] for x in roots], 1) == sorted(["NODE0", "NAME0"])
+    assert get_name(roots, 1) == sorted(["NODE0", "NAME0"])
 
     root1 = clsr_select_root_byid(cur, owner, ids[0])
-    assert root1[0][1] == "NODE0"  # type: ignore
+    assert root1.name == "NODE0"  # type: ignore
 
     root2 = clsr_select_root_byid(cur, owner, ids[8])
-    assert root2[0][1] == "NODE0"  # type: ignore
+    assert root2.name == "NODE0"  # type: ignore
 
     root3 = clsr_select_root_byid(cur, owner, ids2[0])
-    assert root3[0][1] == "NAME0"  # type: ignore
+    assert root3.name == "NAME0"  # type: ignore
 
     root4 = clsr_select_root_byid(cur, owner, ids2[8])
-    assert root4[0][1] == "NAME0"  # type: ignore
+    assert root4.name == "NAME0"  # type: ignore
 
 
 def test_get_path(pack: tuple[Cursor, UUID, Sequence[UUID]]):
@@ -457,7 +491,7 @@ def test_children_w_path(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     cur, owner, ids = pack
 
     rows = clsr_select_children_wpath(cur, owner, ids[2])
-    assert get_name([x[0] for x in rows], 1) == make_list_(6, 10)
+    assert get_name(rows, 1) == make_list_(6, 10)
 
 
 def test_descendants_w_path(pack: tuple[Cursor, UUID, Sequence[UUID]]):
@@ -467,7 +501,7 @@ def test_descendants_w_path(pack: tuple[Cursor, UUID, Sequence[UUID]]):
     rows = clsr_select_descendants_wpath(cur, owner, ids[2])
 
     tgts = make_list_(11, 15) + make_list_(6, 10)
-    assert get_name([x[0] for x in rows], 2) == tgts
+    assert get_name(rows, 2) == tgts
 
 
 def test_select_by_path(pack: tuple[Cursor, UUID, Sequence[UUID]]):
@@ -479,19 +513,19 @@ def test_select_by_path(pack: tuple[Cursor, UUID, Sequence[UUID]]):
         "NODE1",
     ]
 
-    (row,) = clsr_select_bypath(cur, owner, root, names)
+    row = clsr_select_bypath(cur, owner, root, names)
     assert row[1] == "NODE1"
 
     names.append("NODE4")
-    (row,) = clsr_select_bypath(cur, owner, root, names)
+    row = clsr_select_bypath(cur, owner, root, names)
     assert row[1] == "NODE4"
 
     names.append("NODE10")
-    (row,) = clsr_select_bypath(cur, owner, root, names)
+    row = clsr_select_bypath(cur, owner, root, names)
     assert row[1] == "NODE10"
 
     names.append("NODE16")
-    (row,) = clsr_select_bypath(cur, owner, root, names)
+    row = clsr_select_bypath(cur, owner, root, names)
     assert row[1] == "NODE16"
 
 
@@ -521,3 +555,758 @@ def test_(pack: tuple[Cursor, UUID, Sequence[UUID]]):
 
     rows = clsr_select_descendants_wpath(cur, owner, ids[0])
     assert len(rows) == 17
+
+
+def test_insert_many(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    batch = [make_node(i, "NAME") for i in range(4)]
+    new_ids = clsr_insert_many(cur, owner, ids[19], batch, [None, 0, 0, 1])
+    assert len(new_ids) == 4
+
+    (len_,) = clsr_len(cur, owner)
+    assert len_ == n + 4
+
+    children = clsr_select_children(cur, owner, new_ids[0])
+    assert get_name(children, 1) == sorted(["NAME1", "NAME2"])
+
+    (path,) = clsr_get_path(cur, owner, new_ids[3])
+    assert path == "NODE0.NODE1.NODE4.NODE10.NODE16.NODE19.NAME0.NAME1.NAME3"
+
+    root = clsr_select_root_byid(cur, owner, new_ids[3])
+    assert root.name == "NODE0"  # type: ignore
+
+
+def test_insert_subtree(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, _ = pack
+
+    item = Inode(id=None, name="ITEM", template=None, node_type="item")
+    tree: InodeTree = (
+        make_node(0, "NAME"),
+        [(make_node(1, "NAME"), [(item, [])]), (make_node(2, "NAME"), [])],
+    )
+    new_ids = clsr_insert_subtree(cur, owner, None, [tree])
+
+    roots = clsr_select_roots(cur, owner)
+    assert get_name(roots, 1) == sorted(["NODE0", "NAME0"])
+
+    descendants = clsr_select_descendants(cur, owner, new_ids[0])
+    assert get_name(descendants, 2) == sorted(["NAME1", "NAME2", "ITEM"])
+
+    (path,) = clsr_get_path(cur, owner, new_ids[2])
+    assert path == "NAME0.NAME1.ITEM"
+
+
+def test_copy_load(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    rows: list[StageRow] = [
+        ("a", None, "NAME0", "node"),
+        ("b", "a", "NAME1", "node"),
+        ("c", "b", "NAME2", "node"),
+        ("d", "b", "ITEM", "item"),
+        ("e", None, "NAME3", "node"),
+    ]
+    report = clsr_copy_load(cur, owner, ids[16], rows)
+    assert report.nodes == 5
+    # self links + 5 rows under NODE16 (depth 5) + in-load ancestors
+    assert report.links == 5 + 5 * 5 + 5
+    assert report.rows_per_sec > 0
+
+    (len_,) = clsr_len(cur, owner)
+    assert len_ == n + 5
+
+    children = clsr_select_children(cur, owner, ids[16])
+    assert get_name(children, 1) == sorted(["NODE18", "NODE19", "NAME0", "NAME3"])
+
+    descendants = clsr_select_descendants(cur, owner, ids[10])
+    assert len(descendants) == 4 + 5
+
+    rows2: list[StageRow] = [
+        ("root", None, "NAME0", "node"),
+        ("leaf", "root", "NAME1", "node"),
+    ]
+    report2 = clsr_copy_load(cur, owner, None, rows2)
+    assert report2.nodes == 2
+
+    roots = clsr_select_roots(cur, owner)
+    assert get_name(roots, 1) == sorted(["NODE0", "NAME0"])
+
+
+def test_root_after_delete(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_delete_node(cur, owner, ids[0])
+
+    roots = clsr_select_roots(cur, owner)
+    assert get_name(roots, 1) == sorted(["NODE1", "NODE2"])
+
+    root = clsr_select_root_byid(cur, owner, ids[18])
+    assert root.name == "NODE1"  # type: ignore
+
+    root2 = clsr_select_root_byid(cur, owner, ids[2])
+    assert root2.name == "NODE2"  # type: ignore
+
+    row = clsr_select_bypath(cur, owner, "NODE1", ["NODE4", "NODE10"])
+    assert row[1] == "NODE10"
+
+
+def test_rename(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    (num,) = clsr_rename(cur, owner, ids[4], "NAME4")
+    assert num == 7
+
+    (path,) = clsr_get_path(cur, owner, ids[18])
+    assert path == "NODE0.NODE1.NAME4.NODE10.NODE16.NODE18"
+
+    rows = clsr_select_children_wpath(cur, owner, ids[1])
+    assert sorted([x.path for x in rows]) == sorted(
+        ["NODE0.NODE1.NODE3", "NODE0.NODE1.NAME4", "NODE0.NODE1.NODE5"]
+    )
+
+    clsr_delete_node(cur, owner, ids[10])
+    (path,) = clsr_get_path(cur, owner, ids[18])
+    assert path == "NODE0.NODE1.NAME4.NODE16.NODE18"
+
+    clsr_rename(cur, owner, ids[0], "ROOT")
+    descendants = clsr_select_descendants_wpath(cur, owner, ids[4])
+    assert sorted([x.path for x in descendants])[0] == "ROOT.NODE1.NAME4.NODE15"
+
+
+def test_select_by_paths(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    paths = ["NODE0.NODE2.NODE8.NODE13", "NODE0", "NODE0.NODE3", "NODE0.NODE1.NODE4"]
+    found = clsr_select_bypaths(cur, owner, paths)
+
+    assert list(found) == paths
+    assert found[paths[0]] == ids[13]
+    assert found[paths[1]] == ids[0]
+    assert isinstance(found[paths[2]], IdNotFoundError)
+    assert found[paths[3]] == ids[4]
+
+
+def test_pattern_to_regex():
+
+    assert pattern_to_regex("plant.*.PT1??") == (
+        "plant",
+        r"^plant\.[^.]*\.PT1[^.][^.]$",
+        2,
+        2,
+    )
+    assert pattern_to_regex("area1.**.flow") == (
+        "area1",
+        r"^area1(\.[^.]+)*\.flow$",
+        1,
+        None,
+    )
+    assert pattern_to_regex("**.flow") == ("", r"^([^.]+\.)*flow$", 0, None)
+
+
+def test_select_by_pattern(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, _ = pack
+
+    def names(pattern: str, batch_size: int = 1000):
+        rows = clsr_select_bypattern(cur, owner, pattern, batch_size)
+        return sorted(row[1] for row in rows)
+
+    assert names("NODE0.*.NODE4") == ["NODE4"]
+    assert names("NODE0.*.NODE?") == make_list_(3, 10)
+    assert names("NODE0.**.NODE1?") == make_list_(10, 20)
+    assert names("**.NODE1?", batch_size=3) == make_list_(10, 20)
+    assert names("NODE0.NODE1.NODE4.**") == sorted(
+        ["NODE4", "NODE10", "NODE15", "NODE16", "NODE17", "NODE18", "NODE19"]
+    )
+    assert names("*") == ["NODE0"]
+    assert names("NODE0.NODE2.NODE8.NODE14") == ["NODE14"]
+    assert names("NODE0.*.NODE0") == []
+
+    paths = [row[2] for row in clsr_select_bypattern(cur, owner, "NODE0.**")]
+    assert paths == sorted(paths) and len(paths) == n
+
+
+def test_select_by_pattern_inlined(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+    "select_bypattern is planned into the calling query, no function scan to buffer"
+    cur, owner, _ = pack
+
+    cur.execute(
+        "EXPLAIN " + queries.SELECT_BYPATTERN,
+        (owner, "", r"^([^.]+\.)*NODE15$", 0, None),
+    )
+    plan = "\n".join(row[0] for row in cur.fetchall())
+    assert "Function Scan" not in plan
+
+
+def test_select_by_pattern_trgm(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if cur.fetchone() is None:
+        pytest.skip("pg_trgm is not installed, closure_trgm.sql is optional")
+
+    # the index goes with the savepoint, the other tests run without it
+    with cur.connection.transaction(force_rollback=True):
+        sql = Path(closure.__file__).parent / "sql/closure_trgm.sql"
+        cur.execute(sql.read_text())
+        cur.execute("SET LOCAL enable_seqscan = off; SET LOCAL enable_indexscan = off;")
+        cur.execute(
+            "EXPLAIN " + queries.SELECT_BYPATTERN,
+            (owner, "", r"^([^.]+\.)*NODE15$", 0, None),
+        )
+        plan = "\n".join(row[0] for row in cur.fetchall())
+        assert "idx_inode_path_trgm" in plan
+
+        rows = list(clsr_select_bypattern(cur, owner, "**.NODE15"))
+        assert [row.id for row in rows] == [ids[15]]
+
+
+def test_move(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    (num,) = clsr_move(cur, owner, ids[4], ids[6])
+    assert num == 7
+
+    children = clsr_select_children(cur, owner, ids[1])
+    assert get_name(children, 1) == sorted(["NODE3", "NODE5"])
+
+    descendants = clsr_select_descendants(cur, owner, ids[2])
+    assert len(descendants) == 8 + 7
+
+    (path,) = clsr_get_path(cur, owner, ids[18])
+    assert path == "NODE0.NODE2.NODE6.NODE4.NODE10.NODE16.NODE18"
+
+    (num,) = clsr_move(cur, owner, ids[10], None)
+    assert num == 5
+
+    roots = clsr_select_roots(cur, owner)
+    assert get_name(roots, 1) == sorted(["NODE0", "NODE10"])
+
+    root = clsr_select_root_byid(cur, owner, ids[19])
+    assert root.name == "NODE10"  # type: ignore
+
+    descendants = clsr_select_descendants(cur, owner, ids[0])
+    assert len(descendants) == n - 1 - 5
+
+    row = clsr_select_bypath(cur, owner, "NODE10", ["NODE16", "NODE19"])
+    assert row[1] == "NODE19"
+
+
+def test_delete_many(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    counts = clsr_delete_many(cur, owner, [ids[1], ids[10], ids[7], ids[10]])
+    assert counts == {ids[1]: 5, ids[10]: 5, ids[7]: 1}
+
+    (num,) = clsr_len(cur, owner)
+    assert num == n - 11
+
+    descendants = clsr_select_descendants(cur, owner, ids[0])
+    assert get_name(descendants, 2) == sorted(
+        ["NODE2", "NODE6", "NODE8", "NODE9", "NODE11", "NODE12", "NODE13", "NODE14"]
+    )
+
+    assert clsr_delete_many(cur, owner, []) == {}
+
+
+def test_trash_restore(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    (num,) = clsr_trash_descendants(cur, owner, ids[4])
+    assert num == 7
+
+    (len_,) = clsr_len(cur, owner)
+    assert len_ == n - 7
+
+    descendants = clsr_select_descendants(cur, owner, ids[1])
+    assert get_name(descendants, 2) == sorted(["NODE3", "NODE5"])
+
+    with pytest.raises(expected_exception=IdNotFoundError):
+        clsr_select_byid(cur, owner, ids[10])
+    assert clsr_get_path(cur, owner, ids[10]) is None
+
+    (num,) = clsr_restore(cur, owner, ids[4])
+    assert num == 7
+
+    descendants = clsr_select_descendants(cur, owner, ids[1])
+    assert len(descendants) == 9
+
+    (path,) = clsr_get_path(cur, owner, ids[19])
+    assert path == "NODE0.NODE1.NODE4.NODE10.NODE16.NODE19"
+
+
+def test_trash_nested(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    (num,) = clsr_trash_descendants(cur, owner, ids[10])
+    assert num == 5
+    (num,) = clsr_trash_descendants(cur, owner, ids[1])
+    assert num == 5
+
+    # only the rows trashed with ids[1] come back
+    (num,) = clsr_restore(cur, owner, ids[1])
+    assert num == 5
+    (len_,) = clsr_len(cur, owner)
+    assert len_ == n - 5
+
+    (num,) = clsr_restore(cur, owner, ids[10])
+    assert num == 5
+    (len_,) = clsr_len(cur, owner)
+    assert len_ == n
+
+
+def test_trash_name_reuse(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_trash_descendants(cur, owner, ids[4])
+
+    (id4,) = clsr_insert(cur, owner, ids[1], nodes[4])
+    (num,) = clsr_move(cur, owner, id4, ids[2])
+    assert num == 1
+
+    (num,) = clsr_restore(cur, owner, ids[4])
+    assert num == 7
+
+
+def test_purge(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    clsr_trash_descendants(cur, owner, ids[2])
+    clsr_trash_descendants(cur, owner, ids[10])
+
+    assert clsr_purge(cur.connection, chunk=2) == 9 + 5
+
+    (len_,) = clsr_len(cur, owner)
+    assert len_ == n - 9 - 5
+
+    cur.execute("SELECT count(*) FROM inode WHERE owner = %s;", (owner,))
+    assert cur.fetchone() == (n - 9 - 5,)
+
+
+def test_iter_descendants(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    rows = list(iter_descendants(cur, owner, ids[1], batch_size=3))
+    assert get_name(rows, 2) == sorted(
+        [f"NODE{i}" for i in (3, 4, 5, 10, 15)] + [f"NODE{i}" for i in (16, 17, 18, 19)]
+    )
+    depths = {row[1]: i for i, row in enumerate(rows)}
+    for parent, id, *_ in rows:
+        assert parent == ids[1] or depths[parent] < depths[id]
+
+    rows = list(iter_descendants_wpath(cur, owner, ids[0], order="path", batch_size=4))
+    assert len(rows) == n - 1
+    paths = [row[3] for row in rows]
+    assert paths == sorted(paths)
+    assert paths[0] == "NODE0.NODE1"
+
+    clsr_trash_descendants(cur, owner, ids[2])
+    rows = list(iter_descendants_wpath(cur, owner, ids[0], order="path"))
+    assert len(rows) == n - 1 - 9
+
+
+def test_rows(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    node = clsr_select_byid(cur, owner, ids[4])
+    assert isinstance(node, InodeRow)
+    assert node.id == ids[4] and node.name == "NODE4" and node.node_type == "node"
+    assert to_inode(node) == Inode(
+        id=ids[4], name="NODE4", template=None, node_type="node"
+    )
+
+    rows = clsr_select_descendants_wpath(cur, owner, ids[10])
+    assert all(isinstance(row, DescendantPathRow) for row in rows)
+    assert sorted(row.path for row in rows)[0] == "NODE0.NODE1.NODE4.NODE10.NODE16"
+
+    # the cursor keeps its own row factory
+    cur.execute("SELECT 1, 2;")
+    assert cur.fetchone() == (1, 2)
+
+
+def test_export_columnar(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    np = pytest.importorskip("numpy")
+
+    cur, owner, ids = pack
+
+    cols = clsr_export_subtree_columnar(cur, owner, ids[4])
+    assert cols.id.dtype == np.dtype("V16")
+    assert [UUID(bytes=x.tobytes()) for x in cols.id[:2]] == [ids[4], ids[10]]
+    assert UUID(bytes=cols.parent[0].tobytes()) == ids[1]
+    assert cols.depth.tolist() == [2, 3, 4, 5, 5, 4, 3]
+    assert [x.decode() for x in cols.name] == [
+        "NODE4",
+        "NODE10",
+        "NODE16",
+        "NODE18",
+        "NODE19",
+        "NODE17",
+        "NODE15",
+    ]
+    assert {NODE_TYPES[x] for x in cols.node_type} == {"node"}
+
+    cols = clsr_export_subtree_columnar(cur, owner, ids[10], name_bytes=5)
+    assert cols.name.tolist() == [b"NODE1", b"NODE1", b"NODE1", b"NODE1", b"NODE1"]
+
+    # names are padded by their UTF8 length, not their length in characters
+    clsr_rename(cur, owner, ids[15], "NÓ15")
+    cols = clsr_export_subtree_columnar(cur, owner, ids[15], name_bytes=8)
+    assert cols.name.tolist() == ["NÓ15".encode()]
+    assert cols.name.dtype == np.dtype("S8")
+
+    clsr_trash_descendants(cur, owner, ids[2])
+    cols = clsr_export_subtree_columnar(cur, owner)
+    assert len(cols.id) == n - 9
+    assert UUID(bytes=cols.parent[0].tobytes()) == NO_PARENT
+
+
+def test_select_subtree_json(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    def names(tree: dict[str, Any]) -> list[Any]:
+        if "children" not in tree:
+            return [tree["name"]]
+        return [tree["name"], [names(x) for x in tree["children"]]]
+
+    (tree,) = clsr_select_subtree_json(cur, owner, ids[4])
+    assert tree["id"] == str(ids[4])
+    assert names(tree) == [
+        "NODE4",
+        [
+            ["NODE10", [["NODE16", [["NODE18", []], ["NODE19", []]]], ["NODE17", []]]],
+            ["NODE15", []],
+        ],
+    ]
+
+    # the cutoff level has no children key, to be expanded later
+    (tree,) = clsr_select_subtree_json(cur, owner, ids[1], max_depth=1)
+    assert names(tree) == ["NODE1", [["NODE3"], ["NODE4"], ["NODE5"]]]
+
+    (tree,) = clsr_select_subtree_json(cur, owner, ids[1], max_depth=0)
+    assert names(tree) == ["NODE1"]
+
+    item = Inode(id=None, name="ITEM", template=None, node_type="item")
+    (item_id,) = clsr_insert(cur, owner, ids[17], item)
+    cur.execute(
+        "INSERT INTO item (data_type, data_source, owner)"
+        " VALUES ('float32', 'datapoint', %s);",
+        (item_id,),
+    )
+
+    (tree,) = clsr_select_subtree_json(cur, owner, ids[17])
+    assert "item" not in tree["children"][0]
+
+    (tree,) = clsr_select_subtree_json(cur, owner, ids[17], with_items=True)
+    assert tree["children"][0]["item"] == {
+        "data_type": "float32",
+        "data_source": "datapoint",
+        "config_str": None,
+    }
+    assert "item" not in tree
+
+
+def test_select_pages(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    page = clsr_select_children_page(cur, owner, ids[2], limit=3)
+    assert isinstance(page, Page)
+    assert [row.name for row in page.rows] == ["NODE6", "NODE7", "NODE8"]
+    page = clsr_select_children_page(cur, owner, ids[2], after=page.after, limit=3)
+    assert [row.name for row in page.rows] == ["NODE9"]
+    assert page.after is None
+
+    rows: list[Any] = []
+    after = None
+    while True:
+        page = clsr_select_descendants_page(cur, owner, ids[0], after=after, limit=4)
+        rows += page.rows
+        if page.after is None:
+            break
+        after = page.after
+
+    assert len(rows) == n - 1
+    assert [row.name for row in rows[:2]] == ["NODE1", "NODE2"]
+    assert [row.name for row in rows[-2:]] == ["NODE18", "NODE19"]
+    paths = {
+        row.id: row.path for row in clsr_select_descendants_wpath(cur, owner, ids[0])
+    }
+    assert [paths[row.id].count(".") for row in rows] == sorted(
+        paths[row.id].count(".") for row in rows
+    )
+
+    # a full last page still hands out a token, the page after it is empty
+    page = clsr_select_descendants_page(cur, owner, ids[10], limit=4)
+    assert [row.name for row in page.rows] == ["NODE16", "NODE17", "NODE18", "NODE19"]
+    page = clsr_select_descendants_page(cur, owner, ids[10], after=page.after, limit=4)
+    assert page == Page(rows=[], after=None)
+
+
+def test_tree_cache(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+    cur.connection.commit()
+
+    now = [0.0]
+    cache = TreeCache(maxsize=3, ttl=10, clock=lambda: now[0])
+
+    # LISTEN needs a connection of its own, not one shared through the pool
+    with connect(PoolConfig.from_env().conninfo, autocommit=True) as listener:
+        cache.listen(listener)
+
+        assert cache.select_byid(cur, owner, ids[4]).name == "NODE4"
+        assert cache.select_byid(cur, owner, ids[4]).name == "NODE4"
+        assert cache.get_path(cur, owner, ids[10]) == ("NODE0.NODE1.NODE4.NODE10",)
+        row = cache.select_bypath(cur, owner, "NODE0", ["NODE1", "NODE4", "NODE10"])
+        assert row.id == ids[10]
+        assert cache.stats() == CacheStats(
+            hits=1, misses=3, evictions=0, invalidations=0, size=3
+        )
+
+        # renaming NODE4 rewrites the paths below it, all three entries go
+        clsr_rename(cur, owner, ids[4], "NAME4")
+        cur.connection.commit()
+        cache.watch(listener, timeout=5, stop_after=2)
+        assert cache.stats().size == 0
+        assert cache.stats().invalidations == 3
+        assert cache.select_byid(cur, owner, ids[4]).name == "NAME4"
+        assert cache.get_path(cur, owner, ids[10]) == ("NODE0.NODE1.NAME4.NODE10",)
+
+        # past maxsize the least recently used goes, past ttl all of them
+        cache.select_byid(cur, owner, ids[5])
+        cache.select_byid(cur, owner, ids[6])
+        assert cache.stats().evictions == 1
+        assert cache.get_path(cur, owner, ids[10]) is not None
+        assert cache.stats().hits == 2
+        now[0] = 10
+        cache.select_byid(cur, owner, ids[6])
+        assert cache.stats().hits == 2
+
+        # past what a payload holds only the owner is sent
+        cache.handle(json.dumps({"owner": str(owner)}))
+        assert cache.stats().size == 0
+
+
+def test_tree_cache_stale_read():
+    "What was read before an invalidation handled meanwhile is not cached"
+    cache = TreeCache()
+    owner, id = UUID(int=1), UUID(int=2)
+    key = ("byid", owner, id)
+
+    generation = cache.generation(owner)
+    cache.handle(json.dumps({"owner": str(owner), "ids": [str(id)]}))
+    cache.put(key, owner, id, "stale", generation)
+    assert cache.get(key) is None
+
+    generation = cache.generation(owner)
+    cache.clear()
+    cache.put(key, owner, id, "stale", generation)
+    assert cache.get(key) is None
+
+    cache.put(key, owner, id, "fresh", cache.generation(owner))
+    assert cache.get(key) == "fresh"
+
+
+def test_tree_cache_bypath(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+    "A node inserted or restored at a cached path comes before the item there"
+    cur, owner, ids = pack
+    item = Inode(id=None, name="X", template=None, node_type="item")
+    (item_id,) = clsr_insert(cur, owner, ids[0], item)
+    cur.connection.commit()
+
+    cache = TreeCache()
+    with connect(PoolConfig.from_env().conninfo, autocommit=True) as listener:
+        cache.listen(listener)
+
+        assert cache.select_bypath(cur, owner, "NODE0", ["X"]).id == item_id
+        (node_id,) = clsr_insert(
+            cur, owner, ids[0], item.model_copy(update={"node_type": "node"})
+        )
+        cur.connection.commit()
+        cache.watch(listener, timeout=5, stop_after=1)
+        assert cache.select_bypath(cur, owner, "NODE0", ["X"]).id == node_id
+
+        clsr_trash_descendants(cur, owner, node_id)
+        cur.connection.commit()
+        cache.watch(listener, timeout=1)
+        assert cache.select_bypath(cur, owner, "NODE0", ["X"]).id == item_id
+        clsr_restore(cur, owner, node_id)
+        cur.connection.commit()
+        cache.watch(listener, timeout=1)
+        assert cache.select_bypath(cur, owner, "NODE0", ["X"]).id == node_id
+
+
+def test_batch(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    with batch(cur.connection) as b:
+        rows = [b.select_byid(owner, id) for id in ids]
+        path = b.get_path(owner, ids[10])
+        inserted = b.insert(owner, ids[3], make_node(0, "NEW"))
+        children = b.select_children(owner, ids[3])
+
+    assert [row.result().name for row in rows] == [f"NODE{i}" for i in range(n)]
+    assert path.result() == ("NODE0.NODE1.NODE4.NODE10",)
+    # calls run in order, the insert is seen by the listing after it
+    assert [row.name for row in children.result()] == ["NEW0"]
+    assert children.result()[0].id == inserted.result()[0]
+
+    with batch(cur.connection) as b:
+        renamed = b.rename(owner, ids[4], "NAME4")
+        b.flush()
+        assert renamed.done()
+        path = b.get_path(owner, ids[10])
+        assert not path.done()
+
+    assert path.result() == ("NODE0.NODE1.NAME4.NODE10",)
+
+
+def test_select_byids(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    missing = UUID(int=1)
+    (other,) = clsr_insert(
+        cur, UUID("9a0cd152-259a-4852-8eaf-da8c7af032d6"), None, make_node(0)
+    )
+    clsr_trash_descendants(cur, owner, ids[19])
+
+    rows = clsr_select_byids(cur, owner, [ids[4], missing, ids[10], other, ids[19]])
+    assert list(rows) == [ids[4], missing, ids[10], other, ids[19]]
+    assert rows[ids[4]] == InodeRow(ids[4], "NODE4", None, "node")
+    assert rows[ids[10]].name == "NODE10"  # type: ignore
+    for id in (missing, other, ids[19]):
+        assert isinstance(rows[id], IdNotFoundError)
+
+    paths = clsr_get_paths(cur, owner, [*ids[:3], other])
+    assert paths == {
+        ids[0]: "NODE0",
+        ids[1]: "NODE0.NODE1",
+        ids[2]: "NODE0.NODE2",
+        other: paths[other],
+    }
+    assert isinstance(paths[other], IdNotFoundError)
+    assert clsr_get_paths(cur, owner, []) == {}
+
+
+def test_inlined_selects(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    def plan(query: str, params: Sequence[Any]) -> str:
+        cur.execute("EXPLAIN (COSTS OFF) " + query, params)
+        return "\n".join(row[0] for row in cur.fetchall())
+
+    # the table is tiny, the planner would rather read it whole
+    cur.execute("SET LOCAL enable_seqscan = off")
+
+    inlined = [
+        ("SELECT * FROM select_roots(%s)", (owner,)),
+        ("SELECT * FROM select_byid(%s, %s)", (ids[4], owner)),
+        ("SELECT * FROM select_byids(%s, %s)", ([ids[4]], owner)),
+        ("SELECT * FROM select_root_byid(%s, %s)", (ids[4], owner)),
+        ("SELECT * FROM select_bypaths(%s, %s)", (owner, ["NODE0"])),
+        ("SELECT * FROM descendant_rows(%s, %s) ORDER BY depth", (ids[1], owner)),
+    ]
+    for query, params in inlined:
+        function = query.split("FROM ")[1].split("(")[0]
+        text = plan(query, params)
+        assert f"Function Scan on {function}" not in text and "inode" in text, text
+
+    # filters and limits of the caller reach the index scan
+    text = plan(
+        "SELECT id FROM child_rows(%s, %s) WHERE name = %s LIMIT 1",
+        (ids[1], owner, "NODE4"),
+    )
+    assert "Function Scan on child_rows" not in text
+    assert any(
+        "Index Cond" in line and "NODE4" in line for line in text.splitlines()
+    ), text
+
+    cur.execute(
+        "SELECT id FROM child_rows(%s, %s) WHERE name = %s", (ids[1], owner, "NODE4")
+    )
+    assert cur.fetchall() == [(ids[4],)]
+
+    # plpgsql stays opaque, it is there for the ownership errors
+    assert "Function Scan on select_child" in plan(
+        "SELECT * FROM select_child(%s, %s)", (ids[0], owner)
+    )
+
+
+def test_counts(pack: tuple[Cursor, UUID, Sequence[UUID]]):
+
+    cur, owner, ids = pack
+
+    def counts(i: int) -> tuple[int, int]:
+        return clsr_select_counts(cur, owner, ids[i])
+
+    assert counts(0) == NodeCounts(descendants=n - 1, items=0)
+    assert counts(4) == (6, 0)
+    assert counts(19) == (0, 0)
+    assert clsr_count_types(cur, owner) == {"node": n}
+
+    item = Inode(id=None, name="ITEM", template=None, node_type="item")
+    clsr_insert(cur, owner, ids[4], item)
+    assert counts(4) == (7, 1)
+    assert counts(0) == (n, 1)
+    assert clsr_count_types(cur, owner) == {"node": n, "item": 1}
+
+    clsr_move(cur, owner, ids[4], ids[2])
+    assert counts(1) == (2, 0)
+    assert counts(2) == (16, 1)
+    assert counts(0) == (n, 1)
+
+    clsr_trash_descendants(cur, owner, ids[10])
+    assert counts(4) == (2, 1)
+    assert counts(2) == (11, 1)
+    clsr_restore(cur, owner, ids[10])
+    assert counts(4) == (7, 1)
+
+    # the children of ids[10] stay below ids[4]
+    clsr_delete_node(cur, owner, ids[10])
+    assert counts(4) == (6, 1)
+    clsr_delete_many(cur, owner, [ids[16], ids[4]])
+    assert counts(2) == (8, 0)
+    assert clsr_count_types(cur, owner) == {"node": n - 7}
+
+    clsr_insert_subtree(cur, owner, ids[3], [(make_node(1, "NEW"), [])])
+    clsr_copy_load(
+        cur, owner, ids[3], [("a", None, "A", "node"), ("b", "a", "B", "item")]
+    )
+    assert counts(3) == (3, 1)
+    assert counts(1) == (5, 1)
+
+    # the rows of a nested trash stay out when the outer one is restored
+    clsr_trash_descendants(cur, owner, ids[6])
+    clsr_trash_descendants(cur, owner, ids[2])
+    clsr_restore(cur, owner, ids[2])
+    assert counts(2) == (6, 0)
+    assert clsr_purge(cur.connection, chunk=1) == 2
+    assert counts(0) == (13, 1)
+
+    assert clsr_recount(cur, owner) == 0
+    cur.execute("UPDATE node_counts SET descendants = 0")
+    cur.execute("DELETE FROM owner_counts")
+    assert clsr_recount(cur, owner) > 0
+    assert counts(0) == (13, 1)
+    assert clsr_len(cur, owner) == (14,)
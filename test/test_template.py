@@ -39,7 +39,6 @@ def pack_template():  # request: pytest.FixtureRequest):
             conn.rollback()  # Rollback if cleanup fails (optional)
         finally:
             cur.close()  # Close cursor
-            conn.close()  # Close connection
 
 
 def test_insert_template(pack_template: tuple[Cursor, UUID]):